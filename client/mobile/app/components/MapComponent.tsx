@@ -14,6 +14,7 @@ import { useMapStore } from "../store/useMapStore";
 import { themeColors } from "../styles/colors";
 import { GeoJSONFeature } from "../types/geoJSON";
 import { MapComponentProps } from "../types/map";
+import { fetchNearestNode } from "../utils/api";
 import { darkMapStyle } from "../utils/mapStyles";
 import ObstacleDetailsPanel from "./obstacles/ObstacleDetailsModal";
 import ObstacleForm from "./obstacles/ObstacleForm";
@@ -21,7 +22,6 @@ import ObstacleMapMarker from "./obstacles/ObstacleMapMarker";
 
 const MapComponent: React.FC<MapComponentProps> = ({
   toggleObstacle,
-  nodes,
   userLocation,
   mapRegion,
   setMapRegion,
@@ -64,31 +64,6 @@ const MapComponent: React.FC<MapComponentProps> = ({
     }
   }, [selectedObstacleCoord]);
 
-  const findNearestNode = (
-    latitude: number,
-    longitude: number
-  ): GeoJSONFeature | null => {
-    if (!nodes.length) return null;
-
-    let nearestNode = nodes[0];
-    let minDist = Math.hypot(
-      nearestNode.geometry.coordinates[1] - latitude,
-      nearestNode.geometry.coordinates[0] - longitude
-    );
-
-    nodes.forEach((node) => {
-      const dist = Math.hypot(
-        node.geometry.coordinates[1] - latitude,
-        node.geometry.coordinates[0] - longitude
-      );
-      if (dist < minDist) {
-        nearestNode = node;
-        minDist = dist;
-      }
-    });
-    return nearestNode;
-  };
-
   useEffect(() => {
     if (userLocation && mapRef.current) {
       // Animate map to the current user location
@@ -184,9 +159,9 @@ const MapComponent: React.FC<MapComponentProps> = ({
         style={{ flex: 1 }}
         initialRegion={mapRegion} // Dynamically controlled by the state
         onRegionChangeComplete={(newRegion) => setMapRegion(newRegion)} // Update the region when the user manually changes it
-        onPress={(event: MapPressEvent) => {
+        onPress={async (event: MapPressEvent) => {
           const { latitude, longitude } = event.nativeEvent.coordinate;
-          const closestNode = findNearestNode(latitude, longitude);
+          const closestNode = await fetchNearestNode(latitude, longitude);
 
           if (!closestNode) {
             Alert.alert("Error", "No closest node found!");
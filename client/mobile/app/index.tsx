@@ -1,7 +1,6 @@
 import React, { useState, useEffect, useRef } from "react";
 import { View, Alert } from "react-native";
 import MapComponent from "@/app/components/MapComponent";
-import { useNodes } from "@/app/hooks/useNodes";
 import { updateObstacles, fetchShortestPath } from "./utils/api";
 import { LatLng } from "react-native-maps";
 import HeaderComponent from "@/app/components/HeaderComponent";
@@ -15,7 +14,6 @@ import MapView from "react-native-maps";
 
 export default function App() {
   const router = useRouter();
-  const { nodes } = useNodes();
   const { obstaclesDb } = useObstacles();
   const mapRef = useRef<MapView | null>(null);
 
@@ -140,7 +138,6 @@ export default function App() {
       <HeaderComponent mapRef={mapRef} />
       <MapComponent
         toggleObstacle={toggleObstacle}
-        nodes={nodes}
         userLocation={userLocation}
         mapRegion={mapRegion}
         setMapRegion={setMapRegion}
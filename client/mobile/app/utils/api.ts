@@ -1,4 +1,5 @@
 import axios from "axios";
+import { GeoJSONFeature } from "../types/geoJSON";
 
 export const fetchShortestPath = async (
   sourceId: string,
@@ -7,7 +8,8 @@ export const fetchShortestPath = async (
   try {
     const response = await axios.post(
       `http://${process.env.EXPO_PUBLIC_IP_ADDRESS}:5000/shortest_path`,
-      { source: sourceId, destination: destinationId }
+      // the map only draws the route, so skip the explored edges
+      { source: sourceId, destination: destinationId, explored: false }
     );
     return response.data;
   } catch (error) {
@@ -15,6 +17,22 @@ export const fetchShortestPath = async (
   }
 };
 
+// snaps a map point to the nearest road node on the server
+export const fetchNearestNode = async (
+  latitude: number,
+  longitude: number
+): Promise<GeoJSONFeature | null> => {
+  try {
+    const response = await axios.get(
+      `http://${process.env.EXPO_PUBLIC_IP_ADDRESS}:5000/nearest_node`,
+      { params: { lat: latitude, lon: longitude } }
+    );
+    return response.data;
+  } catch (error) {
+    return null;
+  }
+};
+
 export const updateObstacles = async (obstacles: string[]) => {
   try {
     await axios.post(
@@ -0,0 +1,230 @@
+# alternatives.py
+"""Several meaningfully different routes between the same two nodes.
+
+Both methods start from the same two shortest-path trees on the obstacle
+filtered graph, grown from the source and (over the reverse edges) from
+the destination until they pass (1 + max_stretch) times the shortest
+route length:
+
+- plateau: edges that lie on both trees form plateaus, and each plateau
+  gives a route source -> plateau -> destination made of tree paths, so
+  every candidate comes out of the two trees without another search.
+- penalty: the edges of every route found are made more expensive and the
+  next route is an A* search on the penalised weights. The destination
+  tree's distances are exact lower bounds for it (penalties only add), so
+  these searches settle very few nodes.
+
+A candidate is kept when it is at most max_stretch longer than the
+shortest route and shares at most max_similarity of its length with each
+route already chosen. Once the deadline passes the trees stop growing and
+no more candidates are tried, so callers get whatever was found so far.
+"""
+import heapq
+import time
+
+METHODS = ('plateau', 'penalty')
+
+# weight factor added to an edge each time a chosen route uses it
+EDGE_PENALTY = 0.5
+
+
+def shortest_path_tree(graph, root, obstacles, reverse=False, stop_at=None, max_stretch=0.0,
+                       deadline=None):
+    """Dijkstra tree from root over forward (or, with reverse, incoming) edges.
+
+    Once stop_at is settled the tree only grows up to (1 + max_stretch)
+    times its distance, or until the deadline. Returns (dist, parent,
+    radius): settled distances, the tree parent of every settled node
+    (the next node towards root for a reverse tree) and a distance every
+    unsettled node is at least as far as.
+    """
+    if reverse:
+        offsets, neighbors, edge_ids = graph.reverse_offsets_list, graph.reverse_sources_list, graph.reverse_edges_list
+    else:
+        offsets, neighbors, edge_ids = graph.offsets_list, graph.targets_list, None
+    weights = obstacles.edge_weights(graph)
+    edge_blocked = obstacles.edge_blocked
+
+    tentative = {root: 0.0}
+    dist, parent = {}, {root: None}
+    queue = [(0.0, root)]
+    limit = float('inf')
+
+    while queue:
+        d, node = heapq.heappop(queue)
+        if node in dist:
+            continue
+        if d > limit:
+            return dist, parent, d
+        dist[node] = d
+        if node == stop_at:
+            limit = d * (1 + max_stretch)
+        if deadline is not None and limit < float('inf') and time.perf_counter() > deadline:
+            return dist, parent, d
+
+        for position in range(offsets[node], offsets[node + 1]):
+            edge = position if edge_ids is None else edge_ids[position]
+            neighbor = neighbors[position]
+            if edge_blocked[edge] or neighbor in dist:
+                continue
+            nd = d + weights[edge]
+            if nd < tentative.get(neighbor, float('inf')):
+                tentative[neighbor] = nd
+                parent[neighbor] = node
+                heapq.heappush(queue, (nd, neighbor))
+
+    # the whole reachable part of the graph is settled
+    return dist, parent, float('inf')
+
+
+def edge_lengths(graph, path, weights=None):
+    """{(u, v): length} for the consecutive node pairs of a dense path.
+
+    weights defaults to the graph's own edge weights.
+    """
+    weights = graph.weights_list if weights is None else weights
+    return {(u, v): weights[graph.edge_index(u, v)] for u, v in zip(path[:-1], path[1:])}
+
+
+def similarity(edges, length, chosen):
+    """Largest share of this route's length that it has in common with a chosen route."""
+    if not chosen or not length:
+        return 0.0
+    return max(sum(w for edge, w in edges.items() if edge in other) / length for other, _ in chosen)
+
+
+def alternative_routes(graph, source, destination, obstacles, k=3, method='plateau',
+                       max_similarity=0.7, max_stretch=0.4, budget=None):
+    """Up to k diverse routes as a list of (dense path, length in metres, similarity).
+
+    The first route is the shortest one. budget is a latency budget in
+    seconds; the shortest route is always computed, alternatives only
+    while time remains. Returns an empty list if there is no route.
+    Lengths include the soft obstacles' multipliers.
+    """
+    if source in obstacles or destination in obstacles:
+        return []
+    deadline = time.perf_counter() + budget if budget is not None else None
+
+    backward, next_node, radius = shortest_path_tree(graph, destination, obstacles, reverse=True,
+                                                     stop_at=source, max_stretch=max_stretch,
+                                                     deadline=deadline)
+    if source not in backward:
+        return []
+    best = backward[source]
+
+    # the shortest route straight from the destination tree
+    path = [source]
+    while path[-1] != destination:
+        path.append(next_node[path[-1]])
+    weights = obstacles.edge_weights(graph)
+    edges = edge_lengths(graph, path, weights)
+    routes = [(path, best, 0.0)]
+    chosen = [(edges, best)]
+
+    def consider(path, length):
+        """Keep the candidate if it qualifies, returns its {edge: length}."""
+        edges = edge_lengths(graph, path, weights)
+        # routes that revisit a node contain a detour loop, never useful
+        if length <= best * (1 + max_stretch) and len(set(path)) == len(path):
+            share = similarity(edges, length, chosen)
+            if share <= max_similarity:
+                routes.append((path, length, share))
+                chosen.append((edges, length))
+        return edges
+
+    def done():
+        return len(routes) >= k or (deadline is not None and time.perf_counter() > deadline)
+
+    if method == 'penalty':
+        _penalty_candidates(graph, source, destination, obstacles, backward, radius, edges,
+                            consider, done, k)
+    else:
+        _plateau_candidates(graph, source, destination, obstacles, backward, next_node, best,
+                            max_stretch, consider, done, deadline)
+    return routes
+
+
+def _plateau_candidates(graph, source, destination, obstacles, backward, next_node, best,
+                        max_stretch, consider, done, deadline):
+    forward, parent, _ = shortest_path_tree(graph, source, obstacles, stop_at=destination,
+                                            max_stretch=max_stretch, deadline=deadline)
+
+    # walk the source tree in distance order (the order nodes were
+    # settled in), so a node's parent comes first and plateau starts carry
+    # over along tree edges that are also edges of the destination tree
+    start = {}
+    plateau_length = {}
+    for node in forward:
+        previous = parent[node]
+        if previous is not None and previous in backward and next_node.get(previous) == node:
+            first = start[node] = start.get(previous, previous)
+            plateau_length[first] = forward[node] - forward[first]
+
+    # longest plateaus first, the shortest route's own plateau included
+    limit = best * (1 + max_stretch)
+    candidates = sorted(
+        (first for first in plateau_length if forward[first] + backward[first] <= limit),
+        key=lambda first: -plateau_length[first],
+    )
+    for first in candidates:
+        if done():
+            return
+        path = [first]
+        while path[-1] != source:
+            path.append(parent[path[-1]])
+        path.reverse()
+        while path[-1] != destination:
+            path.append(next_node[path[-1]])
+        consider(path, forward[first] + backward[first])
+
+
+def _penalty_candidates(graph, source, destination, obstacles, backward, radius, first_edges,
+                        consider, done, k):
+    offsets, targets, weights = graph.offsets_list, graph.targets_list, obstacles.edge_weights(graph)
+    edge_blocked = obstacles.edge_blocked
+    factors = {}
+
+    def penalise(edges):
+        for u, v in edges:
+            edge = graph.edge_index(u, v)
+            factors[edge] = factors.get(edge, 1.0) + EDGE_PENALTY
+
+    penalise(first_edges)
+    # rejected candidates count too, give up after a few in a row
+    for _ in range(3 * k):
+        if done():
+            return
+
+        # A* on penalised weights, the unpenalised distances to the
+        # destination are a consistent lower bound
+        g_score = {source: 0.0}
+        came_from = {}
+        queue = [(backward.get(source, radius), source)]
+        closed = set()
+        while queue:
+            _, node = heapq.heappop(queue)
+            if node == destination:
+                break
+            if node in closed:
+                continue
+            closed.add(node)
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbor = targets[edge]
+                if edge_blocked[edge] or neighbor in closed:
+                    continue
+                tentative = g_score[node] + weights[edge] * factors.get(edge, 1.0)
+                if tentative < g_score.get(neighbor, float('inf')):
+                    g_score[neighbor] = tentative
+                    came_from[neighbor] = node
+                    heapq.heappush(queue, (tentative + backward.get(neighbor, radius), neighbor))
+        else:
+            return
+
+        path = [destination]
+        while path[-1] != source:
+            path.append(came_from[path[-1]])
+        path.reverse()
+        length = sum(weights[graph.edge_index(u, v)] for u, v in zip(path[:-1], path[1:]))
+        # accepted or not, the next search should move away from it
+        penalise(consider(path, length))
@@ -0,0 +1,64 @@
+# benchmarks/bench_alt.py
+"""Nodes settled and route quality of the haversine and ALT heuristics.
+
+For short/medium/long queries with and without obstacles, reports the
+nodes settled, time per query and how much longer the returned route is
+than the true shortest path (networkx Dijkstra with obstacles removed).
+
+    python -m benchmarks.bench_alt [--size 120] [--queries 20] [--landmarks 8]
+"""
+import argparse
+import statistics
+import time
+
+import networkx as nx
+
+from compiled_graph import compile_graph
+from landmarks import add_landmarks
+from obstacle_mask import ObstacleMask
+from pathfinding import bidirectional_astar_dense
+from benchmarks.bench_init import bucket_pairs
+from benchmarks.common import dense_route_length, random_obstacles, synthetic_graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=120, help="grid side length")
+    parser.add_argument('--queries', type=int, default=20, help="queries per bucket")
+    parser.add_argument('--landmarks', type=int, default=8)
+    parser.add_argument('--obstacles', type=int, default=10)
+    args = parser.parse_args()
+
+    graph = synthetic_graph(args.size, args.size)
+    compiled = compile_graph(graph)
+    start = time.perf_counter()
+    add_landmarks(compiled, args.landmarks)
+    print(f"graph: {len(compiled)} nodes, {args.landmarks} landmarks in {time.perf_counter() - start:.2f} s")
+    print(f"{'bucket':8} {'obstacles':>9} {'heuristic':>9} {'settled':>9} {'ms/query':>9} {'excess %':>9}")
+
+    obstacle_ids = random_obstacles(graph, args.obstacles)
+    for name, pairs in bucket_pairs(graph, args.queries).items():
+        for obstacles in (set(), obstacle_ids):
+            blocked = graph.subgraph([node for node in graph if node not in obstacles])
+            mask = ObstacleMask.for_graph(compiled, compiled.to_index(obstacles))
+            for heuristic_type in ('haversine', 'alt'):
+                settled, excess, elapsed = [], [], 0.0
+                for source, destination in pairs:
+                    if source in obstacles or destination in obstacles:
+                        continue
+                    stats = {}
+                    start = time.perf_counter()
+                    path, _ = bidirectional_astar_dense(
+                        compiled, compiled.index_of(source), compiled.index_of(destination),
+                        mask, track_explored=False, heuristic_type=heuristic_type, stats=stats)
+                    elapsed += time.perf_counter() - start
+                    settled.append(stats['settled'])
+                    if path is not None:
+                        best = nx.dijkstra_path_length(blocked, source, destination, weight='length')
+                        excess.append(100 * (dense_route_length(compiled, path) / best - 1) if best else 0.0)
+                print(f"{name:8} {len(obstacles):9} {heuristic_type:>9} {statistics.mean(settled):9.0f} "
+                      f"{elapsed / len(settled) * 1000:9.2f} {statistics.mean(excess):9.2f}")
+
+
+if __name__ == '__main__':
+    main()
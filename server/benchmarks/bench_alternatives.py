@@ -0,0 +1,106 @@
+# benchmarks/bench_alternatives.py
+"""Alternative routes: plateau and penalty methods against k full searches.
+
+The baseline is the textbook penalty method, one Dijkstra per route on
+the penalised weights, stopped at the destination. Reports time per
+query, routes found, and the mean stretch and similarity of the
+alternatives.
+
+    python -m benchmarks.bench_alternatives [--size 120] [--queries 20] [--k 3]
+"""
+import argparse
+import heapq
+import statistics
+import time
+
+from alternatives import EDGE_PENALTY, alternative_routes, edge_lengths, similarity
+from compiled_graph import compile_graph
+from obstacle_mask import ObstacleMask
+from benchmarks.bench_init import bucket_pairs
+from benchmarks.common import random_obstacles, synthetic_graph
+
+
+def full_search_routes(graph, source, destination, obstacles, k=3, max_similarity=0.7, max_stretch=0.4):
+    """Penalty method with an independent Dijkstra for every route."""
+    factors = {}
+    routes, chosen = [], []
+    for _ in range(3 * k):
+        if len(routes) >= k:
+            break
+        dist, parent = {source: 0.0}, {}
+        queue, settled = [(0.0, source)], set()
+        while queue:
+            d, node = heapq.heappop(queue)
+            if node in settled:
+                continue
+            settled.add(node)
+            if node == destination:
+                break
+            for edge in range(graph.offsets_list[node], graph.offsets_list[node + 1]):
+                neighbor = graph.targets_list[edge]
+                if neighbor in obstacles:
+                    continue
+                nd = d + graph.weights_list[edge] * factors.get(edge, 1.0)
+                if nd < dist.get(neighbor, float('inf')):
+                    dist[neighbor] = nd
+                    parent[neighbor] = node
+                    heapq.heappush(queue, (nd, neighbor))
+        if destination not in settled:
+            break
+        path = [destination]
+        while path[-1] != source:
+            path.append(parent[path[-1]])
+        path.reverse()
+        edges = edge_lengths(graph, path)
+        length = sum(edges.values())
+        best = routes[0][1] if routes else length
+        share = similarity(edges, length, chosen)
+        if length <= best * (1 + max_stretch) and share <= max_similarity:
+            routes.append((path, length, share))
+            chosen.append((edges, length))
+        for u, v in edges:
+            edge = graph.edge_index(u, v)
+            factors[edge] = factors.get(edge, 1.0) + EDGE_PENALTY
+    return routes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=120, help="grid side length")
+    parser.add_argument('--queries', type=int, default=20, help="queries per bucket")
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--obstacles', type=int, default=10)
+    args = parser.parse_args()
+
+    graph = synthetic_graph(args.size, args.size)
+    compiled = compile_graph(graph)
+    obstacles = ObstacleMask.for_graph(compiled, compiled.to_index(random_obstacles(graph, args.obstacles)))
+
+    methods = {
+        'plateau': lambda s, d: alternative_routes(compiled, s, d, obstacles, k=args.k, method='plateau'),
+        'penalty': lambda s, d: alternative_routes(compiled, s, d, obstacles, k=args.k, method='penalty'),
+        'k searches': lambda s, d: full_search_routes(compiled, s, d, obstacles, k=args.k),
+    }
+
+    print(f"graph: {len(compiled)} nodes, {args.obstacles} obstacles, k={args.k}")
+    print(f"{'bucket':8} {'method':>10} {'ms/query':>9} {'routes':>7} {'stretch':>8} {'similar':>8}")
+    for name, pairs in bucket_pairs(graph, args.queries).items():
+        dense_pairs = [(compiled.index_of(s), compiled.index_of(d)) for s, d in pairs]
+        dense_pairs = [(s, d) for s, d in dense_pairs if s not in obstacles and d not in obstacles]
+        for method, fn in methods.items():
+            counts, stretches, shares = [], [], []
+            start = time.perf_counter()
+            results = [fn(s, d) for s, d in dense_pairs]
+            elapsed = (time.perf_counter() - start) / len(dense_pairs)
+            for routes in results:
+                counts.append(len(routes))
+                for _, length, share in routes[1:]:
+                    stretches.append(length / routes[0][1] - 1)
+                    shares.append(share)
+            print(f"{name:8} {method:>10} {elapsed * 1000:9.2f} {statistics.mean(counts):7.2f} "
+                  f"{statistics.mean(stretches) if stretches else 0:8.2f} "
+                  f"{statistics.mean(shares) if shares else 0:8.2f}")
+
+
+if __name__ == '__main__':
+    main()
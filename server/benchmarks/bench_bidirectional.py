@@ -0,0 +1,100 @@
+# benchmarks/bench_bidirectional.py
+"""Check bidirectional_astar_dense against networkx Dijkstra.
+
+Runs thousands of seeded pairs (a few hundred sources, several destinations
+each) and compares route lengths with networkx Dijkstra on the graph with
+the blocked nodes or roads removed (or the slowed-down roads' lengths
+multiplied), then prints the average search stats. Both heuristics are
+lower bounds under every obstacle configuration, so every route has to
+match.
+
+    python -m benchmarks.bench_bidirectional [--size 60] [--sources 200] [--per-source 10]
+"""
+import argparse
+import random
+import statistics
+
+import networkx as nx
+
+from compiled_graph import compile_graph
+from landmarks import add_landmarks
+from obstacle_mask import ObstacleMask
+from pathfinding import bidirectional_astar_dense
+from benchmarks.common import random_obstacles, random_roads, synthetic_graph
+
+# weight factor of the slowed-down roads
+SLOW_FACTOR = 3.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=60, help="grid side length")
+    parser.add_argument('--sources', type=int, default=200)
+    parser.add_argument('--per-source', type=int, default=10)
+    parser.add_argument('--obstacles', type=int, default=30)
+    args = parser.parse_args()
+
+    graph = synthetic_graph(args.size, args.size)
+    compiled = add_landmarks(compile_graph(graph))
+    rng = random.Random(5)
+    nodes = sorted(graph)
+
+    failures = []
+    print(f"{'blocked':>9} {'heuristic':>9} {'pairs':>6} {'wrong':>6} {'settled':>8} {'pushes':>8} {'mu upd':>7}")
+    configs = [
+        ('none', set(), set(), set()),
+        (f'{args.obstacles} nodes', random_obstacles(graph, args.obstacles), set(), set()),
+        (f'{args.obstacles} roads', set(), random_roads(graph, args.obstacles), set()),
+        (f'{args.obstacles} slow', set(), set(), random_roads(graph, args.obstacles, seed=17)),
+    ]
+    for label, obstacles, roads, slow in configs:
+        blocked = nx.subgraph_view(graph, filter_node=lambda node: node not in obstacles,
+                                   filter_edge=lambda u, v, key: (u, v) not in roads)
+
+        def weight(u, v, data):
+            return min(edge['length'] for edge in data.values()) * (SLOW_FACTOR if (u, v) in slow else 1)
+
+        def dense_edges(pairs):
+            # one-way roads have no reverse edge
+            edges = [compiled.edge_index(compiled.index_of(u), compiled.index_of(v)) for u, v in pairs]
+            return [edge for edge in edges if edge >= 0]
+
+        mask = ObstacleMask.for_graph(compiled, compiled.to_index(obstacles), dense_edges(roads),
+                                      {edge: SLOW_FACTOR for edge in dense_edges(slow)})
+        sources = rng.sample([node for node in nodes if node not in obstacles], args.sources)
+        expected = {}
+        for source in sources:
+            lengths = nx.single_source_dijkstra_path_length(blocked, source, weight=weight)
+            for destination in rng.sample(nodes, args.per_source):
+                expected[source, destination] = lengths.get(destination)
+
+        for heuristic_type in ('haversine', 'alt'):
+            wrong, runs = 0, []
+            for (source, destination), best in expected.items():
+                stats = {}
+                path, _ = bidirectional_astar_dense(
+                    compiled, compiled.index_of(source), compiled.index_of(destination),
+                    mask, track_explored=False, heuristic_type=heuristic_type, stats=stats)
+                runs.append(stats)
+                if path is None or best is None:
+                    wrong += (path is None) != (best is None)
+                    continue
+                length = sum(mask.edge_weights(compiled)[compiled.edge_index(u, v)]
+                             for u, v in zip(path[:-1], path[1:]))
+                valid = path[0] == compiled.index_of(source) and path[-1] == compiled.index_of(destination)
+                valid = valid and not any(mask.edge_blocked[compiled.edge_index(u, v)]
+                                          for u, v in zip(path[:-1], path[1:]))
+                if not valid or abs(length - best) > 1e-6 * max(best, 1):
+                    wrong += 1
+            if wrong:
+                failures.append((label, heuristic_type, wrong))
+            print(f"{label:>9} {heuristic_type:>9} {len(expected):6} {wrong:6} "
+                  f"{statistics.mean(s.get('settled', 0) for s in runs):8.0f} "
+                  f"{statistics.mean(s.get('pushes', 0) for s in runs):8.0f} "
+                  f"{statistics.mean(s.get('mu_updates', 0) for s in runs):7.1f}")
+
+    assert not failures, f"routes differ from Dijkstra: {failures}"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/bench_ch.py
+"""Contraction hierarchy preprocessing and queries against plain Dijkstra.
+
+Checks that every hierarchy distance equals the networkx Dijkstra distance
+and that the unpacked path is a real path of that length, then compares
+query times with bidirectional A*.
+
+    python -m benchmarks.bench_ch [--size 80] [--queries 200]
+"""
+import argparse
+import time
+
+import networkx as nx
+
+from ch import build_ch
+from compiled_graph import compile_graph
+from obstacle_mask import ObstacleMask
+from pathfinding import bidirectional_astar_dense, ch_shortest_path
+from benchmarks.common import random_obstacles, random_pairs, synthetic_graph, time_calls
+
+
+def path_length(compiled, path):
+    """Length of a dense path along its cheapest edges, None if an edge is missing."""
+    total = 0.0
+    for u, v in zip(path[:-1], path[1:]):
+        edge = compiled.edge_index(u, v)
+        if edge < 0:
+            return None
+        total += compiled.weights_list[edge]
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=80, help="grid side length")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--obstacles', type=int, default=10)
+    args = parser.parse_args()
+
+    graph = synthetic_graph(args.size, args.size)
+    compiled = compile_graph(graph)
+
+    start = time.perf_counter()
+    ch = build_ch(compiled)
+    build_time = time.perf_counter() - start
+    shortcuts = int((ch.arrays['up_middle'] >= 0).sum() + (ch.arrays['down_middle'] >= 0).sum())
+    print(f"graph: {len(compiled)} nodes, {len(compiled.targets_list)} edges")
+    print(f"preprocessing: {build_time:.1f} s, {shortcuts} shortcuts")
+
+    pairs = [(compiled.index_of(s), compiled.index_of(d)) for s, d in random_pairs(graph, args.queries)]
+
+    mismatches = 0
+    for (source, destination), (osm_source, osm_destination) in zip(pairs, random_pairs(graph, args.queries)):
+        try:
+            expected = nx.dijkstra_path_length(graph, osm_source, osm_destination, weight='length')
+        except nx.NetworkXNoPath:
+            expected = float('inf')
+        distance, path = ch.query(source, destination)
+        ok = abs(distance - expected) <= 1e-6 * max(expected, 1)
+        if path is not None:
+            length = path_length(compiled, path)
+            ok = ok and path[0] == source and path[-1] == destination
+            ok = ok and length is not None and abs(length - distance) <= 1e-6 * max(distance, 1)
+        if not ok:
+            mismatches += 1
+    print(f"distance/path mismatches against Dijkstra: {mismatches}/{len(pairs)}")
+
+    obstacles = ObstacleMask.for_graph(compiled, compiled.to_index(random_obstacles(graph, args.obstacles)))
+    for label, blocked in (('no obstacles', ObstacleMask.for_graph(compiled)), (f'{args.obstacles} obstacles', obstacles)):
+        calls = [(source, destination, blocked) for source, destination in pairs]
+        _, astar_time = time_calls(
+            lambda s, d, o: bidirectional_astar_dense(compiled, s, d, o, track_explored=False), calls)
+        _, ch_time = time_calls(
+            lambda s, d, o: ch_shortest_path(ch, compiled, s, d, o, track_explored=False), calls)
+        print(f"{label:14} A* {astar_time * 1000:7.2f} ms/query   CH {ch_time * 1000:7.2f} ms/query"
+              f"   {astar_time / ch_time:6.1f}x")
+
+    assert mismatches == 0, "contraction hierarchy disagrees with Dijkstra"
+
+
+if __name__ == '__main__':
+    main()
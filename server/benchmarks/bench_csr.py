@@ -0,0 +1,57 @@
+# benchmarks/bench_csr.py
+"""Compare the original networkx search with the compiled CSR search.
+
+    python -m benchmarks.bench_csr [--size 120] [--queries 50]
+"""
+import argparse
+import time
+
+from compiled_graph import compile_graph
+from pathfinding import bidirectional_astar
+from benchmarks.common import (
+    legacy_bidirectional_astar,
+    random_obstacles,
+    random_pairs,
+    route_length,
+    synthetic_graph,
+    time_calls,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=120, help="grid side length")
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--obstacles', type=int, default=10)
+    args = parser.parse_args()
+
+    graph = synthetic_graph(args.size, args.size)
+    start = time.perf_counter()
+    compiled = compile_graph(graph)
+    compile_time = time.perf_counter() - start
+
+    pairs = random_pairs(graph, args.queries)
+    obstacles = random_obstacles(graph, args.obstacles)
+    calls = [(source, destination, obstacles) for source, destination in pairs]
+
+    legacy, legacy_time = time_calls(lambda s, d, o: legacy_bidirectional_astar(graph, s, d, o), calls)
+    compact, compact_time = time_calls(lambda s, d, o: bidirectional_astar(compiled, s, d, o), calls)
+
+    # the legacy search stopped at the first meeting node, so routes differ
+    # wherever that wasn't the shortest one
+    lengths = [(route_length(graph, old), route_length(graph, new))
+               for (old, _), (new, _) in zip(legacy, compact) if old and new]
+    invalid = sum(1 for old, _ in lengths if old is None)
+    shorter = sum(1 for old, new in lengths if old is not None and new < old - 1e-6)
+    longer = sum(1 for old, new in lengths if old is not None and new > old + 1e-6)
+
+    print(f"graph: {len(graph)} nodes, {graph.number_of_edges()} edges, compiled in {compile_time * 1000:.1f} ms")
+    print(f"legacy networkx: {legacy_time * 1000:8.2f} ms/query")
+    print(f"compiled CSR:    {compact_time * 1000:8.2f} ms/query")
+    print(f"speedup:         {legacy_time / compact_time:8.2f}x")
+    print(f"routes shorter than legacy: {shorter}/{len(calls)}, longer: {longer}/{len(calls)}")
+    print(f"legacy routes against a one-way street: {invalid}/{len(calls)}")
+
+
+if __name__ == '__main__':
+    main()
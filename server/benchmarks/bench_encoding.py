@@ -0,0 +1,73 @@
+# benchmarks/bench_encoding.py
+"""Size and encode time of the /shortest_path response formats.
+
+Routes come from a graph snapshot (--snapshot, e.g. the production one) or
+from a seeded synthetic graph with curved edge geometry.
+
+    python -m benchmarks.bench_encoding [--snapshot PATH] [--queries 30]
+"""
+import argparse
+import gzip
+import json
+import tempfile
+import time
+
+from obstacle_mask import ObstacleMask
+from pathfinding import bidirectional_astar_dense
+from route_encoding import encode_binary, encode_polyline, simplify, zoom_tolerance
+from snapshot import build_snapshot, load_snapshot
+from benchmarks.common import random_pairs, synthetic_graph
+
+
+def encoders(tolerance):
+    return [
+        ('json', lambda path: json.dumps({'path': path}).encode()),
+        ('polyline5', lambda path: json.dumps({'path': encode_polyline(path, 5)}).encode()),
+        ('polyline6', lambda path: json.dumps({'path': encode_polyline(path, 6)}).encode()),
+        ('binary', encode_binary),
+        ('polyline5+dp', lambda path: json.dumps({'path': encode_polyline(simplify(path, tolerance), 5)}).encode()),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--snapshot', help="snapshot directory to route on")
+    parser.add_argument('--queries', type=int, default=30)
+    parser.add_argument('--zoom', type=float, default=15, help="zoom level for the simplified variant")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        snapshot = load_snapshot(args.snapshot)
+    else:
+        path = tempfile.mkdtemp(prefix='bench-snapshot-')
+        graph = synthetic_graph(120, 120, geometry=True)
+        build_snapshot(graph, path)
+        snapshot = load_snapshot(path)
+    compiled = snapshot.compiled
+
+    node_ids = compiled.node_ids.tolist()
+    no_obstacles = ObstacleMask.for_graph(compiled)
+    routes = []
+    for source, destination in random_pairs(node_ids, args.queries):
+        path, _ = bidirectional_astar_dense(compiled, compiled.index_of(source),
+                                            compiled.index_of(destination), no_obstacles, False)
+        if path:
+            routes.append(snapshot.path_coordinates(path))
+
+    points = sum(len(route) for route in routes)
+    tolerance = zoom_tolerance(args.zoom, float(compiled.lat.mean()))
+    print(f"{len(routes)} routes, {points / len(routes):.0f} points on average, "
+          f"zoom {args.zoom:g} tolerance {tolerance:.1f} m")
+    print(f"{'format':14} {'bytes':>9} {'gzip':>9} {'encode ms':>10}")
+
+    for name, encode in encoders(tolerance):
+        start = time.perf_counter()
+        bodies = [encode(route) for route in routes]
+        elapsed = (time.perf_counter() - start) / len(routes)
+        size = sum(len(body) for body in bodies) / len(routes)
+        gzipped = sum(len(gzip.compress(body)) for body in bodies) / len(routes)
+        print(f"{name:14} {size:9.0f} {gzipped:9.0f} {elapsed * 1000:10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# benchmarks/bench_haversine.py
+"""Per-call versus batched haversine and heuristic throughput.
+
+    python -m benchmarks.bench_haversine [--points 200000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from compiled_graph import compile_graph
+from utils import haversine, haversine_many, heuristic, heuristic_many, obstacle_penalties
+from benchmarks.common import random_obstacles, synthetic_graph
+
+
+def rate(count, seconds):
+    return f"{count / seconds / 1e6:8.2f} M/s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--points', type=int, default=200000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    lat1, lat2 = rng.uniform(27.6, 27.8, (2, args.points))
+    lon1, lon2 = rng.uniform(85.2, 85.4, (2, args.points))
+
+    start = time.perf_counter()
+    scalar = [haversine(a, b, c, d) for a, b, c, d in zip(lat1.tolist(), lon1.tolist(), lat2.tolist(), lon2.tolist())]
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = haversine_many(lat1, lon1, lat2, lon2)
+    batched_time = time.perf_counter() - start
+    assert np.allclose(scalar, batched, rtol=1e-12)
+
+    print(f"haversine  per-call {rate(args.points, scalar_time)}  batched {rate(args.points, batched_time)}"
+          f"  ({scalar_time / batched_time:.0f}x)")
+
+    graph = synthetic_graph(120, 120)
+    compiled = compile_graph(graph)
+    penalties = obstacle_penalties(compiled, frozenset(compiled.to_index(random_obstacles(graph, 50))))
+    nodes = np.arange(len(compiled))
+    target = len(compiled) // 2
+
+    start = time.perf_counter()
+    scalar = [heuristic(node, target, compiled, penalties) for node in nodes.tolist()]
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = heuristic_many(nodes, target, compiled, penalties)
+    batched_time = time.perf_counter() - start
+    assert np.allclose(scalar, batched, rtol=1e-12)
+
+    print(f"heuristic  per-call {rate(len(nodes), scalar_time)}  batched {rate(len(nodes), batched_time)}"
+          f"  ({scalar_time / batched_time:.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
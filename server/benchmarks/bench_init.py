@@ -0,0 +1,65 @@
+# benchmarks/bench_init.py
+"""Per-query setup cost of bidirectional_astar by query distance.
+
+Buckets random pairs into short/medium/long by straight-line distance and
+compares the search against the original networkx version. It also times
+the four graph-sized score tables the search used to build per query.
+
+    python -m benchmarks.bench_init [--size 150] [--queries 20]
+"""
+import argparse
+import time
+
+from compiled_graph import compile_graph
+from pathfinding import bidirectional_astar
+from utils import haversine
+from benchmarks.common import legacy_bidirectional_astar, random_pairs, route_length, synthetic_graph, time_calls
+
+# straight-line distance buckets in km
+BUCKETS = [('short', 0.0, 0.5), ('medium', 0.5, 2.0), ('long', 2.0, float('inf'))]
+
+
+def bucket_pairs(graph, queries):
+    """Seeded pairs grouped by straight-line distance, `queries` per bucket."""
+    buckets = {name: [] for name, _, _ in BUCKETS}
+    for source, destination in random_pairs(graph, 200 * queries):
+        distance = haversine(graph.nodes[source]['y'], graph.nodes[source]['x'],
+                             graph.nodes[destination]['y'], graph.nodes[destination]['x'])
+        for name, low, high in BUCKETS:
+            if low <= distance < high and len(buckets[name]) < queries:
+                buckets[name].append((source, destination))
+    return buckets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=150, help="grid side length")
+    parser.add_argument('--queries', type=int, default=20, help="queries per bucket")
+    args = parser.parse_args()
+
+    graph = synthetic_graph(args.size, args.size)
+    compiled = compile_graph(graph)
+
+    # what the dense version paid before popping a single node
+    start = time.perf_counter()
+    for _ in range(10):
+        [{node: float('inf') for node in graph.nodes} for _ in range(4)]
+    dense_init = (time.perf_counter() - start) / 10
+    print(f"graph: {len(graph)} nodes, dense score tables: {dense_init * 1000:.2f} ms/query")
+    print(f"{'bucket':8} {'legacy ms':>10} {'sparse ms':>10} {'speedup':>8}")
+
+    for name, pairs in bucket_pairs(graph, args.queries).items():
+        calls = [(source, destination, set()) for source, destination in pairs]
+        legacy, legacy_time = time_calls(lambda s, d, o: legacy_bidirectional_astar(graph, s, d, o), calls)
+        sparse, sparse_time = time_calls(lambda s, d, o: bidirectional_astar(compiled, s, d, o), calls)
+        # the legacy search could stop early on a longer route (or run a
+        # one-way street backwards), never find a shorter one
+        for (old, _), (new, _) in zip(legacy, sparse):
+            new_length, old_length = route_length(graph, new), route_length(graph, old)
+            assert new_length is not None, "invalid route"
+            assert old_length is None or new_length <= old_length + 1e-6, "route longer than legacy"
+        print(f"{name:8} {legacy_time * 1000:10.2f} {sparse_time * 1000:10.2f} {legacy_time / sparse_time:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# benchmarks/bench_matrix.py
+"""Distance matrix against one bidirectional A* search per pair.
+
+Checks every matrix entry against the (exact) ALT search's route length
+and compares the matrix time with running /shortest_path's search once per
+pair, for one-to-many, many-to-one and many-to-many shapes.
+
+    python -m benchmarks.bench_matrix [--size 120] [--obstacles 10]
+"""
+import argparse
+import random
+import time
+
+from compiled_graph import compile_graph
+from distance_matrix import distance_matrix
+from landmarks import add_landmarks
+from obstacle_mask import ObstacleMask
+from pathfinding import bidirectional_astar_dense
+from benchmarks.common import dense_route_length, random_obstacles, synthetic_graph
+
+SHAPES = [(1, 50), (50, 1), (10, 10), (30, 30)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=120, help="grid side length")
+    parser.add_argument('--obstacles', type=int, default=10)
+    args = parser.parse_args()
+
+    graph = synthetic_graph(args.size, args.size)
+    compiled = add_landmarks(compile_graph(graph))
+    obstacles = ObstacleMask.for_graph(compiled, compiled.to_index(random_obstacles(graph, args.obstacles)))
+    rng = random.Random(3)
+
+    print(f"graph: {len(compiled)} nodes, {args.obstacles} obstacles")
+    print(f"{'shape':>7} {'matrix ms':>10} {'per pair ms':>12} {'speedup':>8} {'wrong':>6}")
+    for rows, cols in SHAPES:
+        sources = rng.sample(range(len(compiled)), rows)
+        targets = rng.sample(range(len(compiled)), cols)
+
+        start = time.perf_counter()
+        distances, paths = distance_matrix(compiled, sources, targets, obstacles, with_paths=True)
+        matrix_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for source in sources:
+            for target in targets:
+                bidirectional_astar_dense(compiled, source, target, obstacles, track_explored=False)
+        pair_time = time.perf_counter() - start
+
+        wrong = 0
+        for i, source in enumerate(sources):
+            for j, target in enumerate(targets):
+                path, _ = bidirectional_astar_dense(compiled, source, target, obstacles,
+                                                    track_explored=False, heuristic_type='alt')
+                expected = dense_route_length(compiled, path) if path is not None else None
+                got = distances[i][j]
+                if (got is None) != (expected is None):
+                    wrong += 1
+                elif got is not None:
+                    wrong += abs(got - expected) > 1e-6 * max(expected, 1)
+                    wrong += abs(dense_route_length(compiled, paths[i][j]) - got) > 1e-6 * max(got, 1)
+
+        print(f"{rows:>3}x{cols:<3} {matrix_time * 1000:10.1f} {pair_time * 1000:12.1f} "
+              f"{pair_time / matrix_time:8.1f} {wrong:6}")
+        assert not wrong, "matrix differs from the pairwise searches"
+
+
+if __name__ == '__main__':
+    main()
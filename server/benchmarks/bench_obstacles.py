@@ -0,0 +1,56 @@
+# benchmarks/bench_obstacles.py
+"""Query time as the number of reported obstacles grows.
+
+Checks the precomputed penalty field against the original per-call
+obstacle scan on every node, then times searches with 0/10/100 obstacles.
+
+    python -m benchmarks.bench_obstacles [--size 100] [--queries 20]
+"""
+import argparse
+import math
+
+from compiled_graph import compile_graph
+from pathfinding import bidirectional_astar
+from utils import heuristic, obstacle_penalties
+from benchmarks.common import (
+    legacy_bidirectional_astar,
+    legacy_heuristic,
+    random_obstacles,
+    random_pairs,
+    synthetic_graph,
+    time_calls,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=100, help="grid side length")
+    parser.add_argument('--queries', type=int, default=20)
+    args = parser.parse_args()
+
+    graph = synthetic_graph(args.size, args.size)
+    compiled = compile_graph(graph)
+    pairs = random_pairs(graph, args.queries)
+    target = compiled.index_of(pairs[0][1])
+
+    print(f"{'obstacles':>9} {'legacy ms':>10} {'field ms':>10} {'speedup':>8}")
+    for count in (0, 10, 100):
+        obstacles = random_obstacles(graph, count)
+        penalties = obstacle_penalties(compiled, frozenset(compiled.to_index(obstacles)))
+        for i, node in enumerate(compiled.node_ids.tolist()):
+            if node in obstacles:
+                continue
+            expected = legacy_heuristic(node, pairs[0][1], graph, obstacles)
+            assert math.isclose(heuristic(i, target, compiled, penalties), expected, rel_tol=1e-12), node
+
+        calls = [(source, destination, obstacles) for source, destination in pairs]
+        legacy, legacy_time = time_calls(lambda s, d, o: legacy_bidirectional_astar(graph, s, d, o), calls)
+        field, field_time = time_calls(lambda s, d, o: bidirectional_astar(compiled, s, d, o), calls)
+        # routes can differ (the legacy search stopped at the first meeting
+        # node), but both have to agree on whether there is one
+        assert [r[0] is None for r in legacy] == [r[0] is None for r in field], "reachability differs"
+        print(f"{count:9} {legacy_time * 1000:10.2f} {field_time * 1000:10.2f} {legacy_time / field_time:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/bench_repair.py
+"""Route repair against replanning from scratch when obstacles change.
+
+For every query a RouteSession plans the route, the user moves a quarter
+of the way along it and a road further ahead gets blocked; then the block
+is lifted again. Each repair has to find a route as short as a fresh
+search with the new obstacles, and the table compares the nodes it
+re-expanded with a fresh D* Lite plan and a bidirectional A* search.
+
+    python -m benchmarks.bench_repair [--size 120] [--queries 30]
+"""
+import argparse
+import time
+
+from compiled_graph import compile_graph
+from obstacle_mask import ObstacleMask
+from pathfinding import bidirectional_astar_dense
+from route_repair import RouteSession
+from benchmarks.common import random_pairs, synthetic_graph
+
+
+def path_cost(graph, path, obstacles):
+    weights = obstacles.edge_weights(graph)
+    return sum(weights[graph.edge_index(u, v)] for u, v in zip(path[:-1], path[1:]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=120, help="synthetic grid rows and columns")
+    parser.add_argument('--queries', type=int, default=30)
+    args = parser.parse_args()
+
+    graph = compile_graph(synthetic_graph(args.size, args.size))
+    clear = ObstacleMask.for_graph(graph)
+    totals = {name: [0, 0.0] for name in ('initial', 'block', 'unblock', 'fresh D*', 'bidir A*')}
+    checked = wrong = 0
+
+    for source, destination in random_pairs(graph.node_ids.tolist(), args.queries):
+        source, destination = graph.index_of(source), graph.index_of(destination)
+        start = time.perf_counter()
+        session = RouteSession(graph, source, destination, clear)
+        totals['initial'][0] += session.initial_expanded
+        totals['initial'][1] += time.perf_counter() - start
+        path = session.path()
+        if path is None or len(path) < 8:
+            continue
+
+        # a quarter of the way there, the road halfway along the rest closes
+        position = path[len(path) // 4]
+        u, v = path[len(path) * 5 // 8], path[len(path) * 5 // 8 + 1]
+        blocked = clear.updated(frozenset(), {graph.edge_index(u, v), graph.edge_index(v, u)} - {-1}, None, 1)
+
+        for name, mask in (('block', blocked), ('unblock', clear.updated((), (), None, 2))):
+            start = time.perf_counter()
+            totals[name][0] += session.repair(position, mask)
+            totals[name][1] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            fresh = RouteSession(graph, position, destination, mask)
+            totals['fresh D*'][0] += fresh.expanded
+            totals['fresh D*'][1] += time.perf_counter() - start
+            stats = {}
+            start = time.perf_counter()
+            reference, _ = bidirectional_astar_dense(graph, position, destination, mask, False, stats=stats)
+            totals['bidir A*'][0] += stats['settled']
+            totals['bidir A*'][1] += time.perf_counter() - start
+
+            repaired = session.path()
+            checked += 1
+            if (repaired is None) != (reference is None) or (
+                    repaired is not None and abs(path_cost(graph, repaired, mask)
+                                                 - path_cost(graph, reference, mask)) > 1e-6):
+                wrong += 1
+
+    print(f"{checked} repairs, {wrong} differ from a fresh search")
+    print(f"{'search':10} {'nodes':>9} {'ms':>9}")
+    for name, (nodes, seconds) in totals.items():
+        count = checked // 2 if name in ('initial', 'block', 'unblock') else checked
+        print(f"{name:10} {nodes / max(count, 1):9.0f} {seconds / max(count, 1) * 1000:9.2f}")
+
+
+if __name__ == '__main__':
+    main()
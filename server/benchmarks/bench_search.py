@@ -0,0 +1,109 @@
+# benchmarks/bench_search.py
+"""/search_place: the local place index against the remote geocoder.
+
+Builds a snapshot with named streets and a few named features, then times
+prefix, multi-word and misspelled queries against the local index and
+reports how often the expected place comes back. The remote fallback runs
+against a stubbed session with a fixed latency, so no network is needed,
+and reports how many queries the LRU answers. Ranking and the fallback's
+error handling are tested in tests/test_place_search.py.
+
+    python -m benchmarks.bench_search [--size 60] [--latency 0.2]
+"""
+import argparse
+import random
+import tempfile
+import time
+
+import requests
+
+from place_search import Geocoder, normalize, place_index, with_nearest_nodes
+from snapshot import build_snapshot, load_snapshot
+from benchmarks.common import street_name, synthetic_graph
+
+FEATURES = ['Patan Hospital', 'Tribhuvan University', 'Pashupatinath Temple', 'Swayambhu Stupa',
+            'Bhatbhateni Supermarket', 'Ratna Park', 'Kathmandu Durbar Square']
+
+
+class StubResponse:
+    def __init__(self, places):
+        self.places = places
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.places
+
+
+class StubSession:
+    """Stands in for requests.Session: answers after latency seconds or raises."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        time.sleep(min(self.latency, timeout))
+        if self.latency > timeout:
+            raise requests.Timeout(f"no answer within {timeout}s")
+        return StubResponse([{"display_name": f"{params['q']}, Nepal", "lat": "27.70", "lon": "85.32"}])
+
+
+def time_queries(search, queries):
+    start = time.perf_counter()
+    results = [search(query) for query in queries]
+    return results, (time.perf_counter() - start) / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=60, help="synthetic grid rows and columns")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.2, help="stub geocoder latency in seconds")
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    graph = synthetic_graph(args.size, args.size, names=True)
+    nodes = list(graph.nodes)
+    features = [(name, 'amenity', graph.nodes[node]['y'], graph.nodes[node]['x'])
+                for name, node in zip(FEATURES, rng.sample(nodes, len(FEATURES)))]
+    path = tempfile.mkdtemp(prefix='bench-snapshot-')
+    build_snapshot(graph, path, features=features)
+    snapshot = load_snapshot(path)
+
+    start = time.perf_counter()
+    index = place_index(snapshot)
+    print(f"{len(index.places)} places, {len(index.words)} words, index built in "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms")
+
+    # (query, the name that has to be among the results)
+    streets = [street_name(i, suffix) for i in range(args.size) for suffix in ('Marg', 'Sadak')]
+    cases = {
+        'prefix': [(name[:rng.randint(3, len(name))], name) for name in rng.choices(FEATURES, k=args.queries)],
+        'words': [(f"{name.split()[0]} {name.split()[1]}", name) for name in rng.choices(streets, k=args.queries)],
+        'typo': [(name.replace('a', 'e', 1), name) for name in rng.choices(FEATURES, k=args.queries)],
+    }
+    print(f"{'queries':10} {'found':>7} {'local us':>9}")
+    for kind, pairs in cases.items():
+        results, elapsed = time_queries(index.search, [query for query, _ in pairs])
+        found = sum(any(normalize(place['display_name']) == normalize(name) for place in places)
+                    for places, (_, name) in zip(results, pairs))
+        assert all(place['node_id'] in snapshot.compiled for places in results for place in places)
+        print(f"{kind:10} {found / len(pairs):7.0%} {elapsed * 1e6:9.1f}")
+    assert not index.search('zzqx nowhere'), "nonsense matched locally"
+
+    session = StubSession(args.latency)
+    geocoder = Geocoder(session=session, timeout=1.0)
+    queries = [f"Somewhere {i % 20}" for i in range(args.queries)]
+    _, elapsed = time_queries(geocoder.search, queries)
+    assert session.calls == 20, session.calls
+    places = with_nearest_nodes(snapshot.compiled, geocoder.search("  somewhere, 3 "))
+    assert session.calls == 20 and places[0]['node_id'] in snapshot.compiled
+    print(f"remote: {session.calls} upstream calls for {args.queries + 1} queries, "
+          f"{elapsed * 1000:.1f} ms per query, {geocoder.stats()['hit_rate']:.0%} from the cache")
+
+
+if __name__ == '__main__':
+    main()
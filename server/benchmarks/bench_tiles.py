@@ -0,0 +1,104 @@
+# benchmarks/bench_tiles.py
+"""Map layer payloads: the whole-layer GeoJSON against z/x/y tiles.
+
+Builds a snapshot (or loads --snapshot), times the legacy /edges and /nodes
+encoding against the tile encoder at a few zooms and reports raw and gzip
+sizes. Also checks that the index tiles cover every drawn edge and node
+exactly once per tile and that binary tiles decode to the GeoJSON ones.
+
+    python -m benchmarks.bench_tiles [--snapshot PATH] [--size 120]
+"""
+import argparse
+import gzip
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from snapshot import build_snapshot, load_snapshot
+from tiles import TILE_ZOOM, decode_tile, display_rows, encode_tile, tile_xy
+from benchmarks.common import synthetic_graph
+
+
+def tiles_at(snapshot, zoom):
+    """Every tile at zoom that has a node in it."""
+    x, y = tile_xy(snapshot.arrays['lat'], snapshot.arrays['lon'], zoom)
+    return sorted(set(zip(x.tolist(), y.tolist())))
+
+
+def check_coverage(snapshot):
+    """Index tiles list every drawn edge and every node, nodes exactly once."""
+    arrays = snapshot.arrays
+    edges = set()
+    nodes = []
+    for x, y in tiles_at(snapshot, TILE_ZOOM):
+        features = json.loads(encode_tile(snapshot, 'edges', TILE_ZOOM, x, y))['features']
+        edges.update(feature['id'] for feature in features)
+        nodes.extend(feature['id'] for feature in json.loads(
+            encode_tile(snapshot, 'nodes', TILE_ZOOM, x, y))['features'])
+    expected = set(display_rows(arrays).tolist())
+    assert edges == expected, f"{len(expected - edges)} edges missing, {len(edges - expected)} extra"
+    assert sorted(nodes) == sorted(arrays['node_ids'].tolist()), "nodes missing or repeated"
+    return len(edges), len(nodes)
+
+
+def check_binary(snapshot, zoom, x, y):
+    """Binary tiles carry the same ids and coordinates as the GeoJSON ones."""
+    features = json.loads(encode_tile(snapshot, 'edges', zoom, x, y))['features']
+    u, v, counts, coords = decode_tile('edges', encode_tile(snapshot, 'edges', zoom, x, y, 'binary'))
+    assert [f['properties']['u'] for f in features] == u.tolist()
+    assert [f['properties']['v'] for f in features] == v.tolist()
+    assert [len(f['geometry']['coordinates']) for f in features] == counts.tolist()
+    expected = [point[::-1] for f in features for point in f['geometry']['coordinates']]
+    assert np.allclose(coords, np.array(expected).reshape(-1, 2), atol=1e-6)
+
+    features = json.loads(encode_tile(snapshot, 'nodes', zoom, x, y))['features']
+    ids, coords = decode_tile('nodes', encode_tile(snapshot, 'nodes', zoom, x, y, 'binary'))
+    assert [f['id'] for f in features] == ids.tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--snapshot', help="snapshot directory to serve")
+    parser.add_argument('--size', type=int, default=120, help="synthetic grid rows and columns")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        snapshot = load_snapshot(args.snapshot)
+    else:
+        path = tempfile.mkdtemp(prefix='bench-snapshot-')
+        start = time.perf_counter()
+        build_snapshot(synthetic_graph(args.size, args.size, geometry=True), path)
+        print(f"snapshot built in {time.perf_counter() - start:.1f}s")
+        snapshot = load_snapshot(path)
+
+    edges, nodes = check_coverage(snapshot)
+    print(f"z{TILE_ZOOM} tiles cover {edges} drawn edges and {nodes} nodes")
+
+    print(f"{'payload':22} {'tiles':>6} {'bytes':>10} {'gzip':>9} {'encode ms':>10}")
+    start = time.perf_counter()
+    node_gdf, edge_gdf = snapshot.gdfs()
+    layers = {'edges': json.dumps(edge_gdf.to_json()).encode(), 'nodes': json.dumps(node_gdf.to_json()).encode()}
+    elapsed = time.perf_counter() - start
+    for layer, body in layers.items():
+        print(f"{'/' + layer:22} {1:6} {len(body):10} {len(gzip.compress(body)):9} {elapsed * 1000:10.1f}")
+
+    for zoom in (TILE_ZOOM - 1, TILE_ZOOM, TILE_ZOOM + 2):
+        tiles = tiles_at(snapshot, zoom)
+        for layer in ('edges', 'nodes'):
+            for tile_format in ('json', 'binary'):
+                start = time.perf_counter()
+                bodies = [encode_tile(snapshot, layer, zoom, x, y, tile_format) for x, y in tiles]
+                elapsed = (time.perf_counter() - start) / len(tiles)
+                size = sum(len(body) for body in bodies) / len(tiles)
+                gzipped = sum(len(gzip.compress(body)) for body in bodies) / len(tiles)
+                print(f"{f'z{zoom} {layer} {tile_format}':22} {len(tiles):6} {size:10.0f} {gzipped:9.0f} "
+                      f"{elapsed * 1000:10.1f}")
+        x, y = tiles[len(tiles) // 2]
+        check_binary(snapshot, zoom, x, y)
+    print("binary tiles match the GeoJSON tiles")
+
+
+if __name__ == '__main__':
+    main()
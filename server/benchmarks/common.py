@@ -0,0 +1,249 @@
+# benchmarks/common.py
+"""Shared helpers for the offline routing benchmarks.
+
+The benchmarks measure; correctness tests live in tests/ and run with
+pytest. A benchmark only asserts what its numbers depend on, such as the
+routes it times being shortest. Run them from the server directory, e.g.
+    python -m benchmarks.bench_csr
+"""
+import heapq
+import random
+import time
+
+import networkx as nx
+from shapely.geometry import LineString
+
+from utils import haversine
+
+# rough centre of the Kathmandu valley
+BASE_LAT, BASE_LON = 27.70, 85.32
+
+
+def synthetic_graph(rows=120, cols=120, spacing=0.0008, seed=42, geometry=False, names=False):
+    """Seeded road-like MultiDiGraph with osmnx-style x/y/length attributes.
+
+    A jittered grid where some streets are one-way, some are missing and
+    some have a longer parallel edge, with large random OSM-like node ids.
+    With geometry=True most edges get a curved shapely LineString, with
+    names=True every grid row and column is a named street.
+    """
+    rng = random.Random(seed)
+    graph = nx.MultiDiGraph(crs="epsg:4326")
+
+    ids = rng.sample(range(10**8, 10**10), rows * cols)
+    rng.shuffle(ids)
+
+    def node_id(r, c):
+        return ids[r * cols + c]
+
+    for r in range(rows):
+        for c in range(cols):
+            graph.add_node(
+                node_id(r, c),
+                y=BASE_LAT + r * spacing + rng.uniform(-0.2, 0.2) * spacing,
+                x=BASE_LON + c * spacing + rng.uniform(-0.2, 0.2) * spacing,
+                street_count=4,
+            )
+
+    for r in range(rows):
+        for c in range(cols):
+            for dr, dc in ((0, 1), (1, 0)):
+                r2, c2 = r + dr, c + dc
+                if r2 >= rows or c2 >= cols or rng.random() < 0.05:
+                    continue
+                u, v = node_id(r, c), node_id(r2, c2)
+                straight = 1000 * haversine(graph.nodes[u]['y'], graph.nodes[u]['x'],
+                                            graph.nodes[v]['y'], graph.nodes[v]['x'])
+                length = straight * rng.uniform(1.0, 1.3)
+                one_way = rng.random() < 0.1
+                pairs = [(u, v)] if one_way else [(u, v), (v, u)]
+                line = _curve(graph, u, v, rng) if geometry and rng.random() < 0.7 else None
+                for a, b in pairs:
+                    attrs = {}
+                    if line is not None:
+                        attrs['geometry'] = line if a == u else LineString(line.coords[::-1])
+                    if names:
+                        attrs['name'] = street_name(r, 'Marg') if dr == 0 else street_name(c, 'Sadak')
+                    graph.add_edge(a, b, length=length, oneway=one_way, highway="residential", **attrs)
+                    if rng.random() < 0.05:
+                        graph.add_edge(a, b, length=length * rng.uniform(1.0, 1.5),
+                                       oneway=one_way, highway="service")
+    return graph
+
+
+STREET_WORDS = ['Durbar', 'Bagmati', 'Himal', 'Ganesh', 'Kamal', 'Tara', 'Shanti', 'Nil', 'Surya', 'Bhim']
+
+
+def street_name(i, suffix):
+    """Deterministic street name for grid row or column i, e.g. "Tara 12 Marg"."""
+    return f"{STREET_WORDS[i % len(STREET_WORDS)]} {i} {suffix}"
+
+
+def _curve(graph, u, v, rng):
+    """A wiggly LineString from u to v with a handful of shape points."""
+    x1, y1 = graph.nodes[u]['x'], graph.nodes[u]['y']
+    x2, y2 = graph.nodes[v]['x'], graph.nodes[v]['y']
+    steps = rng.randint(3, 12)
+    points = [(x1, y1)]
+    for i in range(1, steps):
+        t = i / steps
+        points.append((x1 + (x2 - x1) * t + rng.uniform(-2e-5, 2e-5),
+                       y1 + (y2 - y1) * t + rng.uniform(-2e-5, 2e-5)))
+    points.append((x2, y2))
+    return LineString(points)
+
+
+def random_pairs(graph, count, seed=7):
+    """Seeded list of (source, destination) OSM node id pairs.
+
+    graph can be a networkx graph or any iterable of node ids.
+    """
+    rng = random.Random(seed)
+    node_list = sorted(graph)
+    return [(rng.choice(node_list), rng.choice(node_list)) for _ in range(count)]
+
+
+def random_obstacles(graph, count, seed=11):
+    """Seeded set of obstacle node ids."""
+    rng = random.Random(seed)
+    return set(rng.sample(sorted(graph.nodes), count))
+
+
+def random_roads(graph, count, seed=13):
+    """Seeded set of (u, v) node id pairs for count roads, in both directions."""
+    rng = random.Random(seed)
+    roads = set()
+    for u, v in rng.sample(sorted({(u, v) for u, v in graph.edges() if u != v}), count):
+        roads.update([(u, v), (v, u)])
+    return roads
+
+
+def route_length(graph, path):
+    """Length of a path of OSM node ids over the networkx graph's shortest parallel edges.
+
+    None if the path uses an edge the graph doesn't have, which the legacy
+    search does when its backward half runs a one-way street the wrong way.
+    """
+    total = 0.0
+    for u, v in zip(path[:-1], path[1:]):
+        edge_data = graph.get_edge_data(u, v)
+        if not edge_data:
+            return None
+        total += min(edge.get('length', float('inf')) for edge in edge_data.values())
+    return total
+
+
+def dense_route_length(compiled, path):
+    """Length of a path of dense indices over a CompiledGraph."""
+    return sum(compiled.weights_list[compiled.edge_index(u, v)] for u, v in zip(path[:-1], path[1:]))
+
+
+def percentile(values, q):
+    """q-th percentile (0-100) of values by nearest rank, nan when empty."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))] if values else float('nan')
+
+
+def time_calls(fn, args_list, repeat=1):
+    """Run fn over every argument tuple and return (results, seconds per call)."""
+    results = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [fn(*args) for args in args_list]
+    elapsed = time.perf_counter() - start
+    return results, elapsed / (len(args_list) * repeat)
+
+
+def legacy_heuristic(node1, node2, graph, obstacles):
+    """The original networkx heuristic, kept as a reference for comparisons."""
+    lat1, lon1 = graph.nodes[node1]['y'], graph.nodes[node1]['x']
+    lat2, lon2 = graph.nodes[node2]['y'], graph.nodes[node2]['x']
+
+    base_heuristic = haversine(lat1, lon1, lat2, lon2)
+
+    penalty = 0
+    for obs in obstacles:
+        if obs not in graph.nodes:
+            continue
+
+        obs_lat, obs_lon = graph.nodes[obs]['y'], graph.nodes[obs]['x']
+        dist_to_obstacle = haversine(lat1, lon1, obs_lat, obs_lon)
+
+        if dist_to_obstacle < 0.1:
+            penalty += 10 / dist_to_obstacle
+
+    return base_heuristic + penalty
+
+
+def legacy_bidirectional_astar(graph, source, destination, obstacles):
+    """The original search over the networkx MultiDiGraph, kept as a reference."""
+    if source in obstacles or destination in obstacles:
+        return None, []
+
+    open_set = []
+    heapq.heappush(open_set, (0, source, 'forward'))
+    heapq.heappush(open_set, (0, destination, 'backward'))
+
+    came_from = {'forward': {}, 'backward': {}}
+    g_score = {'forward': {node: float('inf') for node in graph.nodes},
+               'backward': {node: float('inf') for node in graph.nodes}}
+    f_score = {'forward': {node: float('inf') for node in graph.nodes},
+               'backward': {node: float('inf') for node in graph.nodes}}
+
+    g_score['forward'][source] = 0
+    g_score['backward'][destination] = 0
+
+    f_score['forward'][source] = legacy_heuristic(source, destination, graph, obstacles)
+    f_score['backward'][destination] = legacy_heuristic(destination, source, graph, obstacles)
+
+    explored_edges = []
+    meeting_node = None
+
+    while open_set:
+        _, current, direction = heapq.heappop(open_set)
+        opposite = 'backward' if direction == 'forward' else 'forward'
+
+        if current in came_from[opposite]:
+            meeting_node = current
+            break
+
+        for neighbor in graph.neighbors(current):
+            if neighbor in obstacles or current in obstacles:
+                continue
+
+            edge_data = graph.get_edge_data(current, neighbor)
+            if not edge_data:
+                continue
+
+            edge_weight = min(edge.get('length', float('inf')) for edge in edge_data.values())
+            if edge_weight == float('inf'):
+                continue
+
+            tentative_g_score = g_score[direction][current] + edge_weight
+
+            if tentative_g_score < g_score[direction][neighbor]:
+                came_from[direction][neighbor] = current
+                g_score[direction][neighbor] = tentative_g_score
+                f_score[direction][neighbor] = tentative_g_score + legacy_heuristic(
+                    neighbor, destination if direction == 'forward' else source, graph, obstacles
+                )
+                heapq.heappush(open_set, (f_score[direction][neighbor], neighbor, direction))
+                explored_edges.append((current, neighbor))
+
+    if meeting_node is None:
+        return None, explored_edges
+
+    path = []
+    node = meeting_node
+    while node in came_from['forward']:
+        path.append(node)
+        node = came_from['forward'][node]
+    path.append(source)
+    path.reverse()
+
+    node = meeting_node
+    while node in came_from['backward']:
+        node = came_from['backward'][node]
+        path.append(node)
+
+    return path, explored_edges
@@ -0,0 +1,98 @@
+# benchmarks/load_test.py
+"""Latency and throughput of /shortest_path under concurrent load.
+
+Serves the app with a threaded werkzeug server on a local port, against
+the in-memory Supabase stand-in and either an existing snapshot or a
+seeded synthetic one, with the route cache off. For every worker count it
+sends --requests random route requests at each concurrency level and
+prints p50/p99 latency, throughput and how many were refused (429) or
+timed out (504).
+
+    python -m benchmarks.load_test [--snapshot DIR] [--workers 0,4] [--levels 1,2,4,8,16]
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.common import percentile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--snapshot', help="snapshot directory, default: synthetic graph")
+    parser.add_argument('--size', type=int, default=120, help="synthetic grid side length")
+    parser.add_argument('--workers', default='0,4', help="comma-separated worker counts, 0 runs inline")
+    parser.add_argument('--levels', default='1,2,4,8,16', help="comma-separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=100, help="requests per level")
+    parser.add_argument('--queue-size', type=int, default=None)
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+
+    path = args.snapshot or os.path.join(tempfile.mkdtemp(), 'snapshot')
+    # read at import time by the server modules, and inherited by the
+    # workers, so this comes before importing any of them
+    os.environ['GRAPH_SNAPSHOT_PATH'] = path
+    os.environ['SUPABASE_LOCAL'] = '1'
+    os.environ['ROUTE_CACHE_SIZE'] = '0'
+
+    if args.snapshot is None:
+        from snapshot import build_snapshot
+        from benchmarks.common import synthetic_graph
+        build_snapshot(synthetic_graph(args.size, args.size, geometry=True), path)
+
+    from werkzeug.serving import make_server
+    import app
+    import routes
+    from routing_executor import RoutingExecutor
+    from snapshot import get_snapshot
+
+    node_ids = get_snapshot(path).compiled.node_ids.tolist()
+    server = make_server('127.0.0.1', args.port, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{args.port}/shortest_path'
+    local = threading.local()
+
+    def send(pair):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        response = local.session.post(url, json={'source': pair[0], 'destination': pair[1], 'explored': False})
+        return response.status_code, time.perf_counter() - start
+
+    rng = random.Random(1)
+    print(f"graph: {len(node_ids)} nodes")
+    print(f"{'workers':>7} {'conc':>5} {'p50 ms':>8} {'p99 ms':>8} {'req/s':>7} {'429':>5} {'504':>5}")
+    try:
+        for workers in [int(w) for w in args.workers.split(',')]:
+            queue_size = args.queue_size or 4 * max(workers, 1)
+            routes.routing_executor.shutdown()
+            routes.routing_executor = RoutingExecutor(workers=workers, queue_size=queue_size)
+            # start the workers and map the snapshot before timing anything
+            send((node_ids[0], node_ids[-1]))
+
+            for level in [int(c) for c in args.levels.split(',')]:
+                pairs = [(rng.choice(node_ids), rng.choice(node_ids)) for _ in range(args.requests)]
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=level) as pool:
+                    results = list(pool.map(send, pairs))
+                elapsed = time.perf_counter() - start
+
+                served = [latency for status, latency in results if status in (200, 400)]
+                refused = sum(1 for status, _ in results if status == 429)
+                timed_out = sum(1 for status, _ in results if status == 504)
+                print(f"{workers:7} {level:5} {percentile(served, 50) * 1000:8.1f} "
+                      f"{percentile(served, 99) * 1000:8.1f} {len(served) / elapsed:7.1f} "
+                      f"{refused:5} {timed_out:5}")
+    finally:
+        routes.routing_executor.shutdown()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
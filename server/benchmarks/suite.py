@@ -0,0 +1,274 @@
+# benchmarks/suite.py
+"""Reproducible offline routing benchmark suite.
+
+Runs fixed, seeded query sets against a graph snapshot (--snapshot) or a
+seeded synthetic road grid, without network access:
+
+- query sets: short, medium and long routes, by straight-line distance
+  as a share of the graph's extent (see DISTANCE_BANDS)
+- obstacle levels: 0, 10 and 100 blocked nodes by default, chosen away
+  from the query endpoints
+- kernel runs: the search functions called directly, per algorithm, with
+  the nodes each search settled and the peak Python memory of a pass
+- end-to-end runs: /shortest_path through the Flask test client, with the
+  in-memory Supabase holding the obstacles and the route cache off
+
+Every row reports throughput, latency percentiles and, for the kernel,
+nodes expanded and peak memory. --json writes the results with enough
+metadata to compare runs, --compare prints the change against an earlier
+--json file. The same arguments give the same queries and obstacles.
+
+    python -m benchmarks.suite [--snapshot DIR] [--size 120] [--queries 20]
+        [--obstacles 0,10,100] [--algorithms astar,alt] [--no-e2e]
+        [--json results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# (name, low, high) straight-line distance as a share of the graph's bounding box diagonal
+DISTANCE_BANDS = [('short', 0.05, 0.15), ('medium', 0.15, 0.40), ('long', 0.40, 1.0)]
+# algorithm name -> route_search() arguments
+ALGORITHMS = {
+    'astar': {'algorithm': 'astar', 'heuristic_type': 'haversine'},
+    'alt': {'algorithm': 'astar', 'heuristic_type': 'alt'},
+    'ch': {'algorithm': 'ch'},
+}
+
+
+def query_sets(compiled, count, seed):
+    """{band: [(source, destination) dense pairs]} with count pairs per band."""
+    from utils import haversine
+
+    rng = random.Random(seed)
+    lat, lon = compiled.lat, compiled.lon
+    diagonal = haversine(float(lat.min()), float(lon.min()), float(lat.max()), float(lon.max()))
+    sets = {name: [] for name, _, _ in DISTANCE_BANDS}
+    # plenty of tries for any graph that has routes in every band
+    for _ in range(2000 * count):
+        if all(len(pairs) >= count for pairs in sets.values()):
+            break
+        source, destination = rng.randrange(len(compiled)), rng.randrange(len(compiled))
+        share = haversine(float(lat[source]), float(lon[source]),
+                          float(lat[destination]), float(lon[destination])) / diagonal
+        for name, low, high in DISTANCE_BANDS:
+            if low <= share < high and len(sets[name]) < count:
+                sets[name].append((source, destination))
+    return sets, diagonal
+
+
+def obstacle_nodes(compiled, count, pairs, seed):
+    """count seeded dense nodes to block, none of them a query endpoint."""
+    rng = random.Random(seed + count)
+    endpoints = {node for pair in pairs for node in pair}
+    candidates = [node for node in range(len(compiled)) if node not in endpoints]
+    return sorted(rng.sample(candidates, min(count, len(candidates))))
+
+
+def summarize(latencies, elapsed):
+    from benchmarks.common import percentile
+
+    return {
+        'queries': len(latencies),
+        'qps': len(latencies) / elapsed if elapsed else 0.0,
+        'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else float('nan'),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def run_kernel(compiled, algorithm, pairs, mask):
+    """Time route_search() over pairs, then repeat the pass under tracemalloc for peak memory."""
+    from routing_executor import route_search
+
+    options = ALGORITHMS[algorithm]
+    latencies, settled, found = [], [], 0
+    start = time.perf_counter()
+    for source, destination in pairs:
+        query_start = time.perf_counter()
+        path, _, stats = route_search(compiled, source, destination, mask, False, **options)
+        latencies.append(time.perf_counter() - query_start)
+        settled.append(stats.get('settled', 0))
+        found += path is not None
+    elapsed = time.perf_counter() - start
+
+    # a separate pass, tracemalloc slows every allocation down
+    tracemalloc.start()
+    for source, destination in pairs:
+        route_search(compiled, source, destination, mask, False, **options)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = summarize(latencies, elapsed)
+    result.update(found=found, settled_mean=sum(settled) / len(settled) if settled else 0.0,
+                  peak_kib=peak / 1024)
+    return result
+
+
+def run_e2e(client, routes, compiled, pairs, nodes):
+    """POST every pair to /shortest_path with these nodes reported as obstacles."""
+    # replace the obstacle rows, then let the store re-read them
+    for row in routes.supabase.table('obstacles').select('id').execute().data:
+        routes.supabase.table('obstacles').delete().eq('id', row['id']).execute()
+    for node in nodes:
+        routes.supabase.table('obstacles').insert({
+            'node_id': int(compiled.node_ids[node]), 'latitude': float(compiled.lat[node]),
+            'longitude': float(compiled.lon[node]), 'name': 'benchmark', 'type': 'blocked',
+            'expected_duration': None, 'severity': 'High', 'owner': 'benchmark',
+        }).execute()
+    routes.obstacle_store.refresh()
+
+    latencies, statuses = [], {}
+    start = time.perf_counter()
+    for source, destination in pairs:
+        query_start = time.perf_counter()
+        response = client.post('/shortest_path', json={
+            'source': int(compiled.node_ids[source]), 'destination': int(compiled.node_ids[destination]),
+            'explored': False,
+        })
+        response.get_data()
+        latencies.append(time.perf_counter() - query_start)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    elapsed = time.perf_counter() - start
+
+    result = summarize(latencies, elapsed)
+    result.update(found=statuses.get(200, 0), statuses={str(code): n for code, n in sorted(statuses.items())})
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def row_key(row):
+    return row['mode'], row['algorithm'], row['set'], row['obstacles']
+
+
+def print_rows(rows, baseline=None):
+    previous = {row_key(row): row for row in (baseline or {}).get('results', [])}
+    header = f"{'mode':6} {'algorithm':9} {'set':7} {'obst':>4} {'found':>6} {'q/s':>8} {'p50 ms':>8} " \
+             f"{'p90 ms':>8} {'p99 ms':>8} {'settled':>8} {'peak KiB':>9}"
+    print(header + ("  p50 vs baseline" if previous else ""))
+    for row in rows:
+        line = (f"{row['mode']:6} {row['algorithm']:9} {row['set']:7} {row['obstacles']:4} "
+                f"{row['found']:3}/{row['queries']:<2} {row['qps']:8.1f} {row['p50_ms']:8.2f} "
+                f"{row['p90_ms']:8.2f} {row['p99_ms']:8.2f} {row.get('settled_mean', float('nan')):8.0f} "
+                f"{row.get('peak_kib', float('nan')):9.0f}")
+        old = previous.get(row_key(row))
+        if old and old['p50_ms']:
+            line += f"  {(row['p50_ms'] / old['p50_ms'] - 1) * 100:+6.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--snapshot', help="snapshot directory, default: seeded synthetic graph")
+    parser.add_argument('--size', type=int, default=120, help="synthetic grid side length")
+    parser.add_argument('--seed', type=int, default=2024, help="seed for the queries and obstacles")
+    parser.add_argument('--queries', type=int, default=20, help="queries per distance band")
+    parser.add_argument('--obstacles', default='0,10,100', help="comma-separated obstacle counts")
+    parser.add_argument('--algorithms', default='astar,alt',
+                        help=f"comma-separated kernel algorithms out of {', '.join(ALGORITHMS)}")
+    parser.add_argument('--no-e2e', action='store_true', help="skip the Flask test-client runs")
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--compare', help="earlier --json results to compare against")
+    args = parser.parse_args()
+
+    algorithms = [name for name in args.algorithms.split(',') if name]
+    unknown = set(algorithms) - set(ALGORITHMS)
+    if unknown:
+        parser.error(f"unknown algorithms: {', '.join(sorted(unknown))}")
+    obstacle_counts = [int(count) for count in args.obstacles.split(',')]
+
+    path = args.snapshot or os.path.join(tempfile.mkdtemp(prefix='bench-suite-'), 'snapshot')
+    # read at import time by the server modules, so set before importing them;
+    # searches run inline so every counter and allocation is in this process
+    os.environ['GRAPH_SNAPSHOT_PATH'] = path
+    os.environ['SUPABASE_LOCAL'] = '1'
+    os.environ['ROUTE_CACHE_SIZE'] = '0'
+    os.environ['ROUTING_WORKERS'] = '0'
+    os.environ['OBSTACLE_TTL'] = '3600'
+
+    from obstacle_mask import ObstacleMask
+    from snapshot import build_snapshot, get_snapshot
+
+    if args.snapshot is None:
+        from benchmarks.common import synthetic_graph
+        build_snapshot(synthetic_graph(args.size, args.size, geometry=True), path)
+    snapshot = get_snapshot(path)
+    compiled = snapshot.compiled
+
+    sets, diagonal = query_sets(compiled, args.queries, args.seed)
+    print(f"graph: {len(compiled)} nodes, {len(compiled.targets_list)} edges, {diagonal:.1f} km across")
+    for name, low, high in DISTANCE_BANDS:
+        print(f"  {name}: {len(sets[name])} routes of {low * diagonal:.1f}-{high * diagonal:.1f} km")
+
+    rows = []
+    for count in obstacle_counts:
+        for name, pairs in sets.items():
+            nodes = obstacle_nodes(compiled, count, pairs, args.seed)
+            mask = ObstacleMask.for_graph(compiled, nodes)
+            for algorithm in algorithms:
+                result = run_kernel(compiled, algorithm, pairs, mask)
+                rows.append(dict(mode='kernel', algorithm=algorithm, set=name, obstacles=count, **result))
+
+    if not args.no_e2e:
+        import app
+        import routes
+
+        client = app.app.test_client()
+        # first request pays for the lazy start-up (obstacle store, penalties)
+        warm_up = sets['short'][:1] or [(0, 0)]
+        run_e2e(client, routes, compiled, warm_up, [])
+        for count in obstacle_counts:
+            for name, pairs in sets.items():
+                nodes = obstacle_nodes(compiled, count, pairs, args.seed)
+                result = run_e2e(client, routes, compiled, pairs, nodes)
+                rows.append(dict(mode='e2e', algorithm='astar', set=name, obstacles=count, **result))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_rows(rows, baseline)
+
+    # ru_maxrss is in KiB on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"peak RSS {peak_rss / 1024:.0f} MiB")
+    if args.json:
+        document = {
+            'meta': {
+                'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'revision': git_revision(),
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'graph': args.snapshot or f'synthetic {args.size}x{args.size}',
+                'snapshot': snapshot.meta.get('created'),
+                'nodes': len(compiled),
+                'edges': len(compiled.targets_list),
+                'seed': args.seed,
+                'queries': args.queries,
+                'peak_rss_kib': peak_rss,
+            },
+            'results': rows,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f"wrote {args.json}")
+
+
+if __name__ == '__main__':
+    main()
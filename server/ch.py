@@ -0,0 +1,401 @@
+# ch.py
+"""Contraction Hierarchies over the CompiledGraph.
+
+Preprocessing contracts nodes one at a time (cheapest edge difference
+first), adding shortcut edges wherever a local witness search can't find
+a path around the contracted node. Queries then run a bidirectional
+Dijkstra that only ever climbs to higher-ranked nodes, which settles a few
+hundred nodes instead of a large part of the city.
+
+The hierarchy ignores obstacles: callers check the unpacked path and fall
+back to A* when it crosses one. Build it once per snapshot with
+
+    python ch.py [--path SNAPSHOT_DIR]
+"""
+import argparse
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from functools import cached_property
+
+import numpy as np
+
+from snapshot import SNAPSHOT_PATH, SnapshotError, load_snapshot
+
+logger = logging.getLogger(__name__)
+
+# bump whenever the array layout changes
+CH_VERSION = 1
+
+CH_ARRAYS = [
+    'rank',
+    # upward edges u -> v (rank[v] > rank[u]) stored at u
+    'up_offsets', 'up_targets', 'up_weights', 'up_middle',
+    # downward edges u -> v (rank[u] > rank[v]) stored at v, so the
+    # backward search walks them from v to the higher-ranked u
+    'down_offsets', 'down_sources', 'down_weights', 'down_middle',
+]
+
+# nodes a witness search may settle before giving up, more means fewer
+# shortcuts but slower preprocessing
+WITNESS_SETTLE_LIMIT = 60
+# seconds before looking for a hierarchy again after failing to load one
+CH_RETRY = float(os.environ.get("CH_RETRY", 60))
+
+
+class ContractionHierarchy:
+    """Upward/downward CSR graphs and node ranks of a contracted graph.
+
+    A middle of -1 marks an original edge, anything else is the node a
+    shortcut was created for, used to unpack it back into original edges.
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.rank = arrays['rank']
+
+    # plain lists for the pure-Python query loop, built on the first query
+    # like CompiledGraph's, so only the processes that search hold a copy
+    @cached_property
+    def up_offsets(self):
+        return self.arrays['up_offsets'].tolist()
+
+    @cached_property
+    def up_targets(self):
+        return self.arrays['up_targets'].tolist()
+
+    @cached_property
+    def up_weights(self):
+        return self.arrays['up_weights'].tolist()
+
+    @cached_property
+    def up_middle(self):
+        return self.arrays['up_middle'].tolist()
+
+    @cached_property
+    def down_offsets(self):
+        return self.arrays['down_offsets'].tolist()
+
+    @cached_property
+    def down_sources(self):
+        return self.arrays['down_sources'].tolist()
+
+    @cached_property
+    def down_weights(self):
+        return self.arrays['down_weights'].tolist()
+
+    @cached_property
+    def down_middle(self):
+        return self.arrays['down_middle'].tolist()
+
+    @cached_property
+    def rank_list(self):
+        return self.rank.tolist()
+
+    def query(self, source, target):
+        """Shortest (distance, dense path) from source to target.
+
+        Returns (inf, None) when target can't be reached. The search stops a
+        direction once its smallest key is no better than the best meeting
+        cost found so far.
+        """
+        if source == target:
+            return 0.0, [source]
+
+        up_offsets, up_targets, up_weights = self.up_offsets, self.up_targets, self.up_weights
+        down_offsets, down_sources, down_weights = self.down_offsets, self.down_sources, self.down_weights
+
+        dist = ({source: 0.0}, {target: 0.0})
+        parent = ({source: None}, {target: None})
+        queues = ([(0.0, source)], [(0.0, target)])
+        settled = (set(), set())
+        best, meeting = float('inf'), None
+
+        while queues[0] or queues[1]:
+            # alternate, skipping a direction that is empty or already done
+            for side in (0, 1):
+                queue = queues[side]
+                if not queue or queue[0][0] >= best:
+                    queue.clear()
+                    continue
+                d, node = heapq.heappop(queue)
+                if node in settled[side]:
+                    continue
+                settled[side].add(node)
+
+                other = dist[1 - side].get(node)
+                if other is not None and d + other < best:
+                    best, meeting = d + other, node
+
+                if side == 0:
+                    edges = range(up_offsets[node], up_offsets[node + 1])
+                    neighbors, weights = up_targets, up_weights
+                else:
+                    edges = range(down_offsets[node], down_offsets[node + 1])
+                    neighbors, weights = down_sources, down_weights
+
+                own_dist, own_parent = dist[side], parent[side]
+                for edge in edges:
+                    neighbor = neighbors[edge]
+                    nd = d + weights[edge]
+                    if nd < own_dist.get(neighbor, float('inf')):
+                        own_dist[neighbor] = nd
+                        own_parent[neighbor] = node
+                        heapq.heappush(queue, (nd, neighbor))
+
+        if meeting is None:
+            return float('inf'), None
+
+        # hierarchy path: source .. meeting .. target
+        forward = []
+        node = meeting
+        while node is not None:
+            forward.append(node)
+            node = parent[0][node]
+        forward.reverse()
+        node = parent[1][meeting]
+        while node is not None:
+            forward.append(node)
+            node = parent[1][node]
+
+        path = [source]
+        for u, v in zip(forward[:-1], forward[1:]):
+            path.extend(self._unpack(u, v)[1:])
+        return best, path
+
+    def _middle(self, u, v):
+        """Middle node of the hierarchy edge u -> v (-1 for original edges)."""
+        if self.rank_list[u] < self.rank_list[v]:
+            for edge in range(self.up_offsets[u], self.up_offsets[u + 1]):
+                if self.up_targets[edge] == v:
+                    return self.up_middle[edge]
+        else:
+            for edge in range(self.down_offsets[v], self.down_offsets[v + 1]):
+                if self.down_sources[edge] == u:
+                    return self.down_middle[edge]
+        raise KeyError((u, v))
+
+    def _unpack(self, u, v):
+        """Original-graph node sequence for the hierarchy edge u -> v."""
+        path = [u]
+        stack = [(u, v)]
+        while stack:
+            a, b = stack.pop()
+            middle = self._middle(a, b)
+            if middle < 0:
+                path.append(b)
+            else:
+                # expand a -> middle first, so push it last
+                stack.append((middle, b))
+                stack.append((a, middle))
+        return path
+
+
+def build_ch(graph, settle_limit=WITNESS_SETTLE_LIMIT, verbose=False):
+    """Contract a CompiledGraph and return its ContractionHierarchy."""
+    n = len(graph)
+    offsets, targets, weights = graph.offsets_list, graph.targets_list, graph.weights_list
+
+    # remaining graph as dicts: out_edges[u][v] = weight, in_edges[v][u] = weight
+    out_edges = [{} for _ in range(n)]
+    in_edges = [{} for _ in range(n)]
+    for u in range(n):
+        for edge in range(offsets[u], offsets[u + 1]):
+            v, w = targets[edge], weights[edge]
+            if u != v and w < out_edges[u].get(v, float('inf')):
+                out_edges[u][v] = w
+                in_edges[v][u] = w
+    # (u, v) -> contracted node for shortcut edges
+    middle = {}
+
+    def witness_search(source, excluded, max_cost):
+        """Distances from source avoiding excluded, up to max_cost."""
+        dist = {source: 0.0}
+        queue = [(0.0, source)]
+        settled = 0
+        while queue and settled < settle_limit:
+            d, node = heapq.heappop(queue)
+            if d > max_cost:
+                break
+            if d > dist[node]:
+                continue
+            settled += 1
+            for neighbor, w in out_edges[node].items():
+                nd = d + w
+                if neighbor != excluded and nd < dist.get(neighbor, float('inf')):
+                    dist[neighbor] = nd
+                    heapq.heappush(queue, (nd, neighbor))
+        return dist
+
+    def shortcuts(v):
+        """Shortcuts needed to contract v, as (u, w, weight)."""
+        needed = []
+        for u, w_in in in_edges[v].items():
+            candidates = [(w, w_in + w_out) for w, w_out in out_edges[v].items() if w != u]
+            if not candidates:
+                continue
+            dist = witness_search(u, v, max(cost for _, cost in candidates))
+            for w, cost in candidates:
+                if dist.get(w, float('inf')) > cost:
+                    needed.append((u, w, cost))
+        return needed
+
+    deleted_neighbors = [0] * n
+
+    def priority(v, needed):
+        # edge difference, plus a term that spreads contraction evenly
+        # over the graph instead of eating into one region
+        return 2 * (len(needed) - len(in_edges[v]) - len(out_edges[v])) + deleted_neighbors[v]
+
+    queue = [(priority(v, shortcuts(v)), v) for v in range(n)]
+    heapq.heapify(queue)
+
+    rank = np.zeros(n, dtype=np.int64)
+    up = [None] * n
+    down = [None] * n
+    contracted = bytearray(n)
+    order = 0
+    start = time.perf_counter()
+
+    while queue:
+        _, v = heapq.heappop(queue)
+        if contracted[v]:
+            continue
+        # lazy update: neighbours' priorities aren't recomputed after each
+        # contraction (that dominates the build time for little gain), so
+        # re-check v's before committing to it
+        needed = shortcuts(v)
+        current = priority(v, needed)
+        if queue and current > queue[0][0]:
+            heapq.heappush(queue, (current, v))
+            continue
+
+        rank[v] = order
+        order += 1
+        contracted[v] = 1
+
+        # every remaining neighbour ranks higher than v
+        up[v] = [(w, cost, middle.get((v, w), -1)) for w, cost in out_edges[v].items()]
+        down[v] = [(u, cost, middle.get((u, v), -1)) for u, cost in in_edges[v].items()]
+
+        neighbors = set(out_edges[v]) | set(in_edges[v])
+        for w in out_edges[v]:
+            del in_edges[w][v]
+        for u in in_edges[v]:
+            del out_edges[u][v]
+        out_edges[v] = {}
+        in_edges[v] = {}
+
+        for u, w, cost in needed:
+            if cost < out_edges[u].get(w, float('inf')):
+                out_edges[u][w] = cost
+                in_edges[w][u] = cost
+                middle[(u, w)] = v
+
+        for neighbor in neighbors:
+            deleted_neighbors[neighbor] += 1
+
+        if verbose and order % 10000 == 0:
+            logger.info("contracted %d/%d nodes in %.0fs", order, n, time.perf_counter() - start)
+
+    return ContractionHierarchy(_to_arrays(rank, up, down))
+
+
+def _to_arrays(rank, up, down):
+    def csr(lists):
+        offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(edges) for edges in lists])
+        flat = [edge for edges in lists for edge in edges]
+        nodes = np.array([edge[0] for edge in flat], dtype=np.int64)
+        costs = np.array([edge[1] for edge in flat], dtype=np.float64)
+        middles = np.array([edge[2] for edge in flat], dtype=np.int64)
+        return offsets, nodes, costs, middles
+
+    up_offsets, up_targets, up_weights, up_middle = csr(up)
+    down_offsets, down_sources, down_weights, down_middle = csr(down)
+    return {
+        'rank': rank,
+        'up_offsets': up_offsets, 'up_targets': up_targets,
+        'up_weights': up_weights, 'up_middle': up_middle,
+        'down_offsets': down_offsets, 'down_sources': down_sources,
+        'down_weights': down_weights, 'down_middle': down_middle,
+    }
+
+
+def save_ch(ch, snapshot, path=SNAPSHOT_PATH):
+    """Write the hierarchy next to the snapshot it was built from."""
+    for name in CH_ARRAYS:
+        np.save(os.path.join(path, 'ch_' + name + '.npy'), ch.arrays[name])
+    # written last, and tied to the snapshot so a rebuilt graph invalidates it
+    with open(os.path.join(path, 'ch.json'), 'w') as f:
+        json.dump({'version': CH_VERSION, 'snapshot_created': snapshot.meta['created']}, f, indent=2)
+
+
+def load_ch(snapshot, path=SNAPSHOT_PATH):
+    """The hierarchy stored with this snapshot, raising SnapshotError if unusable."""
+    meta_path = os.path.join(path, 'ch.json')
+    if not os.path.exists(meta_path):
+        raise SnapshotError(f"No contraction hierarchy at {path}")
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get('version') != CH_VERSION or meta.get('snapshot_created') != snapshot.meta['created']:
+        raise SnapshotError(f"Contraction hierarchy at {path} is outdated, rebuild it")
+    try:
+        arrays = {name: np.load(os.path.join(path, 'ch_' + name + '.npy'), mmap_mode='r')
+                  for name in CH_ARRAYS}
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"Incomplete contraction hierarchy at {path}: {e}")
+    if len(arrays['rank']) != len(snapshot.compiled):
+        raise SnapshotError(f"Contraction hierarchy at {path} doesn't match the snapshot, rebuild it")
+    return ContractionHierarchy(arrays)
+
+
+_hierarchies = {}
+# path -> time.monotonic() of the last failed load
+_failed_at = {}
+_hierarchies_lock = threading.Lock()
+
+def get_ch(snapshot, path=SNAPSHOT_PATH):
+    """The hierarchy for the snapshot at path, or None if it hasn't been built.
+
+    Unlike get_snapshot() this never builds anything, contracting a city
+    takes minutes and belongs in the offline step. Only a loaded hierarchy
+    is kept; after a failed load the next try is CH_RETRY seconds later,
+    so one built while the server runs is picked up without a restart.
+    """
+    with _hierarchies_lock:
+        if path in _hierarchies:
+            return _hierarchies[path]
+        failed_at = _failed_at.get(path)
+        if failed_at is not None and time.monotonic() - failed_at < CH_RETRY:
+            return None
+        try:
+            ch = _hierarchies[path] = load_ch(snapshot, path)
+        except SnapshotError as e:
+            if failed_at is None:
+                logger.warning("%s, routing without it", e)
+            _failed_at[path] = time.monotonic()
+            return None
+        _failed_at.pop(path, None)
+        return ch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the contraction hierarchy for a graph snapshot.")
+    parser.add_argument('--path', default=SNAPSHOT_PATH, help="snapshot directory")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    snapshot = load_snapshot(args.path)
+    start = time.perf_counter()
+    ch = build_ch(snapshot.compiled, verbose=True)
+    save_ch(ch, snapshot, args.path)
+    shortcuts = int((ch.arrays['up_middle'] >= 0).sum() + (ch.arrays['down_middle'] >= 0).sum())
+    logger.info("Built contraction hierarchy (%d shortcuts) in %.1fs", shortcuts, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+# compiled_graph.py
+from functools import cached_property
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from utils import haversine_many
+
+# Earth's radius in metres, matches utils.haversine
+EARTH_RADIUS = 6371000
+
+
+class CompiledGraph:
+    """Read-only CSR copy of the road network used by the search kernel.
+
+    Node IDs are remapped to dense ints (sorted by OSM ID) and each directed
+    neighbour pair keeps a single edge weighted by its shortest parallel edge.
+    """
+
+    def __init__(self, node_ids, offsets, targets, weights, lat, lon,
+                 landmark_from=None, landmark_to=None):
+        # dense index -> OSM node id
+        self.node_ids = node_ids
+        # edges of node i are targets[offsets[i]:offsets[i + 1]]
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        # coordinates in degrees, indexed by dense id
+        self.lat = lat
+        self.lon = lon
+        # ALT distance tables, (nodes, landmarks), see landmarks.py
+        self.landmark_from = landmark_from
+        self.landmark_to = landmark_to
+
+        # reference latitude for project()
+        self._lat0 = float(np.radians(lat.mean())) if len(lat) else 0.0
+        # built on first use
+        self._kdtree = None
+
+    # Everything below is derived per process on first use. The arrays
+    # above may be memory-mapped and shared through the page cache, these
+    # are private copies, so only processes that run the search kernel
+    # (the routing workers, or the web process with ROUTING_WORKERS=0 and
+    # for route sessions) should touch them.
+
+    # precomputed for the haversine heuristic
+    @cached_property
+    def lat_rad(self):
+        return np.radians(self.lat)
+
+    @cached_property
+    def lon_rad(self):
+        return np.radians(self.lon)
+
+    @cached_property
+    def cos_lat(self):
+        return np.cos(self.lat_rad)
+
+    # reverse adjacency for backward searches: the edges into node i are
+    # forward CSR edges reverse_edges[reverse_offsets[i]:reverse_offsets[i + 1]]
+    # coming from reverse_sources[...] over the same range
+    @cached_property
+    def reverse_edges(self):
+        return np.argsort(self.targets, kind='stable')
+
+    @cached_property
+    def reverse_sources(self):
+        sources = np.repeat(np.arange(len(self.node_ids), dtype=np.int64), np.diff(self.offsets))
+        return sources[self.reverse_edges]
+
+    @cached_property
+    def reverse_offsets(self):
+        reverse_offsets = np.zeros(len(self.node_ids) + 1, dtype=np.int64)
+        reverse_offsets[1:] = np.cumsum(np.bincount(self.targets, minlength=len(self.node_ids)))
+        return reverse_offsets
+
+    # plain-list mirrors of the arrays the pure-Python search loop reads
+    # per edge, indexing numpy arrays one scalar at a time is several
+    # times slower
+    @cached_property
+    def offsets_list(self):
+        return self.offsets.tolist()
+
+    @cached_property
+    def targets_list(self):
+        return self.targets.tolist()
+
+    @cached_property
+    def weights_list(self):
+        return self.weights.tolist()
+
+    @cached_property
+    def lat_rad_list(self):
+        return self.lat_rad.tolist()
+
+    @cached_property
+    def lon_rad_list(self):
+        return self.lon_rad.tolist()
+
+    @cached_property
+    def cos_lat_list(self):
+        return self.cos_lat.tolist()
+
+    @cached_property
+    def reverse_offsets_list(self):
+        return self.reverse_offsets.tolist()
+
+    @cached_property
+    def reverse_sources_list(self):
+        return self.reverse_sources.tolist()
+
+    @cached_property
+    def reverse_edges_list(self):
+        return self.reverse_edges.tolist()
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def __contains__(self, node):
+        return self.index_of(node) >= 0
+
+    def project(self, lat, lon):
+        """Equirectangular projection to metres around the graph's mean latitude.
+
+        Good to well under a metre per 100 m across the valley, callers that
+        need exact distances re-check candidates with haversine.
+        """
+        x = EARTH_RADIUS * np.radians(lon) * np.cos(self._lat0)
+        y = EARTH_RADIUS * np.radians(lat)
+        return np.column_stack([np.atleast_1d(x), np.atleast_1d(y)])
+
+    def kdtree(self):
+        """cKDTree over projected node coordinates, built on first use."""
+        if self._kdtree is None:
+            self._kdtree = cKDTree(self.project(self.lat, self.lon))
+        return self._kdtree
+
+    def nearest(self, lat, lon):
+        """Nearest node to each point: (dense indices, distances in metres).
+
+        lat and lon may be scalars or arrays; results are always arrays.
+        """
+        _, indices = self.kdtree().query(self.project(lat, lon))
+        distances = 1000 * haversine_many(self.lat[indices], self.lon[indices], lat, lon)
+        return indices, np.atleast_1d(distances)
+
+    def index_of(self, node):
+        """Dense index of an OSM node id, or -1 if the graph doesn't have it."""
+        # node_ids is sorted, so a binary search replaces a per-worker dict
+        i = int(np.searchsorted(self.node_ids, node))
+        if i < len(self.node_ids) and self.node_ids[i] == node:
+            return i
+        return -1
+
+    def to_index(self, nodes):
+        """Dense indices of the given OSM node ids, silently dropping unknown ones."""
+        nodes = np.fromiter(nodes, dtype=np.int64)
+        i = np.minimum(np.searchsorted(self.node_ids, nodes), max(len(self.node_ids) - 1, 0))
+        return set(i[self.node_ids[i] == nodes].tolist())
+
+    def to_dense(self, nodes):
+        """Dense indices for a sequence of OSM node ids that are all in the graph."""
+        return np.searchsorted(self.node_ids, np.asarray(nodes, dtype=np.int64)).tolist()
+
+    def to_node_ids(self, indices):
+        """OSM node ids for a sequence (or array) of dense indices."""
+        return self.node_ids[np.asarray(indices, dtype=np.int64)].tolist()
+
+    def edge_endpoints(self, edges):
+        """(n, 2) array of dense (u, v) for a sequence of CSR edge indices."""
+        edges = np.asarray(edges, dtype=np.int64)
+        sources = np.searchsorted(self.offsets, edges, side='right') - 1
+        return np.column_stack([sources, self.targets[edges]])
+
+    def incident_edges(self, node):
+        """CSR edge indices of the edges out of and into a dense node."""
+        start, end = int(self.reverse_offsets[node]), int(self.reverse_offsets[node + 1])
+        return list(range(int(self.offsets[node]), int(self.offsets[node + 1]))) \
+            + self.reverse_edges[start:end].tolist()
+
+    def edge_index(self, u, v):
+        """CSR edge index of the edge from dense node u to v, or -1."""
+        # on the arrays, the search loops that need this per edge have lists
+        targets = self.targets
+        for edge in range(int(self.offsets[u]), int(self.offsets[u + 1])):
+            if targets[edge] == v:
+                return edge
+        return -1
+
+    def path_edges(self, path):
+        """CSR edge index of every step of a dense path, -1 where there is no edge."""
+        path = np.asarray(path, dtype=np.int64)
+        if len(path) < 2:
+            return np.zeros(0, dtype=np.int64)
+        sources, targets = path[:-1], path[1:]
+        starts = self.offsets[sources]
+        counts = self.offsets[sources + 1] - starts
+        # every edge out of every source, tagged with the step it belongs to
+        step = np.repeat(np.arange(len(sources)), counts)
+        candidates = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - starts, counts)
+        match = self.targets[candidates] == targets[step]
+        edges = np.full(len(sources), -1, dtype=np.int64)
+        # one edge per neighbour pair, so at most one match per step
+        edges[step[match]] = candidates[match]
+        return edges
+
+def compile_graph(graph):
+    """Build a CompiledGraph from an osmnx MultiDiGraph."""
+    node_ids = np.array(sorted(graph.nodes), dtype=np.int64)
+    index = {node: i for i, node in enumerate(node_ids.tolist())}
+
+    offsets = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    targets = []
+    weights = []
+
+    for i, node in enumerate(node_ids.tolist()):
+        # graph.adj keeps the same neighbour order as graph.neighbors()
+        for neighbor, edge_data in graph.adj[node].items():
+            # keep only the minimum weight over parallel edges
+            edge_weight = min(edge.get('length', float('inf')) for edge in edge_data.values())
+            if edge_weight == float('inf'):
+                continue
+            targets.append(index[neighbor])
+            weights.append(edge_weight)
+        offsets[i + 1] = len(targets)
+
+    lat = np.array([graph.nodes[node]['y'] for node in node_ids.tolist()], dtype=np.float64)
+    lon = np.array([graph.nodes[node]['x'] for node in node_ids.tolist()], dtype=np.float64)
+
+    return CompiledGraph(
+        node_ids,
+        offsets,
+        np.array(targets, dtype=np.int64),
+        np.array(weights, dtype=np.float64),
+        lat,
+        lon,
+    )
@@ -0,0 +1,83 @@
+# distance_matrix.py
+"""Road distances between many sources and many targets.
+
+Runs one Dijkstra per row or per column, whichever side is smaller (columns
+search the reverse edges from each target), and each search stops as soon
+as every node on the other side is settled. Picking the nearest of a few
+dozen hospitals is then one search instead of one per hospital.
+"""
+import heapq
+
+
+def one_to_many(graph, root, goals, obstacles, reverse=False):
+    """Dijkstra from root until every reachable goal is settled.
+
+    Returns (dist, parent) for the settled nodes; with reverse=True the
+    search follows incoming edges, so dist is the distance to root and
+    parent the next node towards it.
+    """
+    if reverse:
+        offsets, neighbors, edge_ids = graph.reverse_offsets_list, graph.reverse_sources_list, graph.reverse_edges_list
+    else:
+        offsets, neighbors, edge_ids = graph.offsets_list, graph.targets_list, None
+    weights = obstacles.edge_weights(graph)
+    edge_blocked = obstacles.edge_blocked
+
+    remaining = set(goals)
+    tentative = {root: 0.0}
+    dist, parent = {}, {root: None}
+    queue = [(0.0, root)]
+
+    while queue and remaining:
+        d, node = heapq.heappop(queue)
+        if node in dist:
+            continue
+        dist[node] = d
+        remaining.discard(node)
+
+        for position in range(offsets[node], offsets[node + 1]):
+            edge = position if edge_ids is None else edge_ids[position]
+            neighbor = neighbors[position]
+            if edge_blocked[edge] or neighbor in dist:
+                continue
+            nd = d + weights[edge]
+            if nd < tentative.get(neighbor, float('inf')):
+                tentative[neighbor] = nd
+                parent[neighbor] = node
+                heapq.heappush(queue, (nd, neighbor))
+
+    return dist, parent
+
+
+def distance_matrix(graph, sources, targets, obstacles, with_paths=False):
+    """Distances (and optionally dense paths) from every source to every target.
+
+    Returns (distances, paths) as lists of rows, one per source, with None
+    where there is no route (or an endpoint is an obstacle); paths is None
+    unless with_paths is set. Distances include the soft obstacles'
+    multipliers, so they are plain metres only without those.
+    """
+    distances = [[None] * len(targets) for _ in sources]
+    paths = [[None] * len(targets) for _ in sources] if with_paths else None
+    by_rows = len(sources) <= len(targets)
+
+    roots, goals = (sources, targets) if by_rows else (targets, sources)
+    open_goals = [goal for goal in goals if goal not in obstacles]
+
+    for r, root in enumerate(roots):
+        if root in obstacles:
+            continue
+        dist, parent = one_to_many(graph, root, open_goals, obstacles, reverse=not by_rows)
+        for g, goal in enumerate(goals):
+            if goal not in dist:
+                continue
+            i, j = (r, g) if by_rows else (g, r)
+            distances[i][j] = dist[goal]
+            if with_paths:
+                path = [goal]
+                while path[-1] != root:
+                    path.append(parent[path[-1]])
+                # parents lead back to the source on rows, on to the target on columns
+                paths[i][j] = path[::-1] if by_rows else path
+
+    return distances, paths
@@ -0,0 +1,120 @@
+# landmarks.py
+"""ALT (A*, landmarks, triangle inequality) lower bounds for the search.
+
+A handful of landmarks spread around the edge of the network get full
+Dijkstra distance tables to and from every node. For any landmark L the
+triangle inequality gives
+
+    d(v, t) >= d(L, t) - d(L, v)    and    d(v, t) >= d(v, L) - d(t, L)
+
+and the best of these over all landmarks is an admissible, consistent A*
+heuristic in metres. Obstacles only remove nodes, so the bounds stay valid
+with obstacles in place. The tables are built with the snapshot.
+"""
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+LANDMARK_COUNT = 8
+
+# stands in for "unreachable" in the tables so bounds never become inf - inf,
+# far longer than any route in the valley
+UNREACHABLE = 1e9
+
+
+def adjacency_matrix(graph):
+    """scipy CSR matrix of a CompiledGraph, explicit zero-length edges included."""
+    n = len(graph)
+    return csr_matrix(
+        (np.asarray(graph.weights), np.asarray(graph.targets), np.asarray(graph.offsets)),
+        shape=(n, n),
+    )
+
+
+def select_landmarks(graph, count=LANDMARK_COUNT):
+    """Dense indices of `count` landmarks picked by farthest-point selection.
+
+    Starts from the node farthest from the centre of the network and keeps
+    adding the node farthest from every landmark chosen so far, ignoring
+    direction, which spreads them around the edge of the map.
+    """
+    n = len(graph)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    matrix = adjacency_matrix(graph)
+
+    centre = int(graph.nearest(float(np.mean(graph.lat)), float(np.mean(graph.lon)))[0][0])
+    nearest = dijkstra(matrix, directed=False, indices=centre)
+
+    landmarks = []
+    for _ in range(min(count, n)):
+        # nodes in other components are never picked
+        candidate = int(np.argmax(np.where(np.isinf(nearest), -1, nearest)))
+        if candidate in landmarks:
+            break
+        landmarks.append(candidate)
+        nearest = np.minimum(nearest, dijkstra(matrix, directed=False, indices=candidate))
+    return np.array(landmarks, dtype=np.int64)
+
+
+def landmark_tables(graph, landmarks):
+    """(landmark_from, landmark_to) arrays of shape (nodes, landmarks).
+
+    landmark_from[v, i] is the road distance from landmark i to v and
+    landmark_to[v, i] the distance from v to it, in metres, with
+    UNREACHABLE where there is no path. One row per node keeps the values
+    a heuristic call reads next to each other.
+    """
+    matrix = adjacency_matrix(graph)
+    if not len(landmarks):
+        empty = np.zeros((len(graph), 0), dtype=np.float64)
+        return empty, empty.copy()
+
+    from_landmark = dijkstra(matrix, indices=landmarks)
+    # distances to a landmark are distances from it on the reversed graph
+    to_landmark = dijkstra(matrix.T.tocsr(), indices=landmarks)
+
+    def table(distances):
+        return np.ascontiguousarray(np.where(np.isinf(distances), UNREACHABLE, distances).T)
+
+    return table(from_landmark), table(to_landmark)
+
+
+def landmark_arrays(graph, count=LANDMARK_COUNT):
+    """Snapshot arrays for the landmarks of a CompiledGraph."""
+    landmarks = select_landmarks(graph, count)
+    landmark_from, landmark_to = landmark_tables(graph, landmarks)
+    return {'landmarks': landmarks, 'landmark_from': landmark_from, 'landmark_to': landmark_to}
+
+
+def add_landmarks(graph, count=LANDMARK_COUNT):
+    """Compute landmark tables for a CompiledGraph built without a snapshot."""
+    arrays = landmark_arrays(graph, count)
+    graph.landmark_from = arrays['landmark_from']
+    graph.landmark_to = arrays['landmark_to']
+    return graph
+
+
+def landmark_heuristic(graph, goal, reverse=False):
+    """h(node): ALT lower bound in metres on the road distance node -> goal.
+
+    With reverse=True it bounds goal -> node instead, which is what a
+    backward search towards the source needs on a one-way network.
+    """
+    landmark_from, landmark_to = graph.landmark_from, graph.landmark_to
+    if landmark_from is None or not landmark_from.shape[1]:
+        raise ValueError("Graph has no landmark tables")
+
+    from_goal = np.array(landmark_from[goal])
+    to_goal = np.array(landmark_to[goal])
+
+    if reverse:
+        def bound(node):
+            estimate = max((landmark_from[node] - from_goal).max(), (to_goal - landmark_to[node]).max())
+            return float(estimate) if estimate > 0 else 0.0
+    else:
+        def bound(node):
+            estimate = max((from_goal - landmark_from[node]).max(), (landmark_to[node] - to_goal).max())
+            return float(estimate) if estimate > 0 else 0.0
+
+    return bound
@@ -0,0 +1,114 @@
+# local_supabase.py
+"""In-memory stand-in for the parts of the Supabase client the server uses.
+
+Set SUPABASE_LOCAL=1 to run the server against it without network access,
+or pass a LocalSupabase to code that takes a client. Only table queries are
+supported (select/insert/update/delete with eq and single), not auth.
+"""
+import datetime
+import itertools
+import threading
+
+
+class LocalResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class LocalQuery:
+    """Chainable query over one table, run by execute()."""
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.action = 'select'
+        self.columns = None
+        self.payload = None
+        self.filters = []
+        self.is_single = False
+
+    def select(self, *columns):
+        self.action = 'select'
+        # '*' and embedded relations like 'profiles(full_name)' return whole rows
+        names = [c.strip() for column in columns for c in column.split(',')]
+        if all(name.isidentifier() for name in names):
+            self.columns = names
+        return self
+
+    def insert(self, row):
+        self.action = 'insert'
+        self.payload = row
+        return self
+
+    def update(self, values):
+        self.action = 'update'
+        self.payload = values
+        return self
+
+    def delete(self):
+        self.action = 'delete'
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, value))
+        return self
+
+    def single(self):
+        self.is_single = True
+        return self
+
+    def _matches(self, row):
+        return all(row.get(column) == value for column, value in self.filters)
+
+    def execute(self):
+        return self.db._execute(self)
+
+
+class LocalSupabase:
+    """Thread-safe in-memory tables keyed by name, each a list of row dicts."""
+
+    def __init__(self, tables=None):
+        self.tables = {name: [dict(row) for row in rows] for name, rows in (tables or {}).items()}
+        self._ids = itertools.count(1 + max(
+            (row.get('id', 0) for rows in self.tables.values() for row in rows
+             if isinstance(row.get('id'), int)), default=0))
+        self._lock = threading.Lock()
+        # number of executed queries per table, handy for checking caching
+        self.query_counts = {}
+
+    def table(self, name):
+        return LocalQuery(self, name)
+
+    def _execute(self, query):
+        with self._lock:
+            self.query_counts[query.table] = self.query_counts.get(query.table, 0) + 1
+            rows = self.tables.setdefault(query.table, [])
+
+            if query.action == 'insert':
+                new_rows = query.payload if isinstance(query.payload, list) else [query.payload]
+                inserted = []
+                for row in new_rows:
+                    row = dict(row)
+                    row.setdefault('id', next(self._ids))
+                    # the column default Supabase tables get
+                    row.setdefault('created_at', datetime.datetime.now(datetime.timezone.utc).isoformat())
+                    rows.append(row)
+                    inserted.append(dict(row))
+                return LocalResponse(inserted)
+
+            matched = [row for row in rows if query._matches(row)]
+
+            if query.action == 'update':
+                for row in matched:
+                    row.update(query.payload)
+            elif query.action == 'delete':
+                self.tables[query.table] = [row for row in rows if not query._matches(row)]
+
+            if query.columns:
+                data = [{column: row.get(column) for column in query.columns} for row in matched]
+            else:
+                data = [dict(row) for row in matched]
+
+            if query.is_single:
+                return LocalResponse(data[0] if len(data) == 1 else None)
+            return LocalResponse(data)
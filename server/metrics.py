@@ -0,0 +1,272 @@
+# metrics.py
+"""Counters, histograms and request phase timing for /metrics.
+
+Plain in-process metrics rendered in the Prometheus text format, so
+nothing beyond the standard library is needed. Updating a metric is a
+lock and a few additions; counts from the route searches are merged in by
+the web process from the stats the workers send back with each result.
+Collectors registered with register_collector() export numbers that are
+already kept elsewhere (cache and executor stats) when /metrics is
+scraped, instead of being counted twice.
+
+Setting PROFILE_SLOW_QUERIES (milliseconds) turns on a sampling profiler
+around every route search: a background thread samples the searching
+thread's stack every PROFILE_INTERVAL seconds, and searches slower than
+the threshold write their samples to PROFILE_DIR as collapsed stacks
+(one "frame;frame;frame count" line each, as flamegraph.pl and speedscope
+read them).
+"""
+import bisect
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# seconds, for request and phase latencies
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# node counts per search
+SIZE_BUCKETS = (10, 100, 1000, 5000, 10000, 50000, 100000, 500000)
+
+# searches slower than this many milliseconds dump a profile, 0 disables profiling
+PROFILE_SLOW_QUERIES = float(os.environ.get("PROFILE_SLOW_QUERIES", 0))
+# seconds between stack samples
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", 0.005))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "routing-profiles"))
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    """Monotonic count per label combination."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _label_text(self.labels, values), value) for values, value in self._values.items()]
+
+
+class Histogram:
+    """Bucketed observations with their sum and count, per label combination."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (the last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for values, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    labels = _label_text(self.labels + ('le',), values + (bound,))
+                    samples.append((self.name + '_bucket', labels, cumulative))
+                labels = _label_text(self.labels, values)
+                samples.append((self.name + '_sum', labels, total))
+                samples.append((self.name + '_count', labels, cumulative))
+        return samples
+
+
+_metrics = []
+_collectors = []
+
+
+def counter(name, documentation, labels=()):
+    metric = Counter(name, documentation, labels)
+    _metrics.append(metric)
+    return metric
+
+
+def histogram(name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+    metric = Histogram(name, documentation, labels, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(collector):
+    """Add a callable returning [(name, kind, documentation, [(labels dict, value), ...]), ...]."""
+    _collectors.append(collector)
+
+
+HTTP_REQUEST_SECONDS = histogram(
+    'routing_http_request_duration_seconds', 'Request latency by endpoint and status.', ('endpoint', 'status'))
+PHASE_SECONDS = histogram(
+    'routing_request_phase_duration_seconds', 'Time spent in each phase of a request.', ('endpoint', 'phase'))
+SEARCHES = counter(
+    'routing_searches_total', 'Route searches run, by algorithm and outcome.', ('algorithm', 'result'))
+SEARCH_SECONDS = histogram(
+    'routing_search_duration_seconds', 'Time in the search itself, measured in the worker.', ('algorithm',))
+SEARCH_SETTLED = histogram(
+    'routing_search_settled_nodes', 'Nodes settled per search.', ('algorithm',), SIZE_BUCKETS)
+SEARCH_MAX_HEAP = histogram(
+    'routing_search_max_heap_size', 'Largest open set per search.', ('algorithm',), SIZE_BUCKETS)
+# search counters summed over all searches, keyed like the search stats dict
+SEARCH_COUNTERS = {
+    'settled': counter('routing_search_nodes_settled_total', 'Nodes settled by route searches.'),
+    'popped': counter('routing_search_nodes_popped_total', 'Heap entries popped, stale ones included.'),
+    'relaxed': counter('routing_search_edges_relaxed_total', 'Edges looked at from settled nodes.'),
+    'pushes': counter('routing_search_heap_pushes_total', 'Heap pushes by route searches.'),
+    'heuristic_calls': counter('routing_search_heuristic_calls_total', 'Heuristic evaluations.'),
+}
+OBSTACLE_CHANGES = counter(
+    'routing_obstacle_changes_total', 'Obstacles reported and deleted through the API.', ('action',))
+
+
+def record_search(algorithm, path, stats):
+    """Count one finished route search from the stats dict it returned."""
+    SEARCHES.inc(1, algorithm, 'found' if path is not None else 'no_path')
+    if 'seconds' in stats:
+        SEARCH_SECONDS.observe(stats['seconds'], algorithm)
+    if 'settled' in stats:
+        SEARCH_SETTLED.observe(stats['settled'], algorithm)
+        SEARCH_MAX_HEAP.observe(stats['max_heap'], algorithm)
+    for key, metric in SEARCH_COUNTERS.items():
+        if key in stats:
+            metric.inc(stats[key])
+
+
+class PhaseTimer:
+    """Wall time per phase of one request.
+
+    phase() times a block, finish() records the phases and their total and
+    adds them to the response as a Server-Timing header.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.phases = []
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def add(self, name, seconds):
+        self.phases.append((name, seconds))
+
+    def finish(self, response):
+        total = time.perf_counter() - self._start
+        for name, seconds in self.phases:
+            PHASE_SECONDS.observe(seconds, self.endpoint, name)
+        PHASE_SECONDS.observe(total, self.endpoint, 'total')
+        timings = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.phases]
+        response.headers['Server-Timing'] = ', '.join(timings + [f'total;dur={total * 1000:.2f}'])
+        return response
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(f'{name}{labels} {value}' for name, labels, value in metric.samples())
+    for collector in _collectors:
+        for name, kind, documentation, samples in collector():
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_label_text(tuple(labels), tuple(labels.values()))} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack on a timer, as collapsed stack counts."""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.counts.items(), key=lambda item: -item[1]):
+                f.write(f'{stack} {count}\n')
+
+
+@contextmanager
+def profiled(label, threshold_ms=None):
+    """Sample the calling thread while the block runs, dumping the profile if it was slow.
+
+    Does nothing unless PROFILE_SLOW_QUERIES (or threshold_ms) is set.
+    """
+    threshold_ms = PROFILE_SLOW_QUERIES if threshold_ms is None else threshold_ms
+    if threshold_ms <= 0:
+        yield
+        return
+
+    profiler = SamplingProfiler(threading.get_ident())
+    start = time.perf_counter()
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms >= threshold_ms and profiler.counts:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            name = f'{time.strftime("%Y%m%dT%H%M%S")}-{os.getpid()}-{label}-{elapsed_ms:.0f}ms.folded'
+            profiler.dump(os.path.join(PROFILE_DIR, name))
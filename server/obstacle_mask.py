@@ -0,0 +1,181 @@
+# obstacle_mask.py
+"""Obstacles compiled into flat lookup tables over a CompiledGraph.
+
+An ObstacleMask has one byte per dense node and one per CSR edge. A
+blocked node blocks every edge into and out of it, so the search kernels
+skip blocked roads with a single edge_blocked[edge] read and only look at
+node_blocked for the two endpoints. A report in the middle of a road
+blocks just that road (both directions) rather than the whole
+intersection next to it, see locate_obstacle().
+
+Soft obstacles don't block, they multiply the weight of the edges they
+are on; edge_weights() is the graph's weight list with those multipliers
+applied, so the kernels still read one list entry per edge. Weights only
+ever go up, so the A* and ALT lower bounds stay valid.
+
+Masks are never changed in place: updated() copies the tables and flips
+only the entries that differ, so a search running on the old mask is
+unaffected. Pickled, a mask is just its sets; a worker process patches
+the last mask it saw instead of rebuilding the tables per request.
+"""
+import math
+import os
+import threading
+
+from utils import haversine
+
+# reports within this many metres of their node block the node (and with
+# it the intersection), further out they block the nearest road
+OBSTACLE_NODE_RADIUS = float(os.environ.get("OBSTACLE_NODE_RADIUS", 15))
+# reports further than this from any road fall back to their node
+OBSTACLE_EDGE_RADIUS = float(os.environ.get("OBSTACLE_EDGE_RADIUS", 50))
+
+
+class ObstacleMask:
+    """Blocked dense nodes and CSR edges, as frozensets and byte tables.
+
+    nodes are the blocked nodes and edges every blocked edge, including
+    the ones around blocked nodes. factors maps CSR edges under a soft
+    obstacle to their weight multiplier. version is whatever the owner
+    uses to tell masks apart (the ObstacleStore version). Treat it as
+    read-only.
+    """
+
+    def __init__(self, node_count, edge_count, nodes=frozenset(), edges=frozenset(), factors=None,
+                 version=0):
+        self.nodes = frozenset(nodes)
+        self.edges = frozenset(edges)
+        self.factors = dict(factors or {})
+        self.version = version
+        self.node_blocked = bytearray(node_count)
+        self.edge_blocked = bytearray(edge_count)
+        for node in self.nodes:
+            self.node_blocked[node] = 1
+        for edge in self.edges:
+            self.edge_blocked[edge] = 1
+        # built by edge_weights() on first use
+        self._base_weights = None
+        self._weights = None
+
+    @classmethod
+    def for_graph(cls, graph, nodes=(), edges=(), factors=None, version=0):
+        """Mask over graph blocking these dense nodes and CSR edges."""
+        nodes = frozenset(nodes)
+        return cls(len(graph), len(graph.targets), nodes,
+                   blocked_edges(graph, nodes, edges), factors, version)
+
+    def edge_weights(self, graph):
+        """graph.weights_list with the soft obstacle multipliers applied.
+
+        Like the list itself, the weighted copy is built on first use, in
+        the process that runs the search.
+        """
+        if not self.factors:
+            return graph.weights_list
+        if self._weights is None:
+            weights = list(graph.weights_list)
+            for edge, factor in self.factors.items():
+                weights[edge] *= factor
+            self._base_weights, self._weights = graph.weights_list, weights
+        return self._weights
+
+    def updated(self, nodes, edges, factors, version):
+        """A copy with exactly these blocked nodes and edges and soft factors.
+
+        Only the entries that changed are written after the copy, so the
+        cost is one memcpy per table plus the size of the change.
+        """
+        mask = ObstacleMask.__new__(ObstacleMask)
+        mask.nodes = frozenset(nodes)
+        mask.edges = frozenset(edges)
+        mask.factors = dict(factors or {})
+        mask.version = version
+        mask.node_blocked = bytearray(self.node_blocked)
+        mask.edge_blocked = bytearray(self.edge_blocked)
+        mask._base_weights = mask._weights = None
+        for node in self.nodes - mask.nodes:
+            mask.node_blocked[node] = 0
+        for node in mask.nodes - self.nodes:
+            mask.node_blocked[node] = 1
+        for edge in self.edges - mask.edges:
+            mask.edge_blocked[edge] = 0
+        for edge in mask.edges - self.edges:
+            mask.edge_blocked[edge] = 1
+
+        # patch the weighted list too if this one has been built already
+        if self._weights is not None and mask.factors:
+            base = self._base_weights
+            weights = list(self._weights)
+            for edge in self.factors.keys() | mask.factors.keys():
+                if self.factors.get(edge) != mask.factors.get(edge):
+                    weights[edge] = base[edge] * mask.factors.get(edge, 1.0)
+            mask._base_weights, mask._weights = base, weights
+        return mask
+
+    def __contains__(self, node):
+        return self.node_blocked[node] == 1
+
+    def __bool__(self):
+        return bool(self.edges or self.nodes or self.factors)
+
+    def __reduce__(self):
+        # ship the sets, not the tables
+        return _restore, (len(self.node_blocked), len(self.edge_blocked), self.nodes, self.edges,
+                          self.factors, self.version)
+
+
+# last mask unpickled in this process, the next one is patched from it
+_restored = None
+_restored_lock = threading.Lock()
+
+def _restore(node_count, edge_count, nodes, edges, factors, version):
+    global _restored
+    with _restored_lock:
+        last = _restored
+        if last is None or len(last.node_blocked) != node_count or len(last.edge_blocked) != edge_count:
+            mask = ObstacleMask(node_count, edge_count, nodes, edges, factors, version)
+        elif last.version == version and last.nodes == nodes and last.edges == edges \
+                and last.factors == factors:
+            return last
+        else:
+            mask = last.updated(nodes, edges, factors, version)
+        _restored = mask
+        return mask
+
+
+def blocked_edges(graph, nodes, edges=()):
+    """edges plus every CSR edge into or out of the given dense nodes."""
+    blocked = set(edges)
+    for node in nodes:
+        blocked.update(graph.incident_edges(node))
+    return frozenset(blocked)
+
+
+def locate_obstacle(snapshot, node_id, lat=None, lon=None):
+    """What one obstacle report blocks: (dense nodes, CSR edges).
+
+    A report close to its node (or without usable coordinates) blocks the
+    node. Otherwise it blocks the nearest road to the reported point in
+    both directions, as long as that road is within OBSTACLE_EDGE_RADIUS.
+    Reports that match nothing in the graph block nothing.
+    """
+    compiled = snapshot.compiled
+    node = compiled.index_of(node_id) if node_id is not None else -1
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        lat = lon = math.nan
+    if not (math.isfinite(lat) and math.isfinite(lon)):
+        return (frozenset([node]) if node >= 0 else frozenset()), frozenset()
+
+    if node >= 0 and 1000 * haversine(float(compiled.lat[node]), float(compiled.lon[node]), lat, lon) \
+            <= OBSTACLE_NODE_RADIUS:
+        return frozenset([node]), frozenset()
+
+    edge, distance = snapshot.nearest_edge(lat, lon, near=node)
+    if edge < 0 or distance > OBSTACLE_EDGE_RADIUS:
+        return (frozenset([node]) if node >= 0 else frozenset()), frozenset()
+
+    u, v = compiled.edge_endpoints([edge])[0].tolist()
+    twin = compiled.edge_index(v, u)
+    return frozenset(), frozenset([edge, twin] if twin >= 0 else [edge])
@@ -0,0 +1,245 @@
+# obstacle_store.py
+import datetime
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+
+from obstacle_mask import ObstacleMask, blocked_edges, locate_obstacle
+
+# seconds before the store re-reads the obstacles table, this only matters
+# for changes made outside this process (other workers, the dashboard)
+OBSTACLE_TTL = float(os.environ.get("OBSTACLE_TTL", 30))
+# seconds before the first retry after a failed re-read, doubling with
+# every failure in a row up to OBSTACLE_TTL
+OBSTACLE_RETRY = float(os.environ.get("OBSTACLE_RETRY", 2))
+
+logger = logging.getLogger(__name__)
+
+# severities that only slow a road down, by this weight factor; every
+# other severity (High, Critical, missing or unknown) blocks it
+SEVERITY_FACTORS = {
+    "Low": 1.5,
+    "Moderate": 3.0,
+}
+
+# "H:M:S", "2 days 03:00:00" or "1 day", how Postgres returns intervals
+DURATION_PATTERN = re.compile(
+    r'^\s*(?:(\d+)\s*days?)?\s*(?:(\d+):(\d+)(?::(\d+(?:\.\d*)?))?)?\s*$'
+)
+
+
+def parse_duration(value):
+    """Seconds in an expected_duration interval, None for open-ended ones.
+
+    Numbers are taken as seconds. Zero, empty and unreadable durations
+    mean the obstacle stays until it is deleted.
+    """
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        match = DURATION_PATTERN.match(str(value or ''))
+        if not match or not any(match.groups()):
+            return None
+        days, hours, minutes, secs = (float(group or 0) for group in match.groups())
+        seconds = ((days * 24 + hours) * 60 + minutes) * 60 + secs
+    return seconds if seconds > 0 else None
+
+
+def parse_timestamp(value):
+    """Unix time of a created_at timestamp, None if it can't be read."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        stamp = datetime.datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    if stamp.tzinfo is None:
+        # Postgres timestamps without a zone are UTC
+        stamp = stamp.replace(tzinfo=datetime.timezone.utc)
+    return stamp.timestamp()
+
+
+class ObstacleStore:
+    """In-process copy of the active obstacles, compiled into an ObstacleMask.
+
+    Loaded on first use, updated directly by /save_obstacles and
+    /delete_obstacle and re-read from the database once the TTL expires.
+    Every row is resolved once to the node or road it covers (see
+    locate_obstacle()) and a change only flips the mask entries it
+    touches. Rows with an expected_duration expire created_at plus that
+    duration later: a heap keyed by expiry time drops them from the mask
+    as soon as current() sees they are due, without rescanning the rows.
+    Expired rows are left in the table, routing just never sees them.
+
+    current() returns (version, mask); the version goes up every time the
+    mask changes, so caches can key on it. Once the table has been read, a
+    failed re-read is logged and the last mask stays in use until a retry
+    succeeds; only the very first read raises.
+    """
+
+    def __init__(self, client, snapshot, ttl=OBSTACLE_TTL, clock=time.time, retry=OBSTACLE_RETRY):
+        self.client = client
+        # callable returning the GraphSnapshot, so the graph loads on first use
+        self.snapshot = snapshot
+        self.ttl = ttl
+        self.retry = retry
+        # failed re-reads, in total and since the last successful one
+        self.errors = 0
+        # rows left out of a re-read because they couldn't be read
+        self.skipped = 0
+        self._failures = 0
+        # wall clock, expiry times come from database timestamps
+        self.clock = clock
+        self.version = 0
+        # active obstacle row id -> ((node id, lat, lon), nodes, edges, factor, expires_at),
+        # factor None for a hard block and expires_at None when open-ended;
+        # several reports can cover the same node or road
+        self._rows = {}
+        # (expires_at, row id) for every active row that expires, entries
+        # for rows that were deleted or re-read since are skipped when popped
+        self._expiry = []
+        self._mask = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        """(version, ObstacleMask of the active obstacles), refreshing when stale."""
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded_at is None:
+                self._refresh()
+            elif now - self._loaded_at >= self.ttl:
+                try:
+                    self._refresh()
+                except Exception as e:
+                    self.errors += 1
+                    self._failures += 1
+                    delay = min(self.retry * 2 ** (self._failures - 1), self.ttl)
+                    # due again after delay rather than on the next request
+                    self._loaded_at = now - self.ttl + delay
+                    logger.warning("Re-reading obstacles failed, keeping version %d, retrying in %.1fs: %s",
+                                   self.version, delay, e)
+            if self._expiry and self._expiry[0][0] <= self.clock():
+                self._expire()
+            return self.version, self._mask
+
+    def refresh(self):
+        """Re-read the obstacles table now."""
+        with self._lock:
+            self._refresh()
+            return self.version, self._mask
+
+    def stats(self):
+        """Counts of the current mask, without refreshing it."""
+        with self._lock:
+            mask = self._mask
+            return {
+                'version': self.version,
+                'active': len(self._rows),
+                'errors': self.errors,
+                'skipped': self.skipped,
+                'blocked_nodes': len(mask.nodes) if mask is not None else 0,
+                'blocked_edges': len(mask.edges) if mask is not None else 0,
+                'slowed_edges': len(mask.factors) if mask is not None else 0,
+            }
+
+    def add(self, rows):
+        """Record inserted obstacle rows, as returned by the insert."""
+        with self._lock:
+            now = self.clock()
+            for row in rows:
+                self._add_row(row, now)
+            self._update()
+
+    def remove(self, obstacle_id):
+        """Forget the obstacle row with this id."""
+        with self._lock:
+            self._rows.pop(obstacle_id, None)
+            self._update()
+
+    def _add_row(self, row, now):
+        known = self._rows.get(row['id'])
+        duration = parse_duration(row.get('expected_duration'))
+        expires_at = None
+        if duration is not None:
+            created_at = parse_timestamp(row.get('created_at'))
+            if created_at is not None:
+                expires_at = created_at + duration
+            else:
+                # without created_at the clock starts when the row is first seen
+                expires_at = known[4] if known is not None and known[4] is not None else now + duration
+            if expires_at <= now:
+                self._rows.pop(row['id'], None)
+                return
+
+        report = (int(row['node_id']), row.get('latitude'), row.get('longitude'))
+        # rows only need resolving again when the report changed
+        if known is not None and known[0] == report:
+            nodes, edges = known[1], known[2]
+        else:
+            nodes, edges = locate_obstacle(self.snapshot(), *report)
+
+        factor = SEVERITY_FACTORS.get(str(row.get('severity') or '').strip().capitalize())
+        self._rows[row['id']] = (report, nodes, edges, factor, expires_at)
+        if expires_at is not None:
+            heapq.heappush(self._expiry, (expires_at, row['id']))
+
+    def _expire(self):
+        now = self.clock()
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, row_id = heapq.heappop(self._expiry)
+            row = self._rows.get(row_id)
+            # a re-read row may have a new expiry with its own heap entry
+            if row is not None and row[4] == expires_at:
+                del self._rows[row_id]
+        self._update()
+
+    def _refresh(self):
+        # a failed fetch raises and leaves the previous set in place
+        response = self.client.table('obstacles').select(
+            'id', 'node_id', 'latitude', 'longitude', 'expected_duration', 'severity', 'created_at'
+        ).execute()
+
+        now = self.clock()
+        known = self._rows
+        self._rows = {}
+        for row in response.data:
+            try:
+                if row['id'] in known:
+                    self._rows[row['id']] = known[row['id']]
+                self._add_row(row, now)
+            except (KeyError, TypeError, ValueError) as e:
+                # one unreadable row mustn't hide every other obstacle
+                self._rows.pop(row.get('id'), None)
+                self.skipped += 1
+                logger.warning("Skipping unreadable obstacle row %s: %s", row.get('id'), e)
+        # the heap only keeps entries for rows that are still active
+        self._expiry = [(row[4], row_id) for row_id, row in self._rows.items() if row[4] is not None]
+        heapq.heapify(self._expiry)
+        self._loaded_at = time.monotonic()
+        self._failures = 0
+        self._update()
+
+    def _update(self):
+        graph = self.snapshot().compiled
+        if self._mask is None:
+            self._mask = ObstacleMask.for_graph(graph, version=self.version)
+
+        hard = [row for row in self._rows.values() if row[3] is None]
+        nodes = frozenset(node for row in hard for node in row[1])
+        edges = blocked_edges(graph, nodes, (edge for row in hard for edge in row[2]))
+
+        # soft reports slow every edge they cover, the biggest factor wins
+        factors = {}
+        for _, row_nodes, row_edges, factor, _ in self._rows.values():
+            if factor is not None:
+                for edge in blocked_edges(graph, row_nodes, row_edges):
+                    if edge not in edges:
+                        factors[edge] = max(factor, factors.get(edge, 1.0))
+
+        if nodes != self._mask.nodes or edges != self._mask.edges or factors != self._mask.factors:
+            self.version += 1
+            self._mask = self._mask.updated(nodes, edges, factors, self.version)
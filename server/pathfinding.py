@@ -1,101 +1,215 @@
 # pathfinding.py
 import heapq
+from landmarks import landmark_heuristic
+from obstacle_mask import ObstacleMask
 from utils import heuristic
 
 def bidirectional_astar(graph, source, destination, obstacles):
-    """Bidirectional A* Algorithm with obstacle avoidance."""
+    """Bidirectional A* Algorithm with obstacle avoidance.
+
+    Runs on a CompiledGraph; source, destination and obstacles are OSM node
+    ids and the returned path and explored edges use OSM node ids as well.
+    """
 
     # first check if the source or destination nodes lies in the obstacle
     if source in obstacles or destination in obstacles:
         return None, []
 
-    #initialize a priority queue to explore in forward or backward direction
-    #initial priority is set to 0 (f-score)
-    #prioritized by f-score (estimated cost to reach the goal)
+    path, explored_edges = bidirectional_astar_dense(
+        graph, graph.index_of(source), graph.index_of(destination),
+        ObstacleMask.for_graph(graph, graph.to_index(obstacles))
+    )
+
+    #explored edges go back to OSM node id pairs in one vectorized lookup
+    explored_edges = [tuple(edge) for edge in graph.to_node_ids(graph.edge_endpoints(explored_edges))]
+    if path is None:
+        return None, explored_edges
+    return graph.to_node_ids(path), explored_edges
+
+# heuristics bidirectional_astar_dense() can use
+HEURISTICS = ('haversine', 'alt')
+
+def bidirectional_astar_dense(graph, source, destination, obstacles, track_explored=True,
+                              heuristic_type='haversine', stats=None):
+    """bidirectional_astar() on dense indices.
+
+    obstacles is an ObstacleMask over graph. Returns the path as dense
+    indices (None if there is none) and the explored edges as CSR edge
+    indices, which the snapshot can turn into coordinates by slicing.
+    With track_explored=False no explored edges are recorded at all.
+
+    The forward search follows edges out of the source and the backward
+    search follows edges into the destination, each with its own heap. Both
+    use the average of the two heuristics as potential, so the search can
+    stop as soon as the two smallest keys add up to at least mu, the
+    shortest meeting cost seen on any relaxed edge. The direction with the
+    smaller frontier goes next.
+
+    heuristic_type picks the lower bounds: 'haversine' is the straight-line
+    distance, 'alt' the landmark bounds (see landmarks.py). Neither looks
+    at the obstacles, which only block or slow down edges.
+
+    Both bounds stay valid under obstacles, since blocking or slowing an
+    edge only makes paths longer, so the path is a shortest one with either
+    heuristic.
+
+    A stats dict, if given, receives the nodes settled, edges relaxed, heap
+    pushes, mu updates, heap pops, heuristic calls and the largest heap.
+    """
+
+    if source in obstacles or destination in obstacles:
+        return None, []
+
+    #lower bounds on the distance to the destination and from the source
+    if heuristic_type == 'alt':
+        to_destination = landmark_heuristic(graph, destination)
+        from_source = landmark_heuristic(graph, source, reverse=True)
+    else:
+        #straight-line distance; obstacles only block or slow edges, an
+        #obstacle penalty here would be added to both sides of potential()
+        #and cancel
+        to_destination = lambda node: heuristic(node, destination, graph)
+        from_source = lambda node: heuristic(node, source, graph)
+
+    #forward potential per node; the backward one is its negation, which
+    #makes the two searches consistent with each other
+    potentials = {}
+
+    def potential(node):
+        value = potentials.get(node)
+        if value is None:
+            value = potentials[node] = (to_destination(node) - from_source(node)) / 2
+        return value
+
+    #CSR adjacency: edges of node i are targets[offsets[i]:offsets[i + 1]],
+    #the edges into it are listed the same way in the reverse arrays
+    adjacency = (
+        (graph.offsets_list, graph.targets_list, None),
+        (graph.reverse_offsets_list, graph.reverse_sources_list, graph.reverse_edges_list),
+    )
+    #edge weights with the soft obstacles' multipliers applied
+    weights = obstacles.edge_weights(graph)
+    #one byte per CSR edge, set for blocked roads and every road around a blocked node
+    edge_blocked = obstacles.edge_blocked
+
+    #one heap of (key, node) per direction, 0 is forward and 1 backward,
+    #keyed by g-score plus the direction's potential
+    open_sets = ([(potential(source), source)], [(-potential(destination), destination)])
 
-    #open set is a priority queue that holds nodes yet to be explored
-    #prioritized by their f-score 
-    open_set = []
-    heapq.heappush(open_set, (0, source, 'forward'))
-    heapq.heappush(open_set, (0, destination, 'backward'))
-    
     #where the last node is
-    came_from = {'forward': {}, 'backward': {}}
-
-    #stores the known cost to reach each next node, initially inifinity
-    g_score = {'forward': {node: float('inf') for node in graph.nodes},
-               'backward': {node: float('inf') for node in graph.nodes}}
-    #stores the estimated cost to reach the destination node
-    f_score = {'forward': {node: float('inf') for node in graph.nodes},
-               'backward': {node: float('inf') for node in graph.nodes}}
-    
-    #steps the score for starting nodes
-    g_score['forward'][source] = 0
-    g_score['backward'][destination] = 0
-    
-    f_score['forward'][source] = heuristic(source, destination, graph, obstacles)
-    f_score['backward'][destination] = heuristic(destination, source, graph, obstacles)
-    
-    #nodes that have already been explored and the meeting point
+    came_from = ({}, {})
+
+    #stores the known cost to reach each next node, missing means inifinity
+    #kept sparse so a query only allocates for the nodes it touches
+    g_score = ({source: 0}, {destination: 0})
+
+    #best meeting cost so far and the node it goes through
+    mu = 0 if source == destination else float('inf')
+    meeting_node = source if source == destination else None
+
     explored_edges = []
-    meeting_node = None
-    
-    while open_set:
-        #pops the node with the lowest f-score (the most probable next node)
-        _, current, direction = heapq.heappop(open_set)
-        opposite = 'backward' if direction == 'forward' else 'forward'
-        
-        #if the node from forward is the same as from backward
-        if current in came_from[opposite]:
-            meeting_node = current
+    #bound method, or None when the caller doesn't want the edges
+    record_explored = explored_edges.append if track_explored else None
+    settled = pushes = mu_updates = relaxed = max_heap = 0
+
+    while open_sets[0] and open_sets[1]:
+        #no path through an unsettled node can beat mu any more
+        if open_sets[0][0][0] + open_sets[1][0][0] >= mu:
             break
-        
-        # we check if the neighbouring nodes are an obstacle
-        for neighbor in graph.neighbors(current):
-            if neighbor in obstacles or current in obstacles:  # Ignore obstacles
-                continue
-            
-            #if the edge between these nodes doesnt exist, we skip this node
-            edge_data = graph.get_edge_data(current, neighbor)
-            if not edge_data:
-                continue
-            
-            #consider the minimum edge weight
-            edge_weight = min(edge.get('length', float('inf')) for edge in edge_data.values())
-            if edge_weight == float('inf'):
+
+        #balanced alternation: grow the smaller frontier
+        direction = 0 if len(open_sets[0]) <= len(open_sets[1]) else 1
+        open_set = open_sets[direction]
+        if len(open_set) > max_heap:
+            max_heap = len(open_set)
+        key, current = heapq.heappop(open_set)
+
+        g_direction = g_score[direction]
+        sign = 1 if direction == 0 else -1
+        #skip entries that were superseded by a cheaper push
+        if key > g_direction[current] + sign * potential(current):
+            continue
+        settled += 1
+
+        g_opposite = g_score[1 - direction]
+        came_direction = came_from[direction]
+        offsets, neighbors, edge_ids = adjacency[direction]
+        g_current = g_direction[current]
+        relaxed += offsets[current + 1] - offsets[current]
+
+        # we check if the edge to the neighbouring node is blocked
+        #edge weights are already the minimum over parallel edges
+        for position in range(offsets[current], offsets[current + 1]):
+            edge = position if edge_ids is None else edge_ids[position]
+            if edge_blocked[edge]:  # Ignore obstacles
                 continue
+            neighbor = neighbors[position]
 
             #cost to reach the neighbour
             #if the tentative g-score is less than known g-score then update g-score
-            tentative_g_score = g_score[direction][current] + edge_weight
-            
-            if tentative_g_score < g_score[direction][neighbor]:
-                came_from[direction][neighbor] = current
-                g_score[direction][neighbor] = tentative_g_score
-                f_score[direction][neighbor] = tentative_g_score + heuristic(
-                    neighbor, destination if direction == 'forward' else source, graph, obstacles
-                )
-                heapq.heappush(open_set, (f_score[direction][neighbor], neighbor, direction))
-                explored_edges.append((current, neighbor))
+            tentative_g_score = g_current + weights[edge]
+
+            if tentative_g_score < g_direction.get(neighbor, float('inf')):
+                came_direction[neighbor] = current
+                g_direction[neighbor] = tentative_g_score
+                heapq.heappush(open_set, (tentative_g_score + sign * potential(neighbor), neighbor))
+                pushes += 1
+                if record_explored:
+                    record_explored(edge)
+
+                #a node both searches reached closes a source-destination path
+                if neighbor in g_opposite and tentative_g_score + g_opposite[neighbor] < mu:
+                    mu = tentative_g_score + g_opposite[neighbor]
+                    meeting_node = neighbor
+                    mu_updates += 1
+
+    if stats is not None:
+        #every potential() miss evaluates both heuristics, and every entry
+        #pushed (plus the two start entries) that's no longer queued was popped
+        stats.update(settled=settled, relaxed=relaxed, pushes=pushes, mu_updates=mu_updates, mu=mu,
+                     popped=pushes + 2 - len(open_sets[0]) - len(open_sets[1]),
+                     heuristic_calls=2 * len(potentials), max_heap=max_heap)
+
     #failed to meet the path
     if meeting_node is None:
         return None, explored_edges
-    
+
     path = []
-    
+
     # Reconstruct forward path
     node = meeting_node
-    while node in came_from['forward']:
+    while node in came_from[0]:
         path.append(node)
-        node = came_from['forward'][node]
+        node = came_from[0][node]
 
     path.append(source)
     path.reverse()
 
     # Reconstruct backward path
     node = meeting_node
-    while node in came_from['backward']:
-        node = came_from['backward'][node]
+    while node in came_from[1]:
+        node = came_from[1][node]
         path.append(node)
-    
+
     return path, explored_edges
+
+def ch_shortest_path(ch, graph, source, destination, obstacles, track_explored=True, stats=None):
+    """Shortest path on dense indices using a ContractionHierarchy.
+
+    The hierarchy is built without obstacles, so when the unpacked path
+    uses a blocked or slowed-down edge this falls back to
+    bidirectional_astar_dense(). Otherwise the path is also the shortest
+    one with the obstacles in place, since obstacles only ever remove
+    edges or make them more expensive. Same return values as bidirectional_astar_dense,
+    the hierarchy search has no explored edges to show. stats only gets
+    counters when the fallback runs.
+    """
+    if source in obstacles or destination in obstacles:
+        return None, []
+
+    _, path = ch.query(source, destination)
+    if path is not None and obstacles and any(
+            obstacles.edge_blocked[edge] or edge in obstacles.factors
+            for edge in graph.path_edges(path).tolist()):
+        return bidirectional_astar_dense(graph, source, destination, obstacles, track_explored, stats=stats)
+    return path, []
@@ -0,0 +1,276 @@
+# place_search.py
+"""Place search for /search_place.
+
+Queries are answered from a local index of the named places in the
+snapshot: named OSM features fetched when the snapshot was built and the
+street names in the graph, each with the graph node nearest to it. Every
+word of the query has to match the start of a word in the name, so
+results show up while the user is still typing; a word that matches
+nothing is retried against similarly spelled words to absorb typos.
+
+Nominatim is only asked when the local index has nothing, through one
+pooled session with a timeout, and its answers are kept in an LRU keyed
+on the normalized query.
+"""
+import bisect
+import difflib
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+SEARCH_LIMIT = int(os.environ.get("SEARCH_LIMIT", 5))
+# a result further than this from every graph node gets no node_id
+SEARCH_NODE_RADIUS = float(os.environ.get("SEARCH_NODE_RADIUS", 500))
+
+GEOCODER_URL = os.environ.get("GEOCODER_URL", "https://nominatim.openstreetmap.org/search")
+GEOCODER_USER_AGENT = os.environ.get("GEOCODER_USER_AGENT", "YourAppName/1.0 (your@email.com)")
+# seconds to wait for the remote geocoder before giving up on it
+GEOCODER_TIMEOUT = float(os.environ.get("GEOCODER_TIMEOUT", 5))
+GEOCODER_CACHE_SIZE = int(os.environ.get("GEOCODER_CACHE_SIZE", 1024))
+# connections kept open to the geocoder, one per concurrent request thread
+GEOCODER_POOL_SIZE = int(os.environ.get("GEOCODER_POOL_SIZE", 8))
+
+# OSM tags whose named features go into the snapshot's place index
+FEATURE_TAGS = {
+    'amenity': True,
+    'tourism': True,
+    'historic': True,
+    'leisure': True,
+    'shop': True,
+    'office': True,
+    'place': True,
+    'building': ['hospital', 'school', 'university', 'temple', 'college'],
+}
+
+# features rank above streets with an equally good match
+STREET_KIND = 'street'
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Lower-case words of text without accents or punctuation, space separated."""
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(WORD_PATTERN.findall(text.lower()))
+
+
+def download_features(place_names):
+    """(name, kind, lat, lon) of the named OSM features in the places.
+
+    Needs network access, like snapshot.download_graph().
+    """
+    import osmnx as ox
+
+    features = ox.features_from_place(place_names, tags=FEATURE_TAGS)
+    if 'name' not in features:
+        return []
+    features = features[features['name'].notna()]
+    points = features.geometry.representative_point()
+    kinds = [next((str(row[tag]) for tag in FEATURE_TAGS if tag in row and isinstance(row[tag], str)), 'place')
+             for _, row in features.iterrows()]
+    return list(zip(features['name'].astype(str), kinds, points.y.tolist(), points.x.tolist()))
+
+
+def place_arrays(arrays, strings, intern, compiled, features=()):
+    """The snapshot's place table: named features plus one entry per street name.
+
+    A street is placed at the node of its row nearest to the middle of all
+    the rows with that name. Features get the graph node nearest to them.
+    intern is the snapshot's string table function, names and kinds go in there.
+    """
+    # rows of merged ways carry "A; B", those streets are listed under both names
+    streets = {}
+    for row, name in enumerate(arrays['edge_name'].tolist()):
+        if name >= 0:
+            for street in strings[name].split('; '):
+                streets.setdefault(street, []).append(row)
+
+    names, kinds, lat, lon, nodes = [], [], [], [], []
+    node_lat, node_lon = arrays['lat'], arrays['lon']
+    for street, rows in streets.items():
+        ends = arrays['edge_u'][rows]
+        centre_lat, centre_lon = node_lat[ends].mean(), node_lon[ends].mean()
+        node = int(ends[np.argmin((node_lat[ends] - centre_lat) ** 2 + (node_lon[ends] - centre_lon) ** 2)])
+        names.append(intern(street))
+        kinds.append(intern(STREET_KIND))
+        lat.append(float(node_lat[node]))
+        lon.append(float(node_lon[node]))
+        nodes.append(node)
+
+    features = list(features)
+    if features and len(compiled):
+        feature_nodes, _ = compiled.nearest(np.array([f[2] for f in features]), np.array([f[3] for f in features]))
+        for (name, kind, feature_lat, feature_lon), node in zip(features, feature_nodes.tolist()):
+            names.append(intern(name))
+            kinds.append(intern(kind))
+            lat.append(feature_lat)
+            lon.append(feature_lon)
+            nodes.append(node)
+
+    return {
+        'place_name': np.array(names, dtype=np.int32),
+        'place_kind': np.array(kinds, dtype=np.int32),
+        'place_lat': np.array(lat, dtype=np.float64),
+        'place_lon': np.array(lon, dtype=np.float64),
+        'place_node': np.array(nodes, dtype=np.int64),
+    }
+
+
+class PlaceIndex:
+    """Word-prefix index over the snapshot's place table."""
+
+    def __init__(self, snapshot):
+        arrays = snapshot.arrays
+        node_ids = arrays['node_ids']
+        self.places = [
+            {"display_name": snapshot.strings[name], "lat": lat, "lon": lon,
+             "node_id": int(node_ids[node]), "type": snapshot.strings[kind]}
+            for name, kind, lat, lon, node in zip(
+                arrays['place_name'].tolist(), arrays['place_kind'].tolist(), arrays['place_lat'].tolist(),
+                arrays['place_lon'].tolist(), arrays['place_node'].tolist())
+        ]
+        self.names = [normalize(place['display_name']) for place in self.places]
+
+        postings = {}
+        for i, name in enumerate(self.names):
+            for word in set(name.split()):
+                postings.setdefault(word, []).append(i)
+        # sorted vocabulary, the words starting with a prefix are one slice of it
+        self.words = sorted(postings)
+        self.postings = [postings[word] for word in self.words]
+
+    def _prefix_matches(self, prefix):
+        start = bisect.bisect_left(self.words, prefix)
+        end = bisect.bisect_left(self.words, prefix + '\uffff')
+        return set(i for postings in self.postings[start:end] for i in postings)
+
+    def _fuzzy_matches(self, word):
+        # too short to tell a typo from another word
+        if len(word) < 3:
+            return set()
+        matches = set()
+        for close in difflib.get_close_matches(word, self.words, n=5, cutoff=0.75):
+            matches.update(self.postings[bisect.bisect_left(self.words, close)])
+        return matches
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Best matching places, exact names first, then prefixes, then typos."""
+        query = normalize(query)
+        if not query:
+            return []
+
+        candidates = None
+        fuzzy = False
+        for word in query.split():
+            matches = self._prefix_matches(word)
+            if not matches:
+                matches = self._fuzzy_matches(word)
+                fuzzy = True
+            candidates = matches if candidates is None else candidates & matches
+            if not candidates:
+                return []
+
+        def rank(i):
+            name = self.names[i]
+            quality = 3 if fuzzy else 0 if name == query else 1 if name.startswith(query) else 2
+            return quality, self.places[i]['type'] == STREET_KIND, len(name), name
+
+        return [dict(self.places[i]) for i in sorted(candidates, key=rank)[:limit]]
+
+
+@lru_cache(maxsize=4)
+def place_index(snapshot):
+    """The PlaceIndex of a snapshot, built on first use."""
+    return PlaceIndex(snapshot)
+
+
+def with_nearest_nodes(compiled, places):
+    """Set each place's node_id to the nearest graph node within SEARCH_NODE_RADIUS, or None."""
+    if not places or not len(compiled):
+        return places
+    nodes, distances = compiled.nearest(np.array([place['lat'] for place in places]),
+                                        np.array([place['lon'] for place in places]))
+    for place, node, distance in zip(places, nodes.tolist(), distances.tolist()):
+        place['node_id'] = int(compiled.node_ids[node]) if distance <= SEARCH_NODE_RADIUS else None
+    return places
+
+
+class Geocoder:
+    """Remote Nominatim lookups with connection reuse, a timeout and an LRU.
+
+    Only successful answers are cached; failures raise requests exceptions
+    and are retried on the next request.
+    """
+
+    def __init__(self, url=GEOCODER_URL, timeout=GEOCODER_TIMEOUT, maxsize=GEOCODER_CACHE_SIZE, session=None):
+        self.url = url
+        self.timeout = timeout
+        self.maxsize = maxsize
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=GEOCODER_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers['User-Agent'] = GEOCODER_USER_AGENT
+        self.session = session
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Places from the remote geocoder as [{display_name, lat, lon}, ...]."""
+        key = (normalize(query), limit)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return [dict(place) for place in self._entries[key]]
+            self.misses += 1
+
+        params = {
+            'q': query,
+            'format': 'json',
+            'limit': limit,
+            'countrycodes': 'np'
+        }
+        try:
+            response = self.session.get(self.url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            places = [{
+                "display_name": place.get("display_name"),
+                "lat": float(place.get("lat")),
+                "lon": float(place.get("lon"))
+            } for place in response.json()]
+        except (requests.RequestException, ValueError, TypeError):
+            with self._lock:
+                self.errors += 1
+            raise
+
+        with self._lock:
+            self._entries[key] = places
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return [dict(place) for place in places]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'errors': self.errors,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,114 @@
+# route_encoding.py
+"""Compact encodings for route coordinates.
+
+- Google encoded polyline ("polyline"), precision 5 or 6
+- little-endian int32 fixed-point buffer ("binary"): a uint32 point count
+  followed by (lat, lon) pairs in 1e-6 degree units
+- Douglas-Peucker simplification with a tolerance in metres, or derived
+  from a web-map zoom level
+"""
+import math
+import struct
+
+import numpy as np
+
+# metres per pixel at zoom 0 on the equator for 256 px web-mercator tiles
+METERS_PER_PIXEL_Z0 = 156543.03392
+# fixed-point scale of the binary format, about 11 cm at the equator
+BINARY_SCALE = 1e6
+# deepest web-map zoom level, zoom_tolerance() clamps to 0..MAX_ZOOM
+MAX_ZOOM = 24
+
+
+def encode_polyline(coords, precision=5):
+    """Google encoded polyline string for a sequence of (lat, lon)."""
+    if not len(coords):
+        return ''
+    values = np.round(np.asarray(coords, dtype=np.float64) * 10 ** precision).astype(np.int64)
+    # every point is stored as the difference to the previous one
+    deltas = np.diff(values, axis=0, prepend=[[0, 0]]).ravel().tolist()
+
+    chunks = []
+    for value in deltas:
+        # zigzag: move the sign into the lowest bit
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def decode_polyline(encoded, precision=5):
+    """[[lat, lon], ...] from a Google encoded polyline string."""
+    values = []
+    value = shift = 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+
+    points = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0)
+    return (points / 10 ** precision).tolist()
+
+
+def encode_binary(coords):
+    """Little-endian buffer: uint32 count, then int32 (lat, lon) * 1e6 pairs."""
+    points = np.round(np.asarray(coords, dtype=np.float64).reshape(-1, 2) * BINARY_SCALE)
+    return struct.pack('<I', len(points)) + points.astype('<i4').tobytes()
+
+
+def decode_binary(buffer):
+    """[[lat, lon], ...] from an encode_binary() buffer."""
+    (count,) = struct.unpack_from('<I', buffer)
+    points = np.frombuffer(buffer, dtype='<i4', count=2 * count, offset=4).reshape(-1, 2)
+    return (points / BINARY_SCALE).tolist()
+
+
+def zoom_tolerance(zoom, lat):
+    """Douglas-Peucker tolerance in metres: one pixel at this zoom and latitude."""
+    zoom = min(max(zoom, 0), MAX_ZOOM)
+    return METERS_PER_PIXEL_Z0 * math.cos(math.radians(lat)) / 2 ** zoom
+
+
+def simplify(coords, tolerance):
+    """Douglas-Peucker simplification of (lat, lon) points, tolerance in metres.
+
+    Always keeps the first and last point. Returns a list of [lat, lon].
+    """
+    points = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    # also skips a NaN tolerance
+    if len(points) < 3 or not tolerance > 0:
+        return points.tolist()
+
+    # local equirectangular metres are plenty for a tolerance test
+    lat0 = math.radians(points[:, 0].mean())
+    xy = np.radians(points[:, ::-1]) * 6371000
+    xy[:, 0] *= math.cos(lat0)
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = xy[first], xy[last]
+        segment = end - start
+        inner = xy[first + 1:last] - start
+        length = math.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distances = np.abs(segment[0] * inner[:, 1] - segment[1] * inner[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+
+    return points[keep].tolist()
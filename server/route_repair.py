@@ -0,0 +1,240 @@
+# route_repair.py
+"""Incremental route repair for active route sessions (D* Lite).
+
+A RouteSession keeps the search state of one user's route: a backward
+search from the destination with the cost-to-go g and its one-step
+lookahead rhs for every node it touched. When obstacles change only the
+nodes next to edges whose cost changed become inconsistent, and repair()
+re-expands just those until the route from the user's current position is
+optimal again, instead of searching from scratch. As the user moves, the
+heap keys are shifted by km (the distance moved) rather than rebuilt.
+
+Sessions live in the memory of the web process that created them, a
+repair usually touches a few hundred nodes and sending the search state
+to a worker would cost more than the repair. With several web processes
+the load balancer has to send every request of a session to the same one
+(sticky sessions, e.g. on the session id); any other process answers 404.
+RouteSessions bounds how many are kept and for how long.
+
+Plans and repairs take a deadline and raise RoutingTimeout once they pass
+it. The search state stays valid when that happens, the next repair picks
+up where the interrupted one stopped.
+"""
+import heapq
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from routing_executor import RoutingTimeout
+from utils import haversine_rad
+
+# active route sessions kept per process, the least recently used go first
+ROUTE_SESSION_LIMIT = int(os.environ.get("ROUTE_SESSION_LIMIT", 200))
+# seconds a session survives without a /reroute
+ROUTE_SESSION_TTL = float(os.environ.get("ROUTE_SESSION_TTL", 1800))
+
+INF = float('inf')
+# expansions between deadline checks
+DEADLINE_CHECK_INTERVAL = 256
+
+
+class RouteSession:
+    """D* Lite state for a route from a moving position to a fixed destination.
+
+    start and destination are dense indices, obstacles an ObstacleMask over
+    graph. expanded counts the nodes expanded by the last plan or repair,
+    initial_expanded those of the first full search. deadline is a
+    time.monotonic() value the first search has to finish by, None for no
+    limit.
+    """
+
+    def __init__(self, graph, start, destination, obstacles, deadline=None):
+        self.graph = graph
+        self.start = start
+        self.destination = destination
+        self.obstacles = obstacles
+        self.weights = obstacles.edge_weights(graph)
+        # g: cost to the destination as last expanded, rhs: from the
+        # successors' g, a node is consistent when the two agree; missing
+        # entries are infinity
+        self.g = {}
+        self.rhs = {destination: 0}
+        # heap offset, grows by the heuristic distance every move
+        self.km = 0
+        # (k1, k2, node) entries, stale ones are dropped when popped;
+        # _queued holds each queued node's current key
+        self._open = []
+        self._queued = {}
+        self._push(destination)
+        self.lock = threading.Lock()
+        self.used_at = time.monotonic()
+
+        self.expanded = self._compute(deadline)
+        self.initial_expanded = self.expanded
+
+    def _h(self, node):
+        # metres from start, a lower bound on any path since edge lengths
+        # are at least the straight-line distance
+        graph, start = self.graph, self.start
+        return 1000 * haversine_rad(graph.lat_rad_list[start], graph.lon_rad_list[start], graph.cos_lat_list[start],
+                                    graph.lat_rad_list[node], graph.lon_rad_list[node], graph.cos_lat_list[node])
+
+    def _key(self, node):
+        best = min(self.g.get(node, INF), self.rhs.get(node, INF))
+        return best + self._h(node) + self.km, best
+
+    def _push(self, node):
+        key = self._key(node)
+        self._queued[node] = key
+        heapq.heappush(self._open, (key[0], key[1], node))
+
+    def _top_key(self):
+        open_set, queued = self._open, self._queued
+        while open_set and queued.get(open_set[0][2]) != open_set[0][:2]:
+            heapq.heappop(open_set)
+        return open_set[0][:2] if open_set else (INF, INF)
+
+    def _update(self, node):
+        """Recompute node's rhs from its out-edges and requeue it if inconsistent."""
+        graph = self.graph
+        if node != self.destination:
+            best = INF
+            g, weights, edge_blocked, targets = self.g, self.weights, self.obstacles.edge_blocked, graph.targets_list
+            for edge in range(graph.offsets_list[node], graph.offsets_list[node + 1]):
+                if not edge_blocked[edge]:
+                    cost = weights[edge] + g.get(targets[edge], INF)
+                    if cost < best:
+                        best = cost
+            self.rhs[node] = best
+        self._queued.pop(node, None)
+        if self.g.get(node, INF) != self.rhs.get(node, INF):
+            self._push(node)
+
+    def _update_predecessors(self, node):
+        graph = self.graph
+        for position in range(graph.reverse_offsets_list[node], graph.reverse_offsets_list[node + 1]):
+            self._update(graph.reverse_sources_list[position])
+
+    def _compute(self, deadline=None):
+        """Expand inconsistent nodes until the start is consistent, returning the count."""
+        expanded = 0
+        g, rhs, start = self.g, self.rhs, self.start
+        while self._top_key() < self._key(start) or rhs.get(start, INF) != g.get(start, INF):
+            if not self._open:
+                break
+            # checked between expansions, where every inconsistent node is queued
+            if deadline is not None and expanded % DEADLINE_CHECK_INTERVAL == 0 and time.monotonic() > deadline:
+                raise RoutingTimeout()
+            old_k1, old_k2, node = heapq.heappop(self._open)
+            del self._queued[node]
+            new_key = self._key(node)
+            if (old_k1, old_k2) < new_key:
+                # the key went up since it was queued (km grew), requeue
+                self._push(node)
+                continue
+            expanded += 1
+            if g.get(node, INF) > rhs.get(node, INF):
+                g[node] = rhs[node]
+            else:
+                g[node] = INF
+                self._update(node)
+            self._update_predecessors(node)
+        return expanded
+
+    def repair(self, start, obstacles, deadline=None):
+        """Move the start and switch to a new ObstacleMask, then replan.
+
+        Only the sources of edges whose blocked state or soft factor
+        changed are touched. Returns the number of nodes re-expanded,
+        raising RoutingTimeout when the deadline passes first.
+        """
+        if start != self.start:
+            # every key drops by at most the distance moved, adding it to km
+            # instead keeps the queued keys valid lower bounds
+            self.km += self._h(start)
+            self.start = start
+
+        changed = set()
+        if obstacles is not self.obstacles:
+            old = self.obstacles
+            changed = set(old.edges ^ obstacles.edges)
+            changed.update(edge for edge in old.factors.keys() | obstacles.factors.keys()
+                           if old.factors.get(edge) != obstacles.factors.get(edge))
+            self.obstacles = obstacles
+            self.weights = obstacles.edge_weights(self.graph)
+
+        if changed:
+            for source in set(self.graph.edge_endpoints(sorted(changed))[:, 0].tolist()):
+                self._update(source)
+        self.expanded = self._compute(deadline)
+        return self.expanded
+
+    def path(self):
+        """Dense path from the start to the destination, None if there is none."""
+        graph, g = self.graph, self.g
+        node = self.start
+        if self.rhs.get(node, INF) == INF or node in self.obstacles:
+            return None
+        path = [node]
+        weights, edge_blocked, targets = self.weights, self.obstacles.edge_blocked, graph.targets_list
+        while node != self.destination:
+            best, best_node = INF, None
+            for edge in range(graph.offsets_list[node], graph.offsets_list[node + 1]):
+                if not edge_blocked[edge]:
+                    cost = weights[edge] + g.get(targets[edge], INF)
+                    if cost < best:
+                        best, best_node = cost, targets[edge]
+            # g and rhs agree on the path, so this only trips on a bug
+            if best_node is None or len(path) > len(graph):
+                return None
+            path.append(best_node)
+            node = best_node
+        return path
+
+    def cost(self):
+        """Cost of the current route from the start, inf if there is none."""
+        return self.rhs.get(self.start, INF)
+
+
+class RouteSessions:
+    """Bounded LRU/TTL store of RouteSessions keyed by a random session id."""
+
+    def __init__(self, maxsize=ROUTE_SESSION_LIMIT, ttl=ROUTE_SESSION_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, session):
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.maxsize:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        return session_id
+
+    def get(self, session_id):
+        """The session with this id, or None if it is unknown or expired."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if self.ttl and time.monotonic() - session.used_at > self.ttl:
+                del self._sessions[session_id]
+                self.evictions += 1
+                return None
+            session.used_at = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def remove(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._sessions), 'maxsize': self.maxsize, 'evictions': self.evictions}
@@ -1,21 +1,34 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from flask import Blueprint, jsonify, request, render_template
-from pathfinding import bidirectional_astar
-from utils import haversine, heuristic
+from flask import Blueprint, Response, g, jsonify, make_response, request, render_template
+from pathfinding import HEURISTICS
+from routing_executor import RoutingExecutor, RoutingSaturated, RoutingTimeout, RoutingUnavailable, route_search
+from alternatives import METHODS as ALTERNATE_METHODS, alternative_routes
+from distance_matrix import distance_matrix
+from snapshot import get_snapshot
+from obstacle_store import ObstacleStore
+from place_search import Geocoder, place_index, with_nearest_nodes
+from local_supabase import LocalSupabase
+import metrics
+from route_cache import RouteCache
+from route_repair import RouteSession, RouteSessions
+from route_encoding import MAX_ZOOM, encode_binary, encode_polyline, simplify, zoom_tolerance
+from tiles import LAYERS, MAX_TILE_ZOOM, MIN_TILE_ZOOM, TILE_FORMATS, EncodedBlob, brotli, tile_blob
 import os
+import json
+import logging
+import math
+import time
 from supabase import create_client, Client
-from flask import jsonify
 import requests
 
 import cloudinary
 import cloudinary.uploader
 import base64
 import io
-from PIL import Image
 
-from scipy.spatial import ConvexHull
+from functools import lru_cache
 import numpy as np
 
 
@@ -23,7 +36,23 @@ import numpy as np
 url: str = os.environ.get("SUPABASE_URL")
 key: str = os.environ.get("SUPABASE_KEY")
 
-supabase: Client = create_client(url, key)
+# SUPABASE_LOCAL=1 swaps in an in-memory stand-in for offline runs
+if os.environ.get("SUPABASE_LOCAL"):
+    supabase = LocalSupabase()
+else:
+    supabase: Client = create_client(url, key)
+
+# obstacles kept in memory as a mask over the graph instead of being
+# fetched on every route
+obstacle_store = ObstacleStore(supabase, get_snapshot)
+# finished /shortest_path responses, keyed on the obstacle version
+route_cache = RouteCache()
+# worker processes the route searches run in
+routing_executor = RoutingExecutor()
+# search state of active routes, repaired by /reroute
+route_sessions = RouteSessions()
+# fallback for /search_place queries the local place index can't answer
+geocoder = Geocoder()
 
 cloudName: str = os.environ.get("CLOUDINARY_CLOUD_NAME")
 cloudApiKey: str = os.environ.get("CLOUDINARY_API_KEY")
@@ -35,17 +64,29 @@ cloudinary.config(
     api_secret=cloudSecretKey
 )
 
+logger = logging.getLogger(__name__)
+
 # Define a Blueprint to keep routes separate
 main_routes = Blueprint('main', __name__)
 
-# Load road network graph
-import osmnx as ox
-place_names = ["Kathmandu, Nepal", "Lalitpur, Nepal"]
+@main_routes.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@main_routes.after_request
+def record_request_time(response):
+    start = g.get('request_start')
+    if start is not None:
+        metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, request.endpoint, response.status_code)
+    return response
 
-# we get all the values for nodes and edges here
-graph = ox.graph_from_place(place_names, network_type="all")
-# extracting nodes and edges here
-nodes, edges = ox.graph_to_gdfs(graph)
+# Load road network graph
+# the graph comes from the memory-mapped on-disk snapshot (see snapshot.py)
+# and is loaded lazily on first use, so importing this module needs no
+# network access and worker processes share the arrays
+def get_compiled_graph():
+    """The compact CSR graph that the pathfinding runs on."""
+    return get_snapshot().compiled
 
 # Set to store obstacle nodes
 obstacles = set()
@@ -54,13 +95,66 @@ obstacles = set()
 def index():
     return render_template('map.html')
 
+# seconds clients may reuse a tile or layer without revalidating, the
+# ETag covers the rest since a snapshot never changes under a worker
+TILE_MAX_AGE = int(os.environ.get("TILE_MAX_AGE", 3600))
+
+def blob_response(blob, mimetype):
+    """Response for an EncodedBlob with ETag revalidation and compression.
+
+    Picks brotli (when installed) or gzip from Accept-Encoding and answers
+    304 when the client already has this body.
+    """
+    if blob.etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        encoding = None
+        if brotli is not None and 'br' in request.accept_encodings:
+            encoding = 'br'
+        elif 'gzip' in request.accept_encodings:
+            encoding = 'gzip'
+        response = Response(blob.encoded(encoding), mimetype=mimetype)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(blob.etag)
+    response.headers['Cache-Control'] = f'public, max-age={TILE_MAX_AGE}'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+@lru_cache(maxsize=4)
+def layer_blob(snapshot, layer):
+    """The whole /edges or /nodes body, encoded once per snapshot."""
+    # the GeoDataFrames are only built the first time one of these is hit;
+    # the body stays the JSON string of the GeoJSON the client expects
+    nodes, edges = snapshot.gdfs()
+    return EncodedBlob(jsonify((edges if layer == 'edges' else nodes).to_json()).get_data())
+
 @main_routes.route('/edges')
 def get_edges():
-    return jsonify(edges.to_json())
+    return blob_response(layer_blob(get_snapshot(), 'edges'), 'application/json')
 
 @main_routes.route('/nodes')
 def get_nodes():
-    return jsonify(nodes.to_json())
+    return blob_response(layer_blob(get_snapshot(), 'nodes'), 'application/json')
+
+@main_routes.route('/tiles/<layer>/<int:z>/<int:x>/<int:y>')
+def get_tile(layer, z, x, y):
+    """One z/x/y web-mercator tile of the edges or nodes layer.
+
+    ?format=binary returns the compact buffer described in tiles.py
+    instead of a GeoJSON FeatureCollection.
+    """
+    tile_format = request.args.get('format', 'json')
+    if layer not in LAYERS:
+        return jsonify({"error": f"layer must be one of {', '.join(LAYERS)}"}), 404
+    if tile_format not in TILE_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(TILE_FORMATS)}"}), 400
+    if not MIN_TILE_ZOOM <= z <= MAX_TILE_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({"error": f"tiles exist for zoom {MIN_TILE_ZOOM} to {MAX_TILE_ZOOM}"}), 404
+
+    blob = tile_blob(get_snapshot(), layer, z, x, y, tile_format)
+    mimetype = 'application/octet-stream' if tile_format == 'binary' else 'application/geo+json'
+    return blob_response(blob, mimetype)
 
 @main_routes.route('/obstacles', methods=['POST'])
 def set_obstacles():
@@ -69,7 +163,8 @@ def set_obstacles():
     
     try:
         received_obstacles = {int(node) for node in data.get("obstacles", [])}  # Convert to integers
-        valid_obstacles = {node for node in received_obstacles if node in graph.nodes}
+        compiled_graph = get_compiled_graph()
+        valid_obstacles = {node for node in received_obstacles if node in compiled_graph}
         
         obstacles = valid_obstacles  # Only store valid obstacles
         
@@ -123,72 +218,525 @@ def set_obstacles():
 #     except ValueError:
 #         return jsonify({'error': 'Invalid node IDs, must be integers'}), 400
     
-@main_routes.route('/shortest_path', methods=['POST'])
-def shortest_path():
-    # extract json data from HTTP POST
-    data = request.get_json()
+# ----------------------
+# Nearest node snapping
+# ----------------------
+# maximum number of points in one /nearest_nodes request
+MAX_NEAREST_POINTS = 1000
+
+def node_feature(compiled_graph, index, distance):
+    """GeoJSON point feature for a dense node index, like the ones /nodes returns."""
+    return {
+        "type": "Feature",
+        "id": int(compiled_graph.node_ids[index]),
+        "geometry": {
+            "type": "Point",
+            "coordinates": [float(compiled_graph.lon[index]), float(compiled_graph.lat[index])],
+        },
+        "properties": {"distance": distance},
+    }
+
+def parse_point(lat, lon):
+    """(lat, lon) as floats, raising ValueError unless both are finite numbers."""
+    try:
+        lat, lon = float(lat), float(lon)
+    except TypeError:
+        raise ValueError("'lat' and 'lon' must be numbers")
+    # NaN and infinity parse as floats but have no nearest node
+    if not (math.isfinite(lat) and math.isfinite(lon)):
+        raise ValueError("'lat' and 'lon' must be finite")
+    return lat, lon
+
+def resolve_node(value, compiled_graph):
+    """Node id from a node id or a {"lat", "lon"} point snapped to its nearest node."""
+    if isinstance(value, dict):
+        try:
+            lat, lon = parse_point(value['lat'], value['lon'])
+        except KeyError:
+            raise ValueError("Points need numeric 'lat' and 'lon'")
+        indices, _ = compiled_graph.nearest(lat, lon)
+        return int(compiled_graph.node_ids[indices[0]])
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ValueError(f"{value} is not a node ID")
+    return int(value)
+
+@main_routes.route('/nearest_node', methods=['GET'])
+def nearest_node():
+    try:
+        lat, lon = parse_point(request.args['lat'], request.args['lon'])
+    except KeyError:
+        return jsonify({"error": "Query parameters 'lat' and 'lon' are required"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    compiled_graph = get_compiled_graph()
+    indices, distances = compiled_graph.nearest(lat, lon)
+    return jsonify(node_feature(compiled_graph, int(indices[0]), float(distances[0])))
+
+@main_routes.route('/nearest_nodes', methods=['POST'])
+def nearest_nodes():
+    data = request.get_json(silent=True) or {}
+    points = data.get("points")
+    if not isinstance(points, list) or len(points) > MAX_NEAREST_POINTS:
+        return jsonify({"error": f"'points' must be a list of at most {MAX_NEAREST_POINTS} [lat, lon] pairs"}), 400
+
+    try:
+        coords = np.array(points, dtype=np.float64).reshape(-1, 2)
+    except (TypeError, ValueError):
+        return jsonify({"error": "'points' must be a list of [lat, lon] pairs"}), 400
+    if not np.isfinite(coords).all():
+        return jsonify({"error": "'points' must have finite coordinates"}), 400
+
+    compiled_graph = get_compiled_graph()
+    if not len(coords):
+        return jsonify({"type": "FeatureCollection", "features": []})
+    indices, distances = compiled_graph.nearest(coords[:, 0], coords[:, 1])
+    features = [node_feature(compiled_graph, index, distance)
+                for index, distance in zip(indices.tolist(), distances.tolist())]
+    return jsonify({"type": "FeatureCollection", "features": features})
+
+def parse_route_request(data):
+    """Validate a route request body.
+
+    Returns ((compiled_graph, source_node, destination_node), None) or
+    (None, error response) in the (jsonify(...), status) form.
+    """
     # if there is no data or there is no "source" or "destination" in data
     # then it is a bad request
     if not data or 'source' not in data or 'destination' not in data:
-        return jsonify({'error': 'Invalid input data'}), 400
-    
+        return None, (jsonify({'error': 'Invalid input data'}), 400)
+
     try:
-        #taking out source and detination from data in integer format
-        source_node = int(data['source'])
-        destination_node = int(data['destination'])
+        #taking out source and detination from data in integer format,
+        #{"lat": .., "lon": ..} points are snapped to their nearest node
+        compiled_graph = get_compiled_graph()
+        source_node = resolve_node(data['source'], compiled_graph)
+        destination_node = resolve_node(data['destination'], compiled_graph)
+    except (TypeError, ValueError) as e:
+        return None, (jsonify({'error': f'Invalid node IDs, must be integers. {str(e)}'}), 400)
+
+    #checks whether the taken source and destination exists in graph
+    if source_node not in compiled_graph or destination_node not in compiled_graph:
+        return None, (jsonify({'error': f"Invalid nodes: {source_node}, {destination_node}"}), 400)
+
+    return (compiled_graph, source_node, destination_node), None
+
+# search algorithms a route request can pick with "algorithm"
+ROUTE_ALGORITHMS = ('astar', 'ch')
+
+def run_search(compiled_graph, source_node, destination_node, obstacle_mask, track_explored,
+               algorithm='astar', heuristic_type='haversine'):
+    """Perform pathfinding while avoiding obstacles, on dense node indices.
+
+    The search runs on the routing executor (see route_search() for the
+    options) and raises RoutingSaturated or RoutingTimeout from it. Returns
+    (path, explored edges, search stats); the stats also go to /metrics.
+    """
+    path, explored_edges, stats = routing_executor.run(
+        route_search,
+        compiled_graph.index_of(source_node),
+        compiled_graph.index_of(destination_node),
+        obstacle_mask,
+        track_explored=track_explored,
+        algorithm=algorithm,
+        heuristic_type=heuristic_type,
+    )
+    metrics.record_search(algorithm, path, stats)
+    return path, explored_edges, stats
+
+def routing_error(error):
+    """Error response for a search the executor didn't run to completion."""
+    if isinstance(error, RoutingSaturated):
+        response = jsonify({'error': 'Too many route requests, try again shortly'})
+        response.headers['Retry-After'] = '1'
+        return response, 429
+    if isinstance(error, RoutingUnavailable):
+        return jsonify({'error': 'Route search failed, try again'}), 503
+    return jsonify({'error': 'Route search timed out'}), 504
+
+# response formats /shortest_path can negotiate with "format"
+ROUTE_FORMATS = ('json', 'polyline', 'binary')
+
+def parse_route_encoding(data):
+    """Output options of a route request.
+
+    "format" is json (default), polyline or binary, "precision" the
+    polyline precision (5 or 6) and "tolerance" (metres) or "zoom" turn on
+    Douglas-Peucker simplification of the path; zoom is clamped to
+    0..MAX_ZOOM. Returns (options, None) or (None, error response).
+    """
+    route_format = data.get('format') or request.args.get('format') or 'json'
+    if route_format not in ROUTE_FORMATS:
+        return None, (jsonify({'error': f"'format' must be one of {', '.join(ROUTE_FORMATS)}"}), 400)
 
-        #checks whether the taken source and destination exists in graph
-        if source_node not in graph.nodes or destination_node not in graph.nodes:
-            return jsonify({'error': f"Invalid nodes: {source_node}, {destination_node}"}), 400
+    try:
+        precision = int(data.get('precision', 5))
+        tolerance = float(data['tolerance']) if data.get('tolerance') is not None else None
+        zoom = float(data['zoom']) if data.get('zoom') is not None else None
+    except (TypeError, ValueError, OverflowError):
+        return None, (jsonify({'error': "'precision', 'tolerance' and 'zoom' must be numbers"}), 400)
+    if precision not in (5, 6):
+        return None, (jsonify({'error': "'precision' must be 5 or 6"}), 400)
+    if any(value is not None and not math.isfinite(value) for value in (tolerance, zoom)):
+        return None, (jsonify({'error': "'tolerance' and 'zoom' must be finite"}), 400)
+    if zoom is not None:
+        zoom = min(max(zoom, 0), MAX_ZOOM)
+
+    return {'format': route_format, 'precision': precision, 'tolerance': tolerance, 'zoom': zoom}, None
+
+def encode_route(path_coordinates, explored_coordinates, options):
+    """Response body and mimetype for a route in the requested format."""
+    tolerance = options['tolerance']
+    if tolerance is None and options['zoom'] is not None and path_coordinates:
+        tolerance = zoom_tolerance(options['zoom'], path_coordinates[0][0])
+    if tolerance:
+        path_coordinates = simplify(path_coordinates, tolerance)
+
+    if options['format'] == 'binary':
+        # the binary buffer carries the path only
+        return encode_binary(path_coordinates), 'application/octet-stream'
+
+    if options['format'] == 'polyline':
+        precision = options['precision']
+        response = jsonify({
+            'format': 'polyline',
+            'precision': precision,
+            'path': encode_polyline(path_coordinates, precision),
+            'explored': [encode_polyline(edge, precision) for edge in explored_coordinates],
+        })
+    else:
+        response = jsonify({'path': path_coordinates, 'explored': explored_coordinates})
+    return response.get_data(), 'application/json'
 
-        try:
-            # bringing out all the obstacles stored in the database
-            #convert them into int and store them in a set
-            response = supabase.table('obstacles').select('node_id').execute()
-            obstacles_from_db = {int(obstacle['node_id']) for obstacle in response.data}
-        except Exception as e:
-            return jsonify({'error': f"Error fetching obstacles: {str(e)}"}), 500
-
-        # Perform pathfinding while avoiding obstacles
-        path, explored_edges = bidirectional_astar(graph, source_node, destination_node, obstacles_from_db)
-        
-        #after algorithm, if no path, show no path
-        if path is None:
-            return jsonify({'error': 'No path found'}), 400
-        
-        # empty list to store path coordinates
-        path_coordinates = []
-        # path[:-1] all except last element
-        # path[1:] all except first element
-        #this gets the coordinates from path
-        for u, v in zip(path[:-1], path[1:]):
-            #this gets the existing edge data in graph
-            edge_data = graph.get_edge_data(u, v)
-            if edge_data:
-                edge_info = edge_data[0]
-                #geometry means curved lines
-                if 'geometry' in edge_info:
-                    path_coordinates.extend([(lat, lon) for lon, lat in edge_info['geometry'].coords])
-                else:
-                    path_coordinates.append((graph.nodes[u]['y'], graph.nodes[u]['x']))
-                    path_coordinates.append((graph.nodes[v]['y'], graph.nodes[v]['x']))
-        
-        explored_coordinates = []   
-        for u, v in explored_edges:
-            edge_data = graph.get_edge_data(u, v)
-            if edge_data:
-                edge_info = edge_data[0]
-                if 'geometry' in edge_info:
-                    explored_coordinates.append([(lat, lon) for lon, lat in edge_info['geometry'].coords])
-                else:
-                    explored_coordinates.append([(graph.nodes[u]['y'], graph.nodes[u]['x']),
-                                                 (graph.nodes[v]['y'], graph.nodes[v]['x'])])
-        
-        return jsonify({'path': path_coordinates, 'explored': explored_coordinates})
-    
-    except ValueError as e:
+@main_routes.route('/shortest_path', methods=['POST'])
+def shortest_path():
+    # per-phase wall times, to /metrics and the Server-Timing header,
+    # for error responses as well
+    timer = metrics.PhaseTimer('shortest_path')
+    return timer.finish(make_response(find_shortest_path(timer)))
+
+def find_shortest_path(timer):
+    """The /shortest_path response, timing its phases on timer."""
+    with timer.phase('parse'):
+        # extract json data from HTTP POST
+        data = request.get_json()
+        route, error = parse_route_request(data)
+        if error:
+            return error
+        compiled_graph, source_node, destination_node = route
+
+        encoding, error = parse_route_encoding(data)
+        if error:
+            return error
+
+    # "explored": false skips tracking the explored edges entirely,
+    # the response then carries an empty list
+    track_explored = data.get('explored', True) is not False and encoding['format'] != 'binary'
+
+    algorithm = data.get('algorithm', 'astar')
+    if algorithm not in ROUTE_ALGORITHMS:
+        return jsonify({'error': f"'algorithm' must be one of {', '.join(ROUTE_ALGORITHMS)}"}), 400
+    # "heuristic": "alt" swaps the haversine estimate for landmark bounds
+    heuristic_type = data.get('heuristic', 'haversine')
+    if heuristic_type not in HEURISTICS:
+        return jsonify({'error': f"'heuristic' must be one of {', '.join(HEURISTICS)}"}), 400
+
+    try:
+        # obstacles stored in the database, as the in-memory store's mask
+        # of blocked nodes and roads (re-read from the DB on its TTL)
+        with timer.phase('obstacles'):
+            obstacle_version, obstacles_from_db = obstacle_store.current()
+    except Exception as e:
+        return jsonify({'error': f"Error fetching obstacles: {str(e)}"}), 500
+
+    # popular routes are served from the cache until obstacles change
+    cache_key = (source_node, destination_node, track_explored, algorithm, heuristic_type,
+                 tuple(sorted(encoding.items())))
+    with timer.phase('cache'):
+        cached = route_cache.get(cache_key, obstacle_version)
+    if cached is not None:
+        body, mimetype = cached
+        return Response(body, mimetype=mimetype)
+
+    try:
+        start = time.perf_counter()
+        path, explored_edges, stats = run_search(compiled_graph, source_node, destination_node,
+                                                 obstacles_from_db, track_explored, algorithm, heuristic_type)
+    except (RoutingSaturated, RoutingTimeout, RoutingUnavailable) as e:
+        return routing_error(e)
+    # the worker times the search itself, the rest is queueing and pickling
+    timer.add('queue', max(time.perf_counter() - start - stats['seconds'], 0))
+    timer.add('search', stats['seconds'])
+
+    #after algorithm, if no path, show no path
+    if path is None:
+        return jsonify({'error': 'No path found'}), 400
+
+    snapshot = get_snapshot()
+    #edge polylines are pre-flattened in the snapshot, so the
+    #coordinates are array slices of the edges that were traversed
+    with timer.phase('coordinates'):
+        path_coordinates = snapshot.path_coordinates(path)
+        explored_coordinates = snapshot.edge_polylines(explored_edges)
+
+    with timer.phase('encode'):
+        body, mimetype = encode_route(path_coordinates, explored_coordinates, encoding)
+    route_cache.put(cache_key, obstacle_version, (body, mimetype))
+    return Response(body, mimetype=mimetype)
+
+@main_routes.route('/route_session', methods=['POST'])
+def create_route_session():
+    """Plan a route and keep its search state for /reroute.
+
+    Takes "source" and "destination" like /shortest_path and returns the
+    route with a "session_id". The session only exists in this process,
+    see route_repair.py on running several.
+    """
+    data = request.get_json()
+    route, error = parse_route_request(data)
+    if error:
+        return error
+    compiled_graph, source_node, destination_node = route
+
+    try:
+        obstacle_version, obstacles_from_db = obstacle_store.current()
+    except Exception as e:
+        return jsonify({'error': f"Error fetching obstacles: {str(e)}"}), 500
+
+    # D* Lite keeps its state in this process, so the search runs here,
+    # bounded by the executor's queue and timeout instead of a worker
+    try:
+        with routing_executor.slot() as deadline:
+            session = RouteSession(compiled_graph, compiled_graph.index_of(source_node),
+                                   compiled_graph.index_of(destination_node), obstacles_from_db, deadline)
+    except (RoutingSaturated, RoutingTimeout, RoutingUnavailable) as e:
+        return routing_error(e)
+    path = session.path()
+    if path is None:
+        return jsonify({'error': 'No path found'}), 400
+
+    return jsonify({
+        'session_id': route_sessions.add(session),
+        'path': get_snapshot().path_coordinates(path),
+        'expanded': session.expanded,
+        'obstacle_version': obstacle_version,
+    })
+
+@main_routes.route('/reroute', methods=['POST'])
+def reroute():
+    """Repair a session's route from the current position after obstacle changes.
+
+    Takes "session_id" and "position" (a node id or {"lat", "lon"}). Only
+    the part of the search the changed obstacles touch is redone;
+    "expanded" is how many nodes that took, against "initial_expanded"
+    for the session's first full search. "compare": true also runs a
+    fresh search for its count in "full_search_expanded".
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    session_id = data.get('session_id')
+    if not isinstance(session_id, str):
+        return jsonify({'error': "'session_id' must be a string"}), 400
+    session = route_sessions.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Unknown or expired route session'}), 404
+
+    compiled_graph = get_compiled_graph()
+    try:
+        position = resolve_node(data.get('position'), compiled_graph)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f"'position' must be a node ID or a lat/lon point. {str(e)}"}), 400
+    if position not in compiled_graph:
+        return jsonify({'error': f"Invalid node: {position}"}), 400
+
+    try:
+        obstacle_version, obstacles_from_db = obstacle_store.current()
+    except Exception as e:
+        return jsonify({'error': f"Error fetching obstacles: {str(e)}"}), 500
+
+    try:
+        with routing_executor.slot() as deadline, session.lock:
+            expanded = session.repair(compiled_graph.index_of(position), obstacles_from_db, deadline)
+            path = session.path()
+            start, destination = session.start, session.destination
+        result = {'expanded': expanded, 'initial_expanded': session.initial_expanded,
+                  'obstacle_version': obstacle_version}
+        if data.get('compare'):
+            # a separate bounded search, so the session isn't held up by it
+            with routing_executor.slot() as deadline:
+                result['full_search_expanded'] = RouteSession(
+                    compiled_graph, start, destination, obstacles_from_db, deadline).expanded
+    except (RoutingSaturated, RoutingTimeout, RoutingUnavailable) as e:
+        return routing_error(e)
+
+    if path is None:
+        return jsonify(dict(result, error='No path found')), 400
+    result['path'] = get_snapshot().path_coordinates(path)
+    return jsonify(result)
+
+# explored edges per NDJSON line in /shortest_path/stream
+STREAM_BATCH_SIZE = 500
+
+@main_routes.route('/shortest_path/stream', methods=['POST'])
+def shortest_path_stream():
+    """Route plus explored edges for visualization, as newline-delimited JSON.
+
+    The first line is {"path": [...]}, then {"explored": [...]} lines of up to
+    "batch" edges and finally {"done": true, ...} with the counts. "sample"
+    keeps every n-th explored edge and "max_explored" decimates further so
+    at most that many are sent.
+    """
+    data = request.get_json()
+    route, error = parse_route_request(data)
+    if error:
+        return error
+    compiled_graph, source_node, destination_node = route
+
+    try:
+        sample = max(int(data.get('sample', 1)), 1)
+        max_explored = int(data['max_explored']) if data.get('max_explored') is not None else None
+        batch_size = min(max(int(data.get('batch', STREAM_BATCH_SIZE)), 1), 10 * STREAM_BATCH_SIZE)
+    except (TypeError, ValueError):
+        return jsonify({'error': "'sample', 'max_explored' and 'batch' must be integers"}), 400
+
+    try:
+        obstacle_version, obstacles_from_db = obstacle_store.current()
+    except Exception as e:
+        return jsonify({'error': f"Error fetching obstacles: {str(e)}"}), 500
+
+    try:
+        path, explored_edges, _ = run_search(compiled_graph, source_node, destination_node,
+                                             obstacles_from_db, True)
+    except (RoutingSaturated, RoutingTimeout, RoutingUnavailable) as e:
+        return routing_error(e)
+    if path is None:
+        return jsonify({'error': 'No path found'}), 400
+
+    # decimate with a uniform stride so the sample still covers the search
+    stride = sample
+    if max_explored is not None and max_explored > 0:
+        stride = max(stride, -(-len(explored_edges) // max_explored))
+    sent_edges = explored_edges[::stride] if max_explored != 0 else []
+
+    snapshot = get_snapshot()
+
+    def generate():
+        yield json.dumps({'path': snapshot.path_coordinates(path)}) + '\n'
+        for start in range(0, len(sent_edges), batch_size):
+            polylines = snapshot.edge_polylines(sent_edges[start:start + batch_size])
+            yield json.dumps({'explored': polylines}) + '\n'
+        yield json.dumps({'done': True, 'explored_total': len(explored_edges),
+                          'explored_sent': len(sent_edges)}) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+# most routes /alternate_routes returns and its default latency budget
+MAX_ALTERNATE_ROUTES = 5
+ALTERNATE_BUDGET_MS = 500
+
+@main_routes.route('/alternate_routes', methods=['POST'])
+def alternate_routes():
+    """Up to k diverse routes between two nodes, shortest first.
+
+    "k" (default 3), "method" (plateau or penalty), "max_similarity" (share
+    of a route's length it may have in common with an earlier one, default
+    0.7), "max_stretch" (how much longer than the shortest route, default
+    0.4) and "budget_ms", after which the routes found so far are returned.
+    """
+    data = request.get_json()
+    route, error = parse_route_request(data)
+    if error:
+        return error
+    compiled_graph, source_node, destination_node = route
+
+    method = data.get('method', 'plateau')
+    if method not in ALTERNATE_METHODS:
+        return jsonify({'error': f"'method' must be one of {', '.join(ALTERNATE_METHODS)}"}), 400
+    try:
+        k = min(max(int(data.get('k', 3)), 1), MAX_ALTERNATE_ROUTES)
+        max_similarity = float(data.get('max_similarity', 0.7))
+        max_stretch = float(data.get('max_stretch', 0.4))
+        budget = float(data.get('budget_ms', ALTERNATE_BUDGET_MS)) / 1000
+    except (TypeError, ValueError):
+        return jsonify({'error': "'k', 'max_similarity', 'max_stretch' and 'budget_ms' must be numbers"}), 400
+
+    try:
+        _, obstacles_from_db = obstacle_store.current()
+    except Exception as e:
+        return jsonify({'error': f"Error fetching obstacles: {str(e)}"}), 500
+
+    try:
+        routes = routing_executor.run(
+            alternative_routes,
+            compiled_graph.index_of(source_node),
+            compiled_graph.index_of(destination_node),
+            obstacles_from_db,
+            k=k, method=method, max_similarity=max_similarity, max_stretch=max_stretch, budget=budget,
+        )
+    except (RoutingSaturated, RoutingTimeout, RoutingUnavailable) as e:
+        return routing_error(e)
+    if not routes:
+        return jsonify({'error': 'No path found'}), 400
+
+    snapshot = get_snapshot()
+    return jsonify({'routes': [
+        {'path': snapshot.path_coordinates(path), 'length': length, 'similarity': share}
+        for path, length, share in routes
+    ]})
+
+# most sources and most targets in one /distance_matrix request
+MAX_MATRIX_POINTS = 100
+
+@main_routes.route('/distance_matrix', methods=['POST'])
+def get_distance_matrix():
+    """Road distances in metres from every source to every target.
+
+    "sources" and "targets" are lists of node ids or {"lat", "lon"} points,
+    "paths": true adds the route coordinates. Unreachable pairs are null.
+    """
+    data = request.get_json(silent=True) or {}
+    sources, targets = data.get('sources'), data.get('targets')
+    if not isinstance(sources, list) or not isinstance(targets, list) \
+            or len(sources) > MAX_MATRIX_POINTS or len(targets) > MAX_MATRIX_POINTS:
+        return jsonify({'error': f"'sources' and 'targets' must be lists of at most {MAX_MATRIX_POINTS} nodes"}), 400
+
+    compiled_graph = get_compiled_graph()
+    try:
+        source_nodes = [resolve_node(value, compiled_graph) for value in sources]
+        target_nodes = [resolve_node(value, compiled_graph) for value in targets]
+    except (TypeError, ValueError) as e:
         return jsonify({'error': f'Invalid node IDs, must be integers. {str(e)}'}), 400
 
+    unknown = [node for node in source_nodes + target_nodes if node not in compiled_graph]
+    if unknown:
+        return jsonify({'error': f"Invalid nodes: {', '.join(map(str, unknown))}"}), 400
+
+    try:
+        # one obstacle lookup for the whole matrix
+        _, obstacles_from_db = obstacle_store.current()
+    except Exception as e:
+        return jsonify({'error': f"Error fetching obstacles: {str(e)}"}), 500
+
+    with_paths = data.get('paths') is True
+    try:
+        distances, paths = routing_executor.run(
+            distance_matrix,
+            compiled_graph.to_dense(source_nodes),
+            compiled_graph.to_dense(target_nodes),
+            obstacles_from_db,
+            with_paths=with_paths,
+        )
+    except (RoutingSaturated, RoutingTimeout, RoutingUnavailable) as e:
+        return routing_error(e)
+
+    result = {'sources': source_nodes, 'targets': target_nodes, 'distances': distances}
+    if with_paths:
+        snapshot = get_snapshot()
+        result['paths'] = [[snapshot.path_coordinates(path) if path is not None else None for path in row]
+                           for row in paths]
+    return jsonify(result)
+
 
 # auth routes
 
@@ -296,12 +844,19 @@ def logout():
 def create_obstacle():
     data = request.json
 
-    print("Received Data:", data)
-
     required_fields = ["node_id", "latitude", "longitude", "name", "type", "expected_duration", "severity", "owner"]
-    if not all(field in data for field in required_fields):
+    if not isinstance(data, dict) or not all(field in data for field in required_fields):
         return jsonify({"error": "Missing fields"}), 400
 
+    # checked before the insert, a row the obstacle store can't read would
+    # otherwise be saved anyway
+    try:
+        int(data["node_id"])
+        if data["latitude"] is not None or data["longitude"] is not None:
+            parse_point(data["latitude"], data["longitude"])
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"'node_id' must be an integer and 'latitude'/'longitude' numbers. {e}"}), 400
+
     image_url = None
 
     try:
@@ -333,12 +888,14 @@ def create_obstacle():
             "image_url": image_url  # Save the Cloudinary URL here
         }).execute()
 
-        print("Response from Supabase:", response)
+        logger.info("Obstacle reported at node %s by %s", data["node_id"], data["owner"])
+        obstacle_store.add(response.data)
+        metrics.OBSTACLE_CHANGES.inc(len(response.data), 'reported')
 
         return jsonify({"success": True, "data": response.data}), 201
 
     except Exception as e:
-        print("Error occurred:", e)
+        logger.exception("Reporting an obstacle failed")
         return jsonify({"error": str(e)}), 500
 
 # ----------------------
@@ -400,9 +957,6 @@ def delete_obstacle():
     obstacle_id = data.get("id")
     requester_id = data.get("owner")
 
-    print("Received request to delete:", obstacle_id, "from user:", requester_id)
-
-
     if not obstacle_id or not requester_id:
         return jsonify({"error": "Missing obstacle ID or owner ID"}), 400
 
@@ -418,20 +972,53 @@ def delete_obstacle():
 
         # Perform the deletion
         delete_response = supabase.table("obstacles").delete().eq("id", obstacle_id).execute()
+        obstacle_store.remove(response.data["id"])
+        metrics.OBSTACLE_CHANGES.inc(1, 'deleted')
+        logger.info("Obstacle %s deleted by %s", obstacle_id, requester_id)
 
         return jsonify({"success": True, "message": "Obstacle deleted"}), 200
 
     except Exception as e:
+        logger.exception("Deleting obstacle %s failed", obstacle_id)
         return jsonify({"error": str(e)}), 500
 
+@main_routes.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({"route_cache": route_cache.stats(), "routing_executor": routing_executor.stats(),
+                    "geocoder": geocoder.stats(), "route_sessions": route_sessions.stats()})
+
+def stats_metrics():
+    """The caches' and pools' own stats as Prometheus samples for /metrics."""
+    samples = []
+    for prefix, stats in (('routing_route_cache', route_cache.stats()),
+                          ('routing_executor', routing_executor.stats()),
+                          ('routing_geocoder', geocoder.stats()),
+                          ('routing_route_sessions', route_sessions.stats()),
+                          ('routing_obstacles', obstacle_store.stats())):
+        for key, value in stats.items():
+            # the caches' hit, miss and eviction counts only ever go up
+            kind = 'counter' if key in ('hits', 'misses', 'evictions', 'invalidations', 'errors',
+                                        'rejected', 'timeouts', 'pool_failures', 'skipped') else 'gauge'
+            name = f'{prefix}_{key}_total' if kind == 'counter' else f'{prefix}_{key}'
+            samples.append((name, kind, f'{key} from the {prefix[8:]} stats.', [({}, value)]))
+    tiles = tile_blob.cache_info()
+    samples.append(('routing_tile_cache_hits_total', 'counter', 'Tile cache hits.', [({}, tiles.hits)]))
+    samples.append(('routing_tile_cache_misses_total', 'counter', 'Tile cache misses.', [({}, tiles.misses)]))
+    return samples
+
+metrics.register_collector(stats_metrics)
+
+@main_routes.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 #map boundary
 
 @main_routes.route('/map_boundary', methods=['GET'])
 def map_boundary():
     try:
-        coords = np.array([(data['x'], data['y']) for node, data in graph.nodes(data=True)])
-        hull = ConvexHull(coords)
-        boundary_coords = [(coords[vertex][1], coords[vertex][0]) for vertex in hull.vertices]  # lat, lon
+        # convex hull of the nodes, computed when the snapshot was built
+        boundary_coords = get_snapshot().arrays['boundary'].tolist()  # lat, lon
         return jsonify({"boundary": boundary_coords})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -445,30 +1032,15 @@ def search_place():
     if not query:
         return jsonify({"error": "Query parameter 'q' is required"}), 400
 
-    try:
-        nominatim_url = f"https://nominatim.openstreetmap.org/search"
-        params = {
-            'q': query,
-            'format': 'json',
-            'limit': 5,
-            'countrycodes': 'np'
-        }
-
-        headers = {
-            'User-Agent': 'YourAppName/1.0 (your@email.com)'
-        }
-
-        response = requests.get(nominatim_url, params=params, headers=headers)
-        results = response.json()
-
-        places = [{
-            "display_name": place.get("display_name"),
-            "lat": float(place.get("lat")),
-            "lon": float(place.get("lon"))
-        } for place in results]
-
+    snapshot = get_snapshot()
+    places = place_index(snapshot).search(query)
+    if places:
         return jsonify(places)
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    # nothing local, ask the remote geocoder
+    try:
+        places = geocoder.search(query)
+    except (requests.RequestException, ValueError, TypeError) as e:
+        return jsonify({"error": f"Place search failed: {e}"}), 502
+    return jsonify(with_nearest_nodes(snapshot.compiled, places))
 
@@ -0,0 +1,197 @@
+# routing_executor.py
+"""Process pool for the CPU-bound route searches.
+
+The search is pure Python and holds the GIL, so in one process concurrent
+requests just take turns. RoutingExecutor hands each search to one of
+ROUTING_WORKERS processes instead. Every worker opens the graph snapshot
+itself; the arrays are memory-mapped, so they share one copy through the
+page cache, but each worker also builds its own plain-list copies of the
+adjacency for the search loop (see CompiledGraph), which is most of a
+worker's memory. At most ROUTING_QUEUE_SIZE searches may be queued or running,
+more raise RoutingSaturated (the routes answer 429), and a caller stops
+waiting after ROUTING_TIMEOUT seconds with RoutingTimeout. A worker that
+dies (killed for memory, a crash) breaks the whole pool: the searches
+caught in it raise RoutingUnavailable (503) and the next one starts a
+fresh pool.
+
+ROUTING_WORKERS=0 runs searches inline in the calling thread, with the
+same queue limit. Work that has to stay in the web process (the D* Lite
+route sessions, see route_repair.py) takes a queue slot with slot() and
+checks the deadline it gets itself.
+"""
+import atexit
+import concurrent.futures
+import concurrent.futures.process
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from ch import get_ch
+from metrics import profiled
+from pathfinding import bidirectional_astar_dense, ch_shortest_path
+from snapshot import get_snapshot
+
+ROUTING_WORKERS = int(os.environ.get("ROUTING_WORKERS", min(4, os.cpu_count() or 1)))
+# searches queued or running at once, across all workers
+ROUTING_QUEUE_SIZE = int(os.environ.get("ROUTING_QUEUE_SIZE", 4 * max(ROUTING_WORKERS, 1)))
+# seconds a request waits for its search
+ROUTING_TIMEOUT = float(os.environ.get("ROUTING_TIMEOUT", 10))
+
+
+class RoutingSaturated(Exception):
+    """Raised when the executor already has a full queue."""
+
+
+class RoutingTimeout(Exception):
+    """Raised when a search doesn't finish within the timeout."""
+
+
+class RoutingUnavailable(Exception):
+    """Raised when the worker pool broke under a search."""
+
+
+def route_search(graph, source, destination, obstacles, track_explored=True,
+                 algorithm='astar', heuristic_type='haversine'):
+    """One route search on dense indices, as /shortest_path runs it.
+
+    algorithm='ch' uses the contraction hierarchy when one was built for
+    the snapshot (see ch.py) and bidirectional A* otherwise, with
+    heuristic_type picking the A* estimate. Returns (path, explored edges,
+    stats), stats being the search's counters plus its time in seconds.
+    """
+    stats = {}
+    start = time.perf_counter()
+    ch = get_ch(get_snapshot()) if algorithm == 'ch' else None
+    if ch is not None:
+        path, explored_edges = ch_shortest_path(ch, graph, source, destination, obstacles, track_explored,
+                                                stats=stats)
+    else:
+        path, explored_edges = bidirectional_astar_dense(
+            graph, source, destination, obstacles, track_explored=track_explored,
+            heuristic_type=heuristic_type, stats=stats,
+        )
+    stats['seconds'] = time.perf_counter() - start
+    return path, explored_edges, stats
+
+
+def _attach():
+    # worker start-up: map the snapshot before the first request needs it
+    get_snapshot()
+
+
+def _call(fn, args, kwargs):
+    # a no-op unless PROFILE_SLOW_QUERIES is set, see metrics.py
+    with profiled(fn.__name__):
+        return fn(get_snapshot().compiled, *args, **kwargs)
+
+
+class RoutingExecutor:
+    """Runs fn(compiled_graph, *args, **kwargs) in a worker process.
+
+    fn has to be a module-level function so it can be sent to a worker,
+    and its arguments and result have to be picklable.
+    """
+
+    def __init__(self, workers=ROUTING_WORKERS, queue_size=ROUTING_QUEUE_SIZE, timeout=ROUTING_TIMEOUT):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.rejected = 0
+        self.timeouts = 0
+        # pools thrown away after a worker died
+        self.pool_failures = 0
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        # started on first use, so importing the routes spawns nothing
+        with self._lock:
+            if self._pool is None:
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    # spawn, not fork: the server process has threads
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_attach,
+                )
+                atexit.register(self.shutdown)
+            return self._pool
+
+    def _discard(self, pool):
+        # several callers can see the same broken pool, only the first
+        # replaces it
+        with self._lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+            self.pool_failures += 1
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _acquire(self):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise RoutingSaturated()
+
+    @contextmanager
+    def slot(self):
+        """Hold a queue slot for work run in the calling thread.
+
+        Yields the time.monotonic() deadline the work has to check itself,
+        raising RoutingTimeout once it is past. Raises RoutingSaturated
+        when the queue is full, like run().
+        """
+        self._acquire()
+        try:
+            yield time.monotonic() + self.timeout
+        except RoutingTimeout:
+            self.timeouts += 1
+            raise
+        finally:
+            self._slots.release()
+
+    def run(self, fn, *args, **kwargs):
+        """fn's result, raising RoutingSaturated, RoutingTimeout or RoutingUnavailable."""
+        if self.workers <= 0:
+            with self.slot():
+                return _call(fn, args, kwargs)
+
+        self._acquire()
+        try:
+            pool = self._get_pool()
+            future = pool.submit(_call, fn, args, kwargs)
+        except concurrent.futures.process.BrokenProcessPool:
+            self._slots.release()
+            self._discard(pool)
+            raise RoutingUnavailable()
+        except Exception:
+            self._slots.release()
+            raise
+        # the slot frees up when the worker is done, even after a timeout,
+        # so abandoned searches still count against the queue
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self.timeouts += 1
+            raise RoutingTimeout()
+        except concurrent.futures.process.BrokenProcessPool:
+            self._discard(pool)
+            raise RoutingUnavailable()
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'pool_failures': self.pool_failures,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,542 @@
+# snapshot.py
+"""On-disk snapshot of the processed road network.
+
+The snapshot is a directory of plain .npy arrays (node ids, coordinates,
+the CSR adjacency, every parallel edge with its flattened geometry and the
+ALT landmark tables) plus a small strings.json/meta.json, so a worker can start serving without
+network access or osmnx. The map tile index, the outline of the area
+(see tiles.py) and the place search table (see place_search.py) are
+precomputed too. The arrays are memory-mapped read-only, so every
+worker process on the host shares one copy through the page cache.
+Rebuild it with
+
+    python snapshot.py                   # download from OSM
+    python snapshot.py --graphml G.xml   # from a saved osmnx graph
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not on Windows, builds there aren't locked across processes
+    fcntl = None
+
+from compiled_graph import CompiledGraph, compile_graph
+from landmarks import landmark_arrays
+from place_search import download_features, place_arrays
+from tiles import boundary_hull, tile_index_arrays
+
+logger = logging.getLogger(__name__)
+
+# bump whenever the array layout changes, older snapshots are rebuilt
+SNAPSHOT_VERSION = 5
+
+PLACE_NAMES = ["Kathmandu, Nepal", "Lalitpur, Nepal"]
+NETWORK_TYPE = "all"
+
+SNAPSHOT_PATH = os.environ.get(
+    "GRAPH_SNAPSHOT_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshot"),
+)
+
+ARRAYS = [
+    # nodes, indexed by dense id
+    'node_ids', 'lat', 'lon', 'street_count',
+    # CSR adjacency with the min parallel-edge length
+    'offsets', 'targets', 'weights',
+    # every parallel edge, grouped by source node in CSR order
+    'edge_u', 'edge_v', 'edge_key', 'edge_osmid', 'edge_length', 'edge_oneway',
+    'edge_name', 'edge_highway',
+    # edge e's geometry is geom_lat/geom_lon[geom_offsets[e]:geom_offsets[e + 1]],
+    # empty when the edge is a straight line between its nodes
+    'geom_offsets', 'geom_lat', 'geom_lon',
+    # per CSR edge: the edge-table row it was built from (the shortest
+    # parallel edge) and that edge's full polyline, straight lines included,
+    # so CSR edge c is line_lat/line_lon[line_offsets[c]:line_offsets[c + 1]]
+    'csr_edge_row', 'line_offsets', 'line_lat', 'line_lon',
+    # ALT landmarks (dense ids) and (nodes, landmarks) distance tables
+    'landmarks', 'landmark_from', 'landmark_to',
+    # map tiles at tiles.TILE_ZOOM: sorted tile keys and the edge-table rows
+    # and dense nodes of tile i over tile_edge_offsets/tile_node_offsets
+    'tile_keys', 'tile_edge_offsets', 'tile_edges', 'tile_node_offsets', 'tile_nodes',
+    # (k, 2) [lat, lon] convex hull of the nodes for /map_boundary
+    'boundary',
+    # searchable places, named features and streets: name and kind in the
+    # string table, coordinates and the nearest dense node
+    'place_name', 'place_kind', 'place_lat', 'place_lon', 'place_node',
+]
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot is missing, incomplete or from another version."""
+
+
+class GraphSnapshot:
+    """A loaded snapshot: the CompiledGraph plus lazily rebuilt osmnx views.
+
+    Routing and serialization read the arrays directly; the networkx graph
+    and GeoDataFrames are only built for the endpoints that need them.
+    """
+
+    def __init__(self, arrays, strings, meta):
+        self.arrays = arrays
+        # string table for edge names and highway types, -1 means missing
+        self.strings = strings
+        self.meta = meta
+
+        self.compiled = CompiledGraph(
+            arrays['node_ids'],
+            arrays['offsets'],
+            arrays['targets'],
+            arrays['weights'],
+            arrays['lat'],
+            arrays['lon'],
+            landmark_from=arrays['landmark_from'],
+            landmark_to=arrays['landmark_to'],
+        )
+
+        self._lock = threading.Lock()
+        self._graph = None
+        self._gdfs = None
+
+    def string(self, i):
+        return self.strings[i] if i >= 0 else None
+
+    def edge_polylines(self, edges):
+        """One [[lat, lon], ...] list per CSR edge index, in order."""
+        line_offsets = self.arrays['line_offsets']
+        edges = np.asarray(edges, dtype=np.int64)
+        starts, ends = line_offsets[edges], line_offsets[edges + 1]
+        coords = self._line_coords(starts, ends)
+
+        # split the one flat list back into edges with plain list slicing
+        polylines = []
+        position = 0
+        for count in (ends - starts).tolist():
+            polylines.append(coords[position:position + count])
+            position += count
+        return polylines
+
+    def path_coordinates(self, path):
+        """Flat [[lat, lon], ...] along a path of dense node indices."""
+        compiled = self.compiled
+        edges = compiled.path_edges(path)
+        # the searches only follow graph edges, so every step has one; a
+        # pair without (a path from elsewhere) contributes no coordinates
+        edges = edges[edges >= 0]
+        line_offsets = self.arrays['line_offsets']
+        return self._line_coords(line_offsets[edges], line_offsets[edges + 1])
+
+    def nearest_edge(self, lat, lon, near=-1, candidates=8):
+        """(CSR edge index, distance in metres) of the road closest to a point.
+
+        Looks at the edges around the candidates nearest nodes and, if
+        given, dense node near, measuring to their full polylines. Returns
+        (-1, inf) when none of them has an edge.
+        """
+        compiled = self.compiled
+        point = compiled.project(lat, lon)[0]
+        _, nodes = compiled.kdtree().query(point, k=min(candidates, len(compiled)))
+        nodes = set(np.atleast_1d(nodes).tolist())
+        if near >= 0:
+            nodes.add(near)
+        edges = np.unique(np.array([edge for node in nodes for edge in compiled.incident_edges(node)],
+                                   dtype=np.int64))
+        if not len(edges):
+            return -1, float('inf')
+
+        line_offsets = self.arrays['line_offsets']
+        starts, ends = line_offsets[edges], line_offsets[edges + 1]
+        counts = ends - starts
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        owner = np.repeat(np.arange(len(edges)), counts)
+        points = compiled.project(self.arrays['line_lat'][positions], self.arrays['line_lon'][positions])
+
+        # segments between consecutive points of the same polyline
+        same = owner[1:] == owner[:-1]
+        a, b, owner = points[:-1][same], points[1:][same], owner[:-1][same]
+        ab = b - a
+        t = np.clip(((point - a) * ab).sum(axis=1) / np.maximum((ab * ab).sum(axis=1), 1e-12), 0, 1)
+        distances = np.hypot(*(a + t[:, None] * ab - point).T)
+        best = int(np.argmin(distances))
+        return int(edges[owner[best]]), float(distances[best])
+
+    def _line_coords(self, starts, ends):
+        """Concatenated line points for the [start, end) ranges as one list."""
+        counts = ends - starts
+        if not counts.sum():
+            return []
+        # index of every point: each range's start repeated, plus 0..count-1
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return np.column_stack([self.arrays['line_lat'][positions], self.arrays['line_lon'][positions]]).tolist()
+
+    def graph(self):
+        """The osmnx MultiDiGraph rebuilt from the arrays, built on first use."""
+        with self._lock:
+            if self._graph is None:
+                self._graph = self._build_graph()
+            return self._graph
+
+    def gdfs(self):
+        """(nodes, edges) GeoDataFrames as from ox.graph_to_gdfs, built on first use."""
+        graph = self.graph()
+        with self._lock:
+            if self._gdfs is None:
+                import osmnx as ox
+                self._gdfs = ox.graph_to_gdfs(graph)
+            return self._gdfs
+
+    def _build_graph(self):
+        import networkx as nx
+        from shapely.geometry import LineString
+
+        a = self.arrays
+        graph = nx.MultiDiGraph(crs=self.meta['crs'])
+
+        node_ids = a['node_ids'].tolist()
+        for node, y, x, street_count in zip(node_ids, a['lat'].tolist(), a['lon'].tolist(),
+                                            a['street_count'].tolist()):
+            graph.add_node(node, y=y, x=x, street_count=street_count)
+
+        geom_offsets = a['geom_offsets'].tolist()
+        geom_lat, geom_lon = a['geom_lat'], a['geom_lon']
+        columns = zip(a['edge_u'].tolist(), a['edge_v'].tolist(), a['edge_key'].tolist(),
+                      a['edge_osmid'].tolist(), a['edge_length'].tolist(), a['edge_oneway'].tolist(),
+                      a['edge_name'].tolist(), a['edge_highway'].tolist())
+
+        for e, (u, v, key, osmid, length, oneway, name, highway) in enumerate(columns):
+            data = {'osmid': osmid, 'length': length, 'oneway': oneway}
+            if name >= 0:
+                data['name'] = self.strings[name]
+            if highway >= 0:
+                data['highway'] = self.strings[highway]
+            start, end = geom_offsets[e], geom_offsets[e + 1]
+            if end > start:
+                data['geometry'] = LineString(zip(geom_lon[start:end].tolist(), geom_lat[start:end].tolist()))
+            graph.add_edge(node_ids[u], node_ids[v], key=key, **data)
+
+        return graph
+
+
+def _as_text(value):
+    """osmnx merges ways into list attributes, flatten them for the string table."""
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return "; ".join(str(v) for v in value)
+    return str(value)
+
+
+def _first_int(value):
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else -1
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return -1
+
+
+def build_snapshot(graph, path=SNAPSHOT_PATH, places=None, features=()):
+    """Write the snapshot for an osmnx MultiDiGraph to the directory at path.
+
+    features are the (name, kind, lat, lon) named places to search besides
+    the street names, see place_search.download_features().
+    """
+    compiled = compile_graph(graph)
+    node_ids = compiled.node_ids.tolist()
+    index = {node: i for i, node in enumerate(node_ids)}
+
+    strings = []
+    string_ids = {}
+
+    def intern(value):
+        text = _as_text(value)
+        if text is None:
+            return -1
+        if text not in string_ids:
+            string_ids[text] = len(strings)
+            strings.append(text)
+        return string_ids[text]
+
+    edges = {name: [] for name in ('u', 'v', 'key', 'osmid', 'length', 'oneway', 'name', 'highway')}
+    geom_offsets = [0]
+    geom_lat = []
+    geom_lon = []
+
+    # same node and neighbour order as compile_graph
+    for node in node_ids:
+        for neighbor, edge_data in graph.adj[node].items():
+            for key, data in edge_data.items():
+                edges['u'].append(index[node])
+                edges['v'].append(index[neighbor])
+                edges['key'].append(key)
+                edges['osmid'].append(_first_int(data.get('osmid')))
+                edges['length'].append(data.get('length', float('inf')))
+                edges['oneway'].append(bool(data.get('oneway', False)))
+                edges['name'].append(intern(data.get('name')))
+                edges['highway'].append(intern(data.get('highway')))
+                if 'geometry' in data:
+                    for lon, lat in data['geometry'].coords:
+                        geom_lat.append(lat)
+                        geom_lon.append(lon)
+                geom_offsets.append(len(geom_lat))
+
+    arrays = {
+        'node_ids': compiled.node_ids,
+        'lat': compiled.lat,
+        'lon': compiled.lon,
+        'street_count': np.array([graph.nodes[node].get('street_count', 0) for node in node_ids],
+                                 dtype=np.int32),
+        'offsets': compiled.offsets,
+        'targets': compiled.targets,
+        'weights': compiled.weights,
+        'edge_u': np.array(edges['u'], dtype=np.int64),
+        'edge_v': np.array(edges['v'], dtype=np.int64),
+        'edge_key': np.array(edges['key'], dtype=np.int64),
+        'edge_osmid': np.array(edges['osmid'], dtype=np.int64),
+        'edge_length': np.array(edges['length'], dtype=np.float64),
+        'edge_oneway': np.array(edges['oneway'], dtype=bool),
+        'edge_name': np.array(edges['name'], dtype=np.int32),
+        'edge_highway': np.array(edges['highway'], dtype=np.int32),
+        'geom_offsets': np.array(geom_offsets, dtype=np.int64),
+        'geom_lat': np.array(geom_lat, dtype=np.float64),
+        'geom_lon': np.array(geom_lon, dtype=np.float64),
+    }
+
+    arrays.update(flatten_polylines(arrays))
+    arrays.update(landmark_arrays(compiled))
+    arrays.update(tile_index_arrays(arrays))
+    arrays['boundary'] = boundary_hull(compiled.lat, compiled.lon)
+    arrays.update(place_arrays(arrays, strings, intern, compiled, features))
+
+    meta = {
+        'version': SNAPSHOT_VERSION,
+        'places': places,
+        'crs': str(graph.graph.get('crs', 'epsg:4326')),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'nodes': len(compiled),
+        'edges': len(edges['u']),
+        'search_places': len(arrays['place_name']),
+    }
+
+    # every build writes a new directory next to the target and path is a
+    # symlink to the current one, replacing the link swaps snapshots
+    # atomically so readers see either the old one or the new one
+    path = path.rstrip(os.sep)
+    parent, name = os.path.split(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix=f'.{name}.', dir=parent)
+    try:
+        # mkdtemp only lets its owner in
+        os.chmod(tmp_path, 0o755)
+        for array in ARRAYS:
+            np.save(os.path.join(tmp_path, array + '.npy'), arrays[array])
+        with open(os.path.join(tmp_path, 'strings.json'), 'w') as f:
+            json.dump(strings, f)
+        # meta.json goes last, it marks the snapshot as complete
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        _swap_in(tmp_path, path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    return meta
+
+
+def _swap_in(directory, path):
+    """Point the symlink at path to directory and remove the one it replaced."""
+    parent = os.path.dirname(directory)
+    previous = None
+    if os.path.islink(path):
+        previous = os.path.join(parent, os.readlink(path))
+    elif os.path.isdir(path):
+        # a snapshot from before the symlink layout, moved aside once;
+        # readers in between miss it and wait on build_lock() instead
+        previous = tempfile.mkdtemp(prefix=f'.{os.path.basename(path)}.', suffix='.old', dir=parent)
+        os.replace(path, os.path.join(previous, 'snapshot'))
+
+    # relative, so the snapshot and its versions can be moved together
+    link = directory + '.link'
+    os.symlink(os.path.basename(directory), link)
+    try:
+        os.replace(link, path)
+    except BaseException:
+        os.unlink(link)
+        raise
+    # workers that already loaded it keep their memory maps, on POSIX the
+    # files stay around until the last one is closed
+    if previous is not None and os.path.abspath(previous) != os.path.abspath(directory):
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+def flatten_polylines(arrays):
+    """Per-CSR-edge arrays for serialization, derived from the edge table.
+
+    Picks the shortest parallel edge for every CSR edge (the one the search
+    actually traversed, first one on ties like min()) and flattens its
+    geometry, or the straight line between its nodes, into one array.
+    """
+    u, v, length = arrays['edge_u'], arrays['edge_v'], arrays['edge_length']
+    if not len(u):
+        return {
+            'csr_edge_row': np.zeros(0, dtype=np.int64),
+            'line_offsets': np.zeros(1, dtype=np.int64),
+            'line_lat': np.zeros(0, dtype=np.float64),
+            'line_lon': np.zeros(0, dtype=np.float64),
+        }
+
+    # parallel edges are adjacent rows of the edge table
+    new_group = np.r_[True, (u[1:] != u[:-1]) | (v[1:] != v[:-1])]
+    group = np.cumsum(new_group) - 1
+    group_min = np.minimum.reduceat(length, np.flatnonzero(new_group))
+
+    # first row of each group that has the group's minimum length
+    candidates = np.flatnonzero(length == group_min[group])
+    first = candidates[np.r_[True, group[candidates][1:] != group[candidates][:-1]]]
+    # compile_graph drops edges without a finite length, so do the same
+    rows = first[np.isfinite(group_min)]
+
+    geom_offsets = arrays['geom_offsets']
+    geom_count = geom_offsets[rows + 1] - geom_offsets[rows]
+    has_geometry = geom_count > 0
+    counts = np.where(has_geometry, geom_count, 2)
+    line_offsets = np.r_[0, np.cumsum(counts)].astype(np.int64)
+
+    # points come from the geometry table, or from the two end nodes
+    geom_points = len(arrays['geom_lat'])
+    source_lat = np.concatenate([arrays['geom_lat'], arrays['lat']])
+    source_lon = np.concatenate([arrays['geom_lon'], arrays['lon']])
+
+    starts = np.where(has_geometry, geom_offsets[rows], 0)
+    positions = np.repeat(starts - line_offsets[:-1], counts) + np.arange(line_offsets[-1])
+    straight = np.flatnonzero(~has_geometry)
+    positions[line_offsets[straight]] = geom_points + u[rows[straight]]
+    positions[line_offsets[straight] + 1] = geom_points + v[rows[straight]]
+
+    return {
+        'csr_edge_row': rows.astype(np.int64),
+        'line_offsets': line_offsets,
+        'line_lat': source_lat[positions],
+        'line_lon': source_lon[positions],
+    }
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    """Load a snapshot directory, raising SnapshotError if it can't be used."""
+    meta_path = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta_path):
+        raise SnapshotError(f"No graph snapshot at {path}")
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get('version') != SNAPSHOT_VERSION:
+        raise SnapshotError(f"Snapshot version {meta.get('version')} at {path}, expected {SNAPSHOT_VERSION}")
+
+    try:
+        arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in ARRAYS}
+        with open(os.path.join(path, 'strings.json')) as f:
+            strings = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"Incomplete snapshot at {path}: {e}")
+
+    return GraphSnapshot(arrays, strings, meta)
+
+
+def download_graph(place_names=PLACE_NAMES):
+    """Fetch the road network from OpenStreetMap (needs network access)."""
+    import osmnx as ox
+    return ox.graph_from_place(place_names, network_type=NETWORK_TYPE)
+
+
+def download_places(place_names=PLACE_NAMES):
+    """The named features for the place search, empty if they can't be fetched.
+
+    Street names still make the search useful without them, so a failure
+    here doesn't stop the snapshot from being built.
+    """
+    try:
+        return download_features(place_names)
+    except Exception as e:
+        logger.warning("Could not download named features (%s), searching street names only", e)
+        return []
+
+
+@contextmanager
+def build_lock(path=SNAPSHOT_PATH):
+    """Hold the lock file next to the snapshot at path, across processes.
+
+    Taken around every build, so workers starting together build the
+    snapshot once and the rest wait and load it.
+    """
+    path = path.rstrip(os.sep)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + '.lock', 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        # closing the file releases the lock
+        yield
+
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+def get_snapshot(path=SNAPSHOT_PATH):
+    """The snapshot at path, loaded on first use and shared afterwards.
+
+    Falls back to downloading the graph and writing the snapshot when none
+    exists yet, which is the only case that needs network access. Build it
+    with `python snapshot.py` before starting the server to keep that off
+    the first request.
+    """
+    with _snapshots_lock:
+        if path not in _snapshots:
+            try:
+                _snapshots[path] = load_snapshot(path)
+            except SnapshotError:
+                with build_lock(path):
+                    # another process may have built it while we waited
+                    try:
+                        _snapshots[path] = load_snapshot(path)
+                    except SnapshotError as e:
+                        logger.warning("%s, rebuilding from OpenStreetMap", e)
+                        build_snapshot(download_graph(), path, PLACE_NAMES, download_places())
+                        _snapshots[path] = load_snapshot(path)
+        return _snapshots[path]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the road network snapshot.")
+    parser.add_argument('--path', default=SNAPSHOT_PATH, help="snapshot directory to write")
+    parser.add_argument('--graphml', help="build from a saved osmnx GraphML file instead of downloading")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    start = time.perf_counter()
+    if args.graphml:
+        import osmnx as ox
+        graph = ox.load_graphml(args.graphml)
+        places = None
+        features = []
+    else:
+        graph = download_graph()
+        places = PLACE_NAMES
+        features = download_places()
+
+    with build_lock(args.path):
+        meta = build_snapshot(graph, args.path, places, features)
+    logger.info("Wrote snapshot v%s (%d nodes, %d edges, %d searchable places) to %s in %.1fs",
+                meta['version'], meta['nodes'], meta['edges'], meta['search_places'],
+                args.path, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
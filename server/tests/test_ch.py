@@ -0,0 +1,91 @@
+# tests/test_ch.py
+import random
+
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from ch import build_ch
+from compiled_graph import compile_graph
+from obstacle_mask import ObstacleMask
+from pathfinding import ch_shortest_path
+from benchmarks.common import synthetic_graph
+
+
+def path_length(compiled, path):
+    return sum(compiled.weights_list[compiled.edge_index(u, v)] for u, v in zip(path[:-1], path[1:]))
+
+
+@pytest.fixture(scope='module')
+def compiled():
+    return compile_graph(synthetic_graph(25, 25))
+
+
+@pytest.fixture(scope='module')
+def ch(compiled):
+    return build_ch(compiled)
+
+
+@pytest.fixture(scope='module')
+def matrix(compiled):
+    n = len(compiled)
+    return csr_matrix((compiled.weights, compiled.targets, compiled.offsets), shape=(n, n))
+
+
+def test_query_matches_dijkstra(compiled, ch, matrix):
+    rng = random.Random(3)
+    pairs = [(rng.randrange(len(compiled)), rng.randrange(len(compiled))) for _ in range(60)]
+    sources = sorted({source for source, _ in pairs})
+    distances = dijkstra(matrix, indices=sources)
+    row = {source: i for i, source in enumerate(sources)}
+
+    for source, destination in pairs:
+        expected = distances[row[source], destination]
+        distance, path = ch.query(source, destination)
+        if np.isinf(expected):
+            assert path is None and distance == float('inf')
+            continue
+        assert distance == pytest.approx(expected, rel=1e-9)
+        assert path[0] == source and path[-1] == destination
+        assert path_length(compiled, path) == pytest.approx(expected, rel=1e-9)
+
+
+def test_blocked_route_falls_back_to_astar(compiled, ch, matrix):
+    rng = random.Random(5)
+    for _ in range(50):
+        source, destination = rng.randrange(len(compiled)), rng.randrange(len(compiled))
+        _, path = ch.query(source, destination)
+        if path is not None and len(path) > 4:
+            break
+    else:
+        pytest.skip("no long enough route in the synthetic graph")
+
+    # block a node in the middle of the unobstructed route
+    blocked = path[len(path) // 2]
+    mask = ObstacleMask.for_graph(compiled, [blocked])
+    stats = {}
+    detour, _ = ch_shortest_path(ch, compiled, source, destination, mask, track_explored=False, stats=stats)
+
+    # the fallback search filled in its counters, the hierarchy alone doesn't
+    assert stats.get('settled', 0) > 0
+    kept = np.ones(len(compiled), dtype=bool)
+    kept[blocked] = False
+    n = len(compiled)
+    rows = np.repeat(np.arange(n), np.diff(compiled.offsets))
+    usable = kept[rows] & kept[compiled.targets]
+    pruned = csr_matrix((compiled.weights[usable], (rows[usable], compiled.targets[usable])), shape=(n, n))
+    expected = dijkstra(pruned, indices=source)[destination]
+    if np.isinf(expected):
+        assert detour is None
+    else:
+        assert blocked not in detour
+        assert path_length(compiled, detour) == pytest.approx(expected, rel=1e-9)
+
+
+def test_unobstructed_route_skips_the_fallback(compiled, ch):
+    mask = ObstacleMask.for_graph(compiled, [])
+    stats = {}
+    path, explored = ch_shortest_path(ch, compiled, 0, len(compiled) - 1, mask, stats=stats)
+    assert path == ch.query(0, len(compiled) - 1)[1]
+    assert explored == [] and stats == {}
@@ -0,0 +1,132 @@
+# tests/test_obstacle_store.py
+from types import SimpleNamespace
+
+import pytest
+
+from compiled_graph import compile_graph
+from local_supabase import LocalSupabase
+from obstacle_store import ObstacleStore
+from benchmarks.common import synthetic_graph
+
+NOW = 1_700_000_000.0
+
+
+class FlakySupabase(LocalSupabase):
+    """LocalSupabase whose queries fail while failing is set."""
+
+    failing = False
+
+    def _execute(self, query):
+        if self.failing:
+            raise ConnectionError("database unreachable")
+        return super()._execute(query)
+
+
+class Clock:
+    def __init__(self, now=NOW):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(scope='module')
+def snapshot():
+    return SimpleNamespace(compiled=compile_graph(synthetic_graph(10, 10)))
+
+
+def obstacle(snapshot, index, **fields):
+    # without coordinates a report blocks its node
+    row = {'node_id': int(snapshot.compiled.node_ids[index]), 'latitude': None, 'longitude': None,
+           'expected_duration': None, 'severity': 'High', 'created_at': NOW}
+    row.update(fields)
+    return row
+
+
+def make_store(snapshot, rows=(), ttl=3600, clock=None, retry=0):
+    client = FlakySupabase({'obstacles': list(rows)})
+    store = ObstacleStore(client, lambda: snapshot, ttl=ttl, clock=clock or Clock(), retry=retry)
+    return client, store
+
+
+def test_add_and_remove_bump_the_version(snapshot):
+    _, store = make_store(snapshot)
+    version, mask = store.current()
+    assert not mask.nodes
+
+    store.add([dict(obstacle(snapshot, 5), id=1)])
+    added, mask = store.current()
+    assert added > version and mask.nodes == {5}
+
+    store.remove(1)
+    removed, mask = store.current()
+    assert removed > added and not mask.nodes
+
+    # forgetting an unknown row changes nothing
+    store.remove(1)
+    assert store.current()[0] == removed
+
+
+def test_reread_after_ttl(snapshot):
+    client, store = make_store(snapshot, ttl=3600)
+    version, _ = store.current()
+    client.table('obstacles').insert(obstacle(snapshot, 7)).execute()
+    # still within the TTL, so the row inserted behind its back isn't seen
+    cached, mask = store.current()
+    assert cached == version and not mask.nodes
+
+    store.ttl = 0
+    reread, mask = store.current()
+    assert reread > version and mask.nodes == {7}
+
+
+def test_failed_reread_keeps_last_mask(snapshot):
+    client, store = make_store(snapshot, [dict(obstacle(snapshot, 3), id=1)], ttl=0)
+    version, mask = store.current()
+    assert mask.nodes == {3}
+
+    client.failing = True
+    assert store.current() == (version, mask)
+    assert store.stats()['errors'] == 1
+
+    client.failing = False
+    client.tables['obstacles'].clear()
+    reread, mask = store.current()
+    assert reread > version and not mask.nodes
+
+
+def test_first_read_failure_raises(snapshot):
+    client, store = make_store(snapshot)
+    client.failing = True
+    with pytest.raises(ConnectionError):
+        store.current()
+
+
+def test_unreadable_row_is_skipped(snapshot):
+    rows = [dict(obstacle(snapshot, 3), id=1), dict(obstacle(snapshot, 4), id=2, node_id='not a node')]
+    _, store = make_store(snapshot, rows)
+    _, mask = store.current()
+    assert mask.nodes == {3}
+    assert store.stats()['skipped'] == 1
+
+
+def test_expiry_from_created_at(snapshot):
+    clock = Clock()
+    rows = [
+        dict(obstacle(snapshot, 1, expected_duration='01:00:00'), id=1),
+        dict(obstacle(snapshot, 2, expected_duration='2 days', created_at='2023-11-14T22:13:20+00:00'), id=2),
+        dict(obstacle(snapshot, 3, expected_duration='00:30:00', created_at=NOW - 3600), id=3),
+        dict(obstacle(snapshot, 4), id=4),
+    ]
+    _, store = make_store(snapshot, rows, clock=clock)
+    # the third one expired half an hour before the first read
+    version, mask = store.current()
+    assert mask.nodes == {1, 2, 4}
+
+    clock.now = NOW + 3600
+    expired, mask = store.current()
+    assert expired > version and mask.nodes == {2, 4}
+
+    clock.now = NOW + 2 * 86400
+    _, mask = store.current()
+    assert mask.nodes == {4}
@@ -0,0 +1,69 @@
+# tests/test_pathfinding.py
+import random
+
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from compiled_graph import compile_graph
+from landmarks import add_landmarks
+from obstacle_mask import ObstacleMask
+from pathfinding import bidirectional_astar_dense
+from benchmarks.common import synthetic_graph
+
+
+@pytest.fixture(scope='module')
+def compiled():
+    return add_landmarks(compile_graph(synthetic_graph(25, 25)))
+
+
+def random_mask(compiled, nodes=0, edges=0, slow=0, seed=7):
+    rng = random.Random(seed)
+    blocked_nodes = rng.sample(range(len(compiled)), nodes)
+    blocked = rng.sample(range(len(compiled.targets)), edges)
+    factors = {edge: 3.0 for edge in rng.sample(range(len(compiled.targets)), slow)}
+    return ObstacleMask.for_graph(compiled, blocked_nodes, blocked, factors)
+
+
+def dijkstra_matrix(compiled, mask):
+    """The graph as Dijkstra should see it: blocked edges gone, slowed ones longer."""
+    n = len(compiled)
+    sources = np.repeat(np.arange(n), np.diff(compiled.offsets))
+    weights = np.array(mask.edge_weights(compiled))
+    keep = np.ones(len(compiled.targets), dtype=bool)
+    keep[list(mask.edges)] = False
+    return csr_matrix((weights[keep], (sources[keep], compiled.targets[keep])), shape=(n, n))
+
+
+MASKS = {
+    'none': {},
+    'blocked nodes': {'nodes': 30},
+    'blocked edges': {'edges': 80},
+    'slowed edges': {'slow': 80},
+}
+
+
+@pytest.mark.parametrize('heuristic_type', ['haversine', 'alt'])
+@pytest.mark.parametrize('obstacles', list(MASKS))
+def test_matches_dijkstra(compiled, heuristic_type, obstacles):
+    mask = random_mask(compiled, **MASKS[obstacles])
+    weights = mask.edge_weights(compiled)
+    rng = random.Random(11)
+    open_nodes = [node for node in range(len(compiled)) if node not in mask.nodes]
+    pairs = [(rng.choice(open_nodes), rng.choice(open_nodes)) for _ in range(80)]
+    sources = sorted({source for source, _ in pairs})
+    distances = dijkstra(dijkstra_matrix(compiled, mask), indices=sources)
+    row = {source: i for i, source in enumerate(sources)}
+
+    for source, destination in pairs:
+        expected = distances[row[source], destination]
+        path, _ = bidirectional_astar_dense(compiled, source, destination, mask,
+                                            track_explored=False, heuristic_type=heuristic_type)
+        if np.isinf(expected):
+            assert path is None
+            continue
+        assert path[0] == source and path[-1] == destination
+        edges = [compiled.edge_index(u, v) for u, v in zip(path[:-1], path[1:])]
+        assert all(edge >= 0 and not mask.edge_blocked[edge] for edge in edges)
+        assert sum(weights[edge] for edge in edges) == pytest.approx(expected, rel=1e-9)
@@ -0,0 +1,135 @@
+# tests/test_place_search.py
+import os
+
+import pytest
+import requests
+
+from place_search import Geocoder, PlaceIndex
+from snapshot import build_snapshot, load_snapshot
+from benchmarks.common import synthetic_graph
+
+
+class StubResponse:
+    def __init__(self, places):
+        self.places = places
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.places
+
+
+class StubSession:
+    """Stands in for requests.Session, answering every query with one place or failing."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        if self.fail:
+            raise requests.Timeout(f"no answer within {timeout}s")
+        return StubResponse([{"display_name": f"{params['q']}, Nepal", "lat": "27.7012", "lon": "85.3213"}])
+
+
+@pytest.fixture(scope='module')
+def snapshot(tmp_path_factory):
+    graph = synthetic_graph(5, 5, names=True)
+    nodes = list(graph.nodes)
+    names = ['Ratna Park', 'Ratna Park Bus Stop', 'Old Ratna Park', 'Himal Bhagwati Mandir']
+    features = [(name, 'amenity', graph.nodes[node]['y'], graph.nodes[node]['x'])
+                for name, node in zip(names, nodes)]
+    path = str(tmp_path_factory.mktemp('snapshot'))
+    build_snapshot(graph, path, features=features)
+    return load_snapshot(path)
+
+
+def names(places):
+    return [place['display_name'] for place in places]
+
+
+def test_exact_then_prefix_then_word_matches(snapshot):
+    index = PlaceIndex(snapshot)
+    # the word match is shorter than the prefix match but still ranks below it
+    assert names(index.search('ratna park')) == ['Ratna Park', 'Ratna Park Bus Stop', 'Old Ratna Park']
+    assert names(index.search('Ratna  PA')) == ['Ratna Park', 'Ratna Park Bus Stop', 'Old Ratna Park']
+
+
+def test_typos_still_match(snapshot):
+    index = PlaceIndex(snapshot)
+    assert 'Ratna Park' in names(index.search('Ratna Prak'))
+    assert index.search('zzqx nowhere') == []
+
+
+def test_features_rank_above_streets(snapshot):
+    results = PlaceIndex(snapshot).search('himal', limit=10)
+    assert results[0]['display_name'] == 'Himal Bhagwati Mandir'
+    assert results[0]['type'] == 'amenity'
+    assert results[1:] and all(place['type'] == 'street' for place in results[1:])
+    assert all(place['node_id'] in snapshot.compiled for place in results)
+
+
+def test_geocoder_caches_answers():
+    session = StubSession()
+    geocoder = Geocoder(session=session)
+    first = geocoder.search('Somewhere')
+    # same normalized query, answered from the LRU
+    assert geocoder.search('  somewhere, ') == first
+    assert session.calls == 1
+    assert geocoder.stats()['hits'] == 1 and geocoder.stats()['size'] == 1
+
+
+def test_failed_lookups_are_not_cached():
+    session = StubSession(fail=True)
+    geocoder = Geocoder(session=session)
+    for _ in range(2):
+        with pytest.raises(requests.Timeout):
+            geocoder.search('Somewhere')
+    assert session.calls == 2
+    stats = geocoder.stats()
+    assert stats['errors'] == 2 and stats['size'] == 0 and stats['hits'] == 0
+
+
+@pytest.fixture
+def client(snapshot, monkeypatch):
+    # read when routes is first imported
+    os.environ.setdefault('SUPABASE_LOCAL', '1')
+    import app
+    import routes
+
+    monkeypatch.setattr(routes, 'get_snapshot', lambda: snapshot)
+    return app.app.test_client(), routes
+
+
+def test_search_place_answers_locally(client, monkeypatch):
+    client, routes = client
+    session = StubSession()
+    monkeypatch.setattr(routes, 'geocoder', Geocoder(session=session))
+    response = client.get('/search_place', query_string={'q': 'Ratna Park'})
+    assert response.status_code == 200
+    assert response.get_json()[0]['display_name'] == 'Ratna Park'
+    assert session.calls == 0
+
+
+def test_search_place_falls_back_to_the_geocoder(client, snapshot, monkeypatch):
+    client, routes = client
+    session = StubSession()
+    monkeypatch.setattr(routes, 'geocoder', Geocoder(session=session))
+    response = client.get('/search_place', query_string={'q': 'Zzqx Nowhere'})
+    assert response.status_code == 200
+    places = response.get_json()
+    assert names(places) == ['Zzqx Nowhere, Nepal'] and session.calls == 1
+    # snapped to the graph, the stub's place is in the middle of it
+    assert places[0]['node_id'] in snapshot.compiled
+
+
+def test_search_place_reports_a_failing_geocoder(client, monkeypatch):
+    client, routes = client
+    geocoder = Geocoder(session=StubSession(fail=True))
+    monkeypatch.setattr(routes, 'geocoder', geocoder)
+    for _ in range(2):
+        response = client.get('/search_place', query_string={'q': 'Zzqx Nowhere'})
+        assert response.status_code == 502
+    assert geocoder.stats()['errors'] == 2 and geocoder.stats()['size'] == 0
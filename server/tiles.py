@@ -0,0 +1,287 @@
+# tiles.py
+"""z/x/y web-mercator tiles of the road network.
+
+The snapshot carries a spatial index at TILE_ZOOM: every tile that has
+content lists the edge-table rows whose bounding box touches it and the
+nodes inside it. A tile at another zoom is read from that index, the
+index tiles under it for lower zooms, the one above it (filtered by
+bounding box) for higher ones. Two-way roads are listed once.
+
+Tiles come as GeoJSON or a compact binary buffer:
+
+- edges: uint32 edge count, uint32 point count, int64 u and v OSM ids per
+  edge, uint32 points per edge, then int32 (lat, lon) * 1e6 pairs
+- nodes: uint32 node count, uint32 0, int64 OSM ids, int32 (lat, lon) * 1e6
+
+Encoded tiles are kept in an LRU as EncodedBlobs, which hold the
+compressed variants and a content ETag, so a tile is only built once per
+process.
+"""
+import gzip
+import hashlib
+import json
+import math
+import os
+import struct
+import threading
+from functools import lru_cache
+
+import numpy as np
+from scipy.spatial import ConvexHull, QhullError
+
+from route_encoding import BINARY_SCALE
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# zoom the snapshot's tile index is built at, tiles are about 2.4 km there
+TILE_ZOOM = 14
+# lower zooms would be most of the city in one tile, /edges serves that
+MIN_TILE_ZOOM = 12
+MAX_TILE_ZOOM = 20
+LAYERS = ('edges', 'nodes')
+TILE_FORMATS = ('json', 'binary')
+TILE_CACHE_SIZE = int(os.environ.get("TILE_CACHE_SIZE", 1024))
+
+
+class EncodedBlob:
+    """Response bytes with their compressed variants and an ETag.
+
+    Compressed variants are made on first use and kept.
+    """
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding=None):
+        """The body for a Content-Encoding: None, 'gzip' or 'br'."""
+        if encoding is None:
+            return self.body
+        with self._lock:
+            if encoding not in self._encoded:
+                if encoding == 'br':
+                    self._encoded[encoding] = brotli.compress(self.body)
+                else:
+                    self._encoded[encoding] = gzip.compress(self.body, compresslevel=6, mtime=0)
+            return self._encoded[encoding]
+
+
+def tile_xy(lat, lon, zoom):
+    """Web-mercator tile (x, y) arrays of the tiles containing the points."""
+    n = 2 ** zoom
+    lat_rad = np.radians(np.clip(lat, -85.0511, 85.0511))
+    x = np.floor((np.asarray(lon) + 180.0) / 360.0 * n)
+    y = np.floor((1.0 - np.arcsinh(np.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+
+def tile_bounds(zoom, x, y):
+    """(south, west, north, east) of a tile in degrees."""
+    n = 2 ** zoom
+
+    def lat(y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+def tile_key(x, y):
+    return (x << 32) | y
+
+
+def edge_lines(arrays, rows):
+    """(points per row, lat, lon) of the edge-table rows' full polylines.
+
+    Rows without geometry are the straight line between their nodes.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    geom_offsets = arrays['geom_offsets']
+    starts, ends = geom_offsets[rows], geom_offsets[rows + 1]
+    has_geometry = ends > starts
+    counts = np.where(has_geometry, ends - starts, 2)
+    offsets = np.r_[0, np.cumsum(counts)].astype(np.int64)
+
+    # geometry points first, then the nodes, like flatten_polylines()
+    geom_points = len(arrays['geom_lat'])
+    positions = np.repeat(np.where(has_geometry, starts, 0) - offsets[:-1], counts) + np.arange(offsets[-1])
+    straight = np.flatnonzero(~has_geometry)
+    positions[offsets[straight]] = geom_points + arrays['edge_u'][rows[straight]]
+    positions[offsets[straight] + 1] = geom_points + arrays['edge_v'][rows[straight]]
+
+    lat = np.concatenate([arrays['geom_lat'], arrays['lat']])[positions]
+    lon = np.concatenate([arrays['geom_lon'], arrays['lon']])[positions]
+    return counts, lat, lon
+
+
+def edge_bounds(arrays, rows):
+    """(south, west, north, east) arrays of the rows' polyline bounding boxes."""
+    counts, lat, lon = edge_lines(arrays, rows)
+    if not len(counts):
+        empty = np.zeros(0)
+        return empty, empty, empty, empty
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    return (np.minimum.reduceat(lat, starts), np.minimum.reduceat(lon, starts),
+            np.maximum.reduceat(lat, starts), np.maximum.reduceat(lon, starts))
+
+
+def display_rows(arrays):
+    """Edge-table rows drawn on the map: two-way roads only in one direction."""
+    u, v = arrays['edge_u'], arrays['edge_v']
+    n = len(arrays['node_ids'])
+    has_reverse = np.isin(v * n + u, u * n + v)
+    return np.flatnonzero(~has_reverse | (u <= v))
+
+
+def tile_index_arrays(arrays):
+    """The snapshot's tile index at TILE_ZOOM, from the node and edge tables.
+
+    tile_keys are the sorted (x << 32 | y) keys of tiles with content;
+    tile i has edge rows tile_edges[tile_edge_offsets[i]:tile_edge_offsets[i + 1]]
+    and dense nodes tile_nodes[...] over tile_node_offsets the same way.
+    """
+    node_x, node_y = tile_xy(arrays['lat'], arrays['lon'], TILE_ZOOM)
+    node_keys = tile_key(node_x, node_y)
+
+    # an edge goes into every tile its bounding box touches, mostly one or two
+    rows = display_rows(arrays)
+    south, west, north, east = edge_bounds(arrays, rows)
+    x0, y0 = tile_xy(north, west, TILE_ZOOM)
+    x1, y1 = tile_xy(south, east, TILE_ZOOM)
+    width = x1 - x0 + 1
+    counts = width * (y1 - y0 + 1)
+    step = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    edge_keys = tile_key(np.repeat(x0, counts) + step % np.repeat(width, counts),
+                         np.repeat(y0, counts) + step // np.repeat(width, counts))
+    edge_rows = np.repeat(rows, counts)
+
+    keys = np.union1d(node_keys, edge_keys).astype(np.int64)
+    index = {}
+    for name, member_keys, members in (('edge', edge_keys, edge_rows),
+                                       ('node', node_keys, np.arange(len(node_keys), dtype=np.int64))):
+        order = np.lexsort((members, member_keys))
+        index[f'tile_{name}s'] = members[order].astype(np.int64)
+        index[f'tile_{name}_offsets'] = np.r_[np.searchsorted(member_keys[order], keys), len(order)].astype(np.int64)
+    index['tile_keys'] = keys
+    return index
+
+
+def boundary_hull(lat, lon):
+    """(k, 2) [lat, lon] convex hull of the nodes, as /map_boundary returns it."""
+    coords = np.column_stack([lon, lat])
+    try:
+        vertices = ConvexHull(coords).vertices
+    except (QhullError, ValueError):
+        # fewer than three distinct points, there is no area to outline
+        vertices = np.arange(len(coords))
+    return np.column_stack([coords[vertices, 1], coords[vertices, 0]]).astype(np.float64)
+
+
+def _index_tiles(arrays, zoom, x, y):
+    """Positions in tile_keys of the index tiles covering tile zoom/x/y."""
+    keys = arrays['tile_keys']
+    if zoom >= TILE_ZOOM:
+        shift = zoom - TILE_ZOOM
+        key = tile_key(x >> shift, y >> shift)
+        i = int(np.searchsorted(keys, key))
+        return [i] if i < len(keys) and keys[i] == key else []
+
+    shift = TILE_ZOOM - zoom
+    positions = []
+    for column in range(x << shift, (x + 1) << shift):
+        start = np.searchsorted(keys, tile_key(column, y << shift))
+        end = np.searchsorted(keys, tile_key(column, ((y + 1) << shift) - 1), side='right')
+        positions.extend(range(int(start), int(end)))
+    return positions
+
+
+def tile_members(snapshot, zoom, x, y):
+    """(edge-table rows, dense nodes) in tile zoom/x/y, both sorted."""
+    arrays = snapshot.arrays
+    positions = _index_tiles(arrays, zoom, x, y)
+    members = []
+    for name in ('edge', 'node'):
+        offsets, values = arrays[f'tile_{name}_offsets'], arrays[f'tile_{name}s']
+        parts = [values[offsets[i]:offsets[i + 1]] for i in positions]
+        members.append(np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64))
+    rows, nodes = members
+
+    if zoom > TILE_ZOOM:
+        # the index tile is bigger than this one, drop what lies outside
+        south, west, north, east = tile_bounds(zoom, x, y)
+        edge_south, edge_west, edge_north, edge_east = edge_bounds(arrays, rows)
+        rows = rows[(edge_north >= south) & (edge_south <= north) & (edge_east >= west) & (edge_west <= east)]
+        lat, lon = arrays['lat'][nodes], arrays['lon'][nodes]
+        nodes = nodes[(lat >= south) & (lat < north) & (lon >= west) & (lon < east)]
+    return rows, nodes
+
+
+def encode_tile(snapshot, layer, zoom, x, y, tile_format='json'):
+    """Body bytes of one tile layer in GeoJSON or the binary format."""
+    arrays = snapshot.arrays
+    rows, nodes = tile_members(snapshot, zoom, x, y)
+    node_ids = arrays['node_ids']
+
+    if layer == 'nodes':
+        lat, lon = arrays['lat'][nodes], arrays['lon'][nodes]
+        if tile_format == 'binary':
+            points = np.round(np.column_stack([lat, lon]) * BINARY_SCALE).astype('<i4')
+            return struct.pack('<II', len(nodes), 0) + node_ids[nodes].astype('<i8').tobytes() + points.tobytes()
+        features = [
+            {"type": "Feature", "id": node,
+             "geometry": {"type": "Point", "coordinates": [x_, y_]},
+             "properties": {"street_count": count}}
+            for node, y_, x_, count in zip(node_ids[nodes].tolist(), np.round(lat, 7).tolist(),
+                                           np.round(lon, 7).tolist(), arrays['street_count'][nodes].tolist())
+        ]
+        return json.dumps({"type": "FeatureCollection", "features": features}, separators=(',', ':')).encode()
+
+    counts, lat, lon = edge_lines(arrays, rows)
+    u, v = node_ids[arrays['edge_u'][rows]], node_ids[arrays['edge_v'][rows]]
+    if tile_format == 'binary':
+        points = np.round(np.column_stack([lat, lon]) * BINARY_SCALE).astype('<i4')
+        return (struct.pack('<II', len(rows), len(points)) + u.astype('<i8').tobytes() + v.astype('<i8').tobytes()
+                + counts.astype('<u4').tobytes() + points.tobytes())
+
+    coords = np.column_stack([np.round(lon, 7), np.round(lat, 7)]).tolist()
+    strings = snapshot.strings
+    features = []
+    start = 0
+    for row, a, b, count, name, highway, oneway, length in zip(
+            rows.tolist(), u.tolist(), v.tolist(), counts.tolist(), arrays['edge_name'][rows].tolist(),
+            arrays['edge_highway'][rows].tolist(), arrays['edge_oneway'][rows].tolist(),
+            arrays['edge_length'][rows].tolist()):
+        features.append({
+            "type": "Feature",
+            "id": row,
+            "geometry": {"type": "LineString", "coordinates": coords[start:start + count]},
+            "properties": {"u": a, "v": b, "name": strings[name] if name >= 0 else None,
+                           "highway": strings[highway] if highway >= 0 else None,
+                           "oneway": oneway, "length": length},
+        })
+        start += count
+    return json.dumps({"type": "FeatureCollection", "features": features}, separators=(',', ':')).encode()
+
+
+def decode_tile(layer, buffer):
+    """The arrays of a binary tile: (u, v, points per edge, (lat, lon)) or (ids, (lat, lon))."""
+    count, points = struct.unpack_from('<II', buffer)
+    if layer == 'nodes':
+        ids = np.frombuffer(buffer, dtype='<i8', count=count, offset=8)
+        coords = np.frombuffer(buffer, dtype='<i4', count=2 * count, offset=8 + 8 * count)
+        return ids, coords.reshape(-1, 2) / BINARY_SCALE
+    u = np.frombuffer(buffer, dtype='<i8', count=count, offset=8)
+    v = np.frombuffer(buffer, dtype='<i8', count=count, offset=8 + 8 * count)
+    counts = np.frombuffer(buffer, dtype='<u4', count=count, offset=8 + 16 * count)
+    coords = np.frombuffer(buffer, dtype='<i4', count=2 * points, offset=8 + 20 * count)
+    return u, v, counts, coords.reshape(-1, 2) / BINARY_SCALE
+
+
+@lru_cache(maxsize=TILE_CACHE_SIZE)
+def tile_blob(snapshot, layer, zoom, x, y, tile_format='json'):
+    """EncodedBlob of one tile, built on first use."""
+    return EncodedBlob(encode_tile(snapshot, layer, zoom, x, y, tile_format))
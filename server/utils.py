@@ -1,36 +1,93 @@
 # utils.py
 import math
+from functools import lru_cache
 
-def haversine(lat1, lon1, lat2, lon2):
-    """Calculate the great-circle distance between two GPS points using the Haversine formula."""
-    R = 6371  # Earth's radius in km
+import numpy as np
 
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
+R = 6371  # Earth's radius in km
 
-    a = math.sin(delta_phi / 2.0) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2.0) ** 2
+def haversine_rad(phi1, lambda1, cos_phi1, phi2, lambda2, cos_phi2):
+    """Scalar haversine on coordinates already in radians, with cos(latitude) precomputed."""
+    a = math.sin((phi2 - phi1) / 2.0) ** 2 + cos_phi1 * cos_phi2 * math.sin((lambda2 - lambda1) / 2.0) ** 2
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
     return R * c  # Distance in kilometers
 
-def heuristic(node1, node2, graph, obstacles):
-    """Haversine heuristic for GPS-based A* search, with obstacle penalty."""
-    lat1, lon1 = graph.nodes[node1]['y'], graph.nodes[node1]['x']
-    lat2, lon2 = graph.nodes[node2]['y'], graph.nodes[node2]['x']
-    
-    base_heuristic = haversine(lat1, lon1, lat2, lon2)
-    
-    # Add penalty for nearby obstacles
-    penalty = 0
+def haversine_many(lat1, lon1, lat2, lon2):
+    """Vectorized haversine over NumPy arrays of GPS points in degrees.
+
+    Arguments broadcast against each other, so one point can be compared
+    with many. Returns distances in kilometers.
+    """
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    lambda1, lambda2 = np.radians(lon1), np.radians(lon2)
+
+    a = np.sin((phi2 - phi1) / 2.0) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin((lambda2 - lambda1) / 2.0) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    return R * c  # Distance in kilometers
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Calculate the great-circle distance between two GPS points using the Haversine formula."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+
+    return haversine_rad(phi1, math.radians(lon1), math.cos(phi1),
+                         phi2, math.radians(lon2), math.cos(phi2))
+
+@lru_cache(maxsize=8)
+def obstacle_penalties(graph, obstacles):
+    """Heuristic penalty for every node within 100 meters of an obstacle.
+
+    Computed once per obstacle set (a frozenset of dense indices into a
+    CompiledGraph) with a KD-tree radius query instead of scanning every
+    obstacle on every heuristic call. Returns {node: penalty}; nodes that
+    are not near an obstacle have no entry. Do not mutate the result.
+    """
+    tree = graph.kdtree()
+
+    penalties = {}
     for obs in obstacles:
-        if obs not in graph.nodes:
-            continue  # Skip missing obstacle nodes
+        obs_lat, obs_lon = float(graph.lat[obs]), float(graph.lon[obs])
+        # the projection is approximate, so search a little wider and
+        # keep the exact haversine test below
+        point = graph.project(obs_lat, obs_lon)[0]
+        candidates = np.array(tree.query_ball_point(point, 101), dtype=np.int64)
+        distances = haversine_many(graph.lat[candidates], graph.lon[candidates], obs_lat, obs_lon)
+
+        for node, dist_to_obstacle in zip(candidates.tolist(), distances.tolist()):
+            # the obstacle itself is never expanded, skip the zero distance
+            if 0 < dist_to_obstacle < 0.1:  # If within 100 meters, add penalty
+                penalties[node] = penalties.get(node, 0) + 10 / dist_to_obstacle  # Higher penalty for closer obstacles
+
+    return penalties
+
+def heuristic(node1, node2, graph, penalties=None):
+    """Haversine distance in km between two dense nodes of a CompiledGraph.
+
+    penalties, from obstacle_penalties(), adds a per-node term for node1.
+    The route search passes none: under its average potential the same
+    term would land on both sides and cancel.
+    """
+    phi, lam, cos_phi = graph.lat_rad_list, graph.lon_rad_list, graph.cos_lat_list
+
+    base_heuristic = haversine_rad(phi[node1], lam[node1], cos_phi[node1],
+                                   phi[node2], lam[node2], cos_phi[node2])
+
+    if penalties:
+        return base_heuristic + penalties.get(node1, 0)
+    return base_heuristic
+
+def heuristic_many(nodes, node2, graph, penalties=None):
+    """Batch heuristic() for an array of dense node indices towards node2."""
+    nodes = np.asarray(nodes, dtype=np.int64)
 
-        obs_lat, obs_lon = graph.nodes[obs]['y'], graph.nodes[obs]['x']
-        dist_to_obstacle = haversine(lat1, lon1, obs_lat, obs_lon)
+    phi1, phi2 = graph.lat_rad[nodes], graph.lat_rad[node2]
+    lambda1, lambda2 = graph.lon_rad[nodes], graph.lon_rad[node2]
 
-        if dist_to_obstacle < 0.1:  # If within 100 meters, add penalty
-            penalty += 10 / dist_to_obstacle  # Higher penalty for closer obstacles
+    a = np.sin((phi2 - phi1) / 2.0) ** 2 + graph.cos_lat[nodes] * graph.cos_lat[node2] * np.sin((lambda2 - lambda1) / 2.0) ** 2
+    base_heuristic = R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
 
+    if not penalties:
+        return base_heuristic
+    penalty = np.array([penalties.get(node, 0) for node in nodes.tolist()], dtype=np.float64)
     return base_heuristic + penalty